@@ -1,144 +1,224 @@
 """Executes the trading strategies and analyzes the results.
 """
 
-from datetime import datetime
+import re
 
+import numpy
 import pandas
 from talib import abstract
 
+from metrics import timed
 
-def convert_to_dataframe(historical_data):
+
+# Patterns of the indicator strings accepted by `compute_indicator`
+INDICATOR_PATTERNS = {
+    'sma': re.compile(r'sma-(\d+)'),
+    'ema': re.compile(r'ema-(\d+)'),
+    'rsi': re.compile(r'rsi-(\d+)'),
+    'bollinger': re.compile(r'bollinger-(\d+)-(\d+)')
+}
+
+# Indicators can be computed over a coarser timeframe than the chart's by suffixing them with it, i.e. 'sma-9@1h'
+TIMEFRAME_PATTERN = re.compile(r'(.+)@(\d+[mhd])')
+
+# EMA and RSI are recursive, so every value depends on every earlier candle. After this many periods, the influence of
+# earlier candles is below float64 precision, so computing them over a window of history gives the full history's values
+CONVERGENCE_PERIODS = 40
+
+
+@timed('convert_to_dataframe')
+def convert_to_dataframe(historical_data, copy=True):
     """Converts historical data matrix to a pandas dataframe.
 
+    The conversion is done in bulk: the matrix is viewed as a float64 array and the timestamp column is converted
+    to a UTC DatetimeIndex in a single call, so no Python code runs per candle.
+
     Args:
-        historical_data (list): A matrix of historical OHCLV data.
+        historical_data (list | numpy.ndarray): A matrix of historical candles in the Coinbase Pro format, where each
+            row is [time, low, high, open, close, volume] and time is in epoch seconds.
+        copy (bool): Defaults to True. Whether the OHLCV columns are copied. Otherwise they are views over the matrix
+            (i.e., a read-only memory map), which should be column-major for each column to be contiguous.
 
     Returns:
-        pandas.DataFrame: Contains the historical data in a pandas dataframe.
+        pandas.DataFrame: Contains the historical OHLCV data in float64 columns, indexed by a UTC DatetimeIndex.
     """
 
-    dataframe = pandas.DataFrame(historical_data)
-    dataframe.transpose()
-
-    dataframe = pandas.DataFrame(historical_data)
-    dataframe.transpose()
-    dataframe.columns = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
-    dataframe['datetime'] = dataframe.timestamp.apply(
-        lambda x: pandas.to_datetime(datetime.fromtimestamp(x).strftime('%c'))
-    )
+    candles = numpy.asarray(historical_data, dtype=numpy.float64).reshape(-1, 6)
 
-    dataframe.set_index('datetime', inplace=True, drop=True)
-    dataframe.drop('timestamp', axis=1, inplace=True)
+    index = pandas.DatetimeIndex(pandas.to_datetime(candles[:, 0], unit='s', utc=True), name='datetime')
+    columns = {'open': candles[:, 3], 'high': candles[:, 2], 'low': candles[:, 1],
+               'close': candles[:, 4], 'volume': candles[:, 5]}
 
-    return dataframe
+    return pandas.DataFrame(columns, index=index, copy=copy)
 
 
-def analyze_macd(historial_data):
-    """Performs a macd analysis on the historical data
+def convert_to_candles(dataframe):
+    """Converts an OHLCV dataframe back to a matrix of candles. This is the inverse of `convert_to_dataframe`.
 
     Args:
-        historial_data (list): A matrix of historical OHCLV data.
+        dataframe (pandas.DataFrame): A dataframe of OHLCV data indexed by a DatetimeIndex.
+
     Returns:
-        pandas.DataFrame: The original OHCLV dataframe with an appended column corresponding to the MACD
-          indicator values for each timestamp
+        numpy.ndarray: A matrix of candles in the Coinbase Pro format, where each row is
+            [time, low, high, open, close, volume] and time is in epoch seconds.
     """
 
-    if type(historial_data) != pandas.core.frame.DataFrame:
-        historial_data = convert_to_dataframe(historial_data)
-    return abstract.MACD(historial_data).iloc[:, 0]
+    times = dataframe.index.to_numpy(dtype='datetime64[ns]').astype(numpy.int64) / 1e9
+    return numpy.column_stack([times, dataframe[['low', 'high', 'open', 'close', 'volume']].to_numpy(
+        dtype=numpy.float64)])
 
 
-def analyze_rsi(historial_data, period_count=14):
-    """Performs an RSI analysis on the historical data
+def split_timeframe(indicator):
+    """Splits the timeframe suffix off an indicator string such as 'sma-9@1h'
 
     Args:
-        historial_data (list): A matrix of historical OHCLV data.
-        period_count (int, optional): Defaults to 14. The number of data points to consider for
-            our simple moving average.
+        indicator (str): The indicator string.
     Returns:
-        pandas.DataFrame: The original OHCLV dataframe with an appended column corresponding to the RSI
-          indicator values for each timestamp
+        tuple[str, int]: The indicator string without its suffix and the timeframe in seconds, or None if the indicator
+          is computed over the chart's own candles
     """
+    from util import period_to_integer
+
+    match = TIMEFRAME_PATTERN.fullmatch(indicator)
+    if match is None:
+        return indicator, None
+
+    return match.group(1), period_to_integer(match.group(2))
+
 
-    indicator_name = 'rsi-{}'.format(period_count)
+def parse_indicator(indicator):
+    """Parses an indicator string such as 'sma-9', 'bollinger-21-2' or 'ema-21@4h'
 
-    if type(historial_data) != pandas.core.frame.DataFrame:
-        historial_data = convert_to_dataframe(historial_data)
+    Args:
+        indicator (str): The indicator string.
+    Returns:
+        tuple[str, tuple[int]]: The kind of the indicator and its integer parameters, or None if the string is not a
+          supported indicator
+    """
 
-    rsi_values = abstract.RSI(historial_data, period_count)
-    if indicator_name in historial_data:
-        historial_data.drop(indicator_name, 1, inplace=True)
+    indicator = split_timeframe(indicator)[0]
+    for kind, pattern in INDICATOR_PATTERNS.items():
+        match = pattern.fullmatch(indicator)
+        if match:
+            return kind, tuple(int(param) for param in match.groups())
 
-    combined_data = pandas.concat([historial_data, rsi_values], axis=1)
-    combined_data.rename(columns={0: indicator_name}, inplace=True)
-    return combined_data
+    return None
 
 
-def analyze_sma(historial_data, period_count=15):
-    """Performs a SMA analysis on the historical data
+def warmup_period(indicator, exact=True, granularity=None):
+    """Computes how many candles before a given candle an indicator needs to have a value at that candle
 
     Args:
-        historial_data (list): A matrix of historical OHCLV data.
-        period_count (int, optional): Defaults to 15. The number of data points to consider for
-            our simple moving average.
+        indicator (str): The indicator string, i.e. 'sma-9', 'ema-15', 'rsi-14', 'bollinger-21-2' or 'sma-9@1h'.
+        exact (bool): Defaults to True. Whether the value must be the one computed over the full history. Otherwise,
+          recursive indicators (EMA and RSI) only need enough candles to be seeded
+        granularity (int): Defaults to None. The interval of time (in seconds) of the chart's candles, which is needed
+          to count the candles of indicators with a coarser timeframe
     Returns:
-        pandas.DataFrame: The original OHCLV dataframe with an appended column corresponding to the SMA
-          indicator values for each timestamp
+        int: The number of preceding candles needed, or 0 if the indicator is not supported
     """
 
-    indicator_name = 'sma-{}'.format(period_count)
+    parsed = parse_indicator(indicator)
+    if parsed is None:
+        return 0
 
-    if type(historial_data) != pandas.core.frame.DataFrame:
-        historial_data = convert_to_dataframe(historial_data)
+    kind, params = parsed
 
-    sma_values = abstract.SMA(historial_data, period_count)
-    if indicator_name in historial_data:
-        historial_data.drop(indicator_name, 1, inplace=True)
+    if kind in ('ema', 'rsi') and exact:
+        periods = CONVERGENCE_PERIODS * params[0]
+    elif kind == 'rsi':
+        # RSI needs one more candle than its period, since it is computed over the changes between candles
+        periods = params[0]
+    else:
+        # Moving windows only look at the last `period` candles
+        periods = params[0] - 1
 
-    combined_data = pandas.concat([historial_data, sma_values], axis=1)
-    combined_data.rename(columns={0: indicator_name}, inplace=True)
-    return combined_data
+    timeframe = split_timeframe(indicator)[1]
+    if timeframe is None or not granularity:
+        return periods
 
+    # The candle a value is read at may be the first of a coarse candle, which only closes a whole timeframe later
+    return (periods + 1) * timeframe // granularity
 
-def analyze_ema(historial_data, period_count=15):
-    """Performs an EMA analysis on the historical data
+
+def compute_indicator(historial_data, indicator):
+    """Computes the values of a single indicator without modifying the historical data
 
     Args:
-        historial_data (list): A matrix of historical OHCLV data.
-        period_count (int, optional): Defaults to 15. The number of data points to consider for
-            our exponential moving average.
+        historial_data (pandas.DataFrame): A dataframe of historical OHCLV data.
+        indicator (str): The indicator string, i.e. 'sma-9', 'ema-15', 'rsi-14', 'bollinger-21-2' or 'sma-9@1h'.
     Returns:
-        pandas.DataFrame: The original OHCLV dataframe with an appended column corresponding to the EMA
-          indicator values for each timestamp
+        dict[str, numpy.ndarray]: A mapping of each column the indicator produces to its values. Bollinger bands
+          produce their middle band under the indicator name and the outer bands with an '-upper'/'-lower' suffix
     """
 
-    indicator_name = 'ema-{}'.format(period_count)
+    parsed = parse_indicator(indicator)
+    if parsed is None:
+        return {}
+
+    base_indicator, timeframe = split_timeframe(indicator)
+    if timeframe is not None:
+        return _compute_coarse_indicator(historial_data, base_indicator, indicator, timeframe)
+
+    kind, params = parsed
+
+    if kind == 'sma':
+        return {indicator: numpy.asarray(abstract.SMA(historial_data, params[0]), dtype=numpy.float64)}
+
+    if kind == 'ema':
+        return {indicator: numpy.asarray(abstract.EMA(historial_data, params[0]), dtype=numpy.float64)}
+
+    if kind == 'rsi':
+        return {indicator: numpy.asarray(abstract.RSI(historial_data, params[0]), dtype=numpy.float64)}
+
+    period, std_dev = params
+    bands = abstract.BBANDS(historial_data, timeperiod=period, nbdevup=std_dev, nbdevdn=std_dev)
+
+    return {'{}-upper'.format(indicator): numpy.asarray(bands['upperband'], dtype=numpy.float64),
+            indicator: numpy.asarray(bands['middleband'], dtype=numpy.float64),
+            '{}-lower'.format(indicator): numpy.asarray(bands['lowerband'], dtype=numpy.float64)}
+
+
+def _compute_coarse_indicator(historial_data, base_indicator, indicator, timeframe):
+    """Computes an indicator over candles resampled to a coarser timeframe, and maps its values back to the chart's
+    candles. Each candle gets the value of the last coarse candle that had closed by the time the candle closed, so no
+    candle sees data from after it
+    """
+    from resample import resample_candles
+
+    if not isinstance(historial_data.index, pandas.DatetimeIndex):
+        raise ValueError('Indicators over a timeframe need historical data indexed by time')
+
+    candles = convert_to_candles(historial_data)
+    times = candles[:, 0]
+    granularity = int(numpy.diff(times).min()) if len(times) > 1 else timeframe
+    if timeframe % granularity != 0:
+        raise ValueError('The timeframe of {} is not a multiple of the candle granularity'.format(indicator))
 
-    if type(historial_data) != pandas.core.frame.DataFrame:
-        historial_data = convert_to_dataframe(historial_data)
+    coarse = resample_candles(candles, timeframe)
+    values = compute_indicator(convert_to_dataframe(coarse), base_indicator)
 
-    ema_values = abstract.EMA(historial_data, period_count)
-    if indicator_name in historial_data:
-        historial_data.drop(indicator_name, 1, inplace=True)
+    closed = numpy.searchsorted(coarse[:, 0] + timeframe, times + granularity, side='right') - 1
+    missing = closed < 0
+    closed[missing] = 0
 
-    combined_data = pandas.concat([historial_data, ema_values], axis=1)
-    combined_data.rename(columns={0: indicator_name}, inplace=True)
-    return combined_data
+    return {column.replace(base_indicator, indicator, 1): numpy.where(missing, numpy.nan, column_values[closed])
+            for column, column_values in values.items()}
 
 
-def analyze_bollinger_bands(historial_data, period_count=21):
-    """Performs a bollinger band analysis on the historical data
+def fingerprint(historial_data):
+    """Computes a fingerprint of a dataframe's OHLCV data, so that computations over identical data can be shared
 
     Args:
-        historial_data (list): A matrix of historical OHCLV data.
-        period_count (int, optional): Defaults to 21. The number of data points to consider for
-            our bollinger bands
+        historial_data (pandas.DataFrame): A dataframe of historical OHCLV data.
     Returns:
-        pandas.DataFrame: The original OHCLV dataframe with 3 appended columns corresponding to the Bollinger Band
-          indicator values for each timestamp
+        str: A hex digest that changes whenever any timestamp or OHLCV value changes
     """
+    import hashlib
 
-    if type(historial_data) != pandas.core.frame.DataFrame:
-        historial_data = convert_to_dataframe(historial_data)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(historial_data.index.to_numpy(dtype='datetime64[ns]').tobytes())
+    digest.update(numpy.ascontiguousarray(historial_data[['open', 'high', 'low', 'close', 'volume']].to_numpy(
+        dtype=numpy.float64)).tobytes())
 
-    return abstract.BBANDS(historial_data, period_count)
+    return digest.hexdigest()
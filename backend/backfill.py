@@ -0,0 +1,134 @@
+"""
+Contains a paginated, concurrent backfill of historical candles over arbitrarily long time ranges
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+from util import epoch_to_iso
+
+
+class RateLimitError(Exception):
+    """
+    Raised when the exchange keeps rejecting a request for exceeding its rate limit after every retry
+    """
+    pass
+
+
+class RateLimiter(object):
+    """
+    A thread-safe token bucket limiting how many requests are issued per second
+
+    Args:
+        requests_per_second (float): The sustained number of requests allowed per second
+        burst (int): Defaults to 1. The number of requests that may be issued back to back
+    """
+    def __init__(self, requests_per_second, burst=1):
+        self.interval = 1.0 / requests_per_second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a request may be issued
+        """
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) / self.interval)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) * self.interval
+
+            time.sleep(wait)
+
+
+def split_pages(start, end, interval, page_size=300):
+    """
+    Splits the time range [start, end) into consecutive ranges that each hold at most one page of candles
+
+    Args:
+        start (int): The start of the time range in epoch seconds
+        end (int): The end of the time range in epoch seconds
+        interval (int): The interval of time (in seconds) between successive candles
+        page_size (int): Defaults to 300. The maximum number of candles the exchange returns per request
+    Returns:
+        list[tuple[int, int]]: A list of [start, end) time ranges covering the input range
+    """
+
+    step = interval * page_size
+    return [(page_start, min(page_start + step, end)) for page_start in range(int(start), int(end), step)]
+
+
+def backfill(client, coin_pair, interval, start, end, page_size=300, max_workers=4, rate_limiter=None, max_retries=5,
+             backoff=0.5):
+    """
+    Fetches every candle in the time range [start, end) by splitting it into API sized pages that are requested
+    concurrently. Requests rejected by the exchange's rate limit are retried with exponential backoff
+
+    Args:
+        client (object): A client with the `cbpro.PublicClient` interface
+        coin_pair (str): The coin pair to fetch data for
+        interval (int): The interval of time (in seconds) between successive candles
+        start (int): The start of the time range in epoch seconds
+        end (int): The end of the time range in epoch seconds
+        page_size (int): Defaults to 300. The maximum number of candles the exchange returns per request
+        max_workers (int): Defaults to 4. The maximum number of pages fetched at the same time
+        rate_limiter (RateLimiter): Defaults to None. A limiter shared by every request to the exchange
+        max_retries (int): Defaults to 5. The number of times a rate limited or failed request is retried
+        backoff (float): Defaults to 0.5. The number of seconds to wait before the first retry, doubled on each retry
+    Returns:
+        numpy.ndarray: A matrix with one candle per row, deduplicated and in ascending order of time
+    """
+
+    def fetch_page(page):
+        page_start, page_end = page
+
+        for attempt in range(max_retries + 1):
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+
+            try:
+                # The exchange treats the end of the range as inclusive
+                candles = client.get_product_historic_rates(coin_pair, start=epoch_to_iso(page_start),
+                                                            end=epoch_to_iso(page_end - interval), granularity=interval)
+            except OSError:
+                if attempt == max_retries:
+                    raise
+                candles = None
+
+            # Errors are reported as a message rather than raised by the client
+            if isinstance(candles, dict):
+                message = candles.get('message', '')
+                if 'rate limit' not in message.lower():
+                    raise ValueError(message or 'Unable to fetch historical data for {}'.format(coin_pair))
+                if attempt == max_retries:
+                    raise RateLimitError(message)
+                candles = None
+
+            if candles is not None:
+                return numpy.asarray(candles, dtype=float).reshape(-1, 6)
+
+            time.sleep(backoff * 2 ** attempt)
+
+    pages = split_pages(start, end, interval, page_size)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetched = list(executor.map(fetch_page, pages))
+
+    candles = numpy.concatenate(fetched) if fetched else numpy.empty((0, 6))
+    candles = candles[(candles[:, 0] >= start) & (candles[:, 0] < end)]
+
+    # Pages can overlap at their boundaries, so keep a single candle per timestamp
+    _, first = numpy.unique(candles[:, 0], return_index=True)
+    return candles[first]
@@ -0,0 +1,234 @@
+"""
+Contains helpers that run complete backtests: fetching candles, adding indicators and simulating trades, for one or
+many coin pairs
+"""
+
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import logger
+from analysis import fingerprint
+from chart import Chart, warmup_candles
+from decision import strategy_hash
+from exchange import MAX_CANDLES_PER_REQUEST
+
+
+# Part of every result cache key, and bumped whenever the results of a backtest change, so that results pickled to disk
+# by an older version are never served
+RESULT_VERSION = 2
+
+
+def backtest_pair(exchange, coin_pair, interval, start_time, capital, indicators, buy_strategy, sell_strategy,
+                  trading_fee=0.003, stop_loss=0, progress=None):
+    """
+    Runs a backtest for a single coin pair. Only the candles from the start time onwards, plus the warm-up the
+    indicators need, are backtested, and positions are only opened from the start time
+
+    Args:
+        exchange (Exchange): The exchange historical data is fetched from
+        coin_pair (str): The coin pair to trade, separated by a '-'
+        interval (int): The interval of time (in seconds) between successive candles
+        start_time (int): The time (in epoch seconds) from which the results are reported
+        capital (float): The starting capital of the quote currency
+        indicators (list[str]): The indicators to add to the chart
+        buy_strategy (dict[str, -]): The parsed buy strategy
+        sell_strategy (dict[str, -]): The parsed sell strategy
+        trading_fee (float): Defaults to 0.003. The trading fee per market order
+        stop_loss (float): Defaults to 0. The fraction below our buy price at which to sell an open position
+        progress (Callable[[int, int], None]): Defaults to None. Called with the number of candles backtested so far
+          and the total number of candles
+    Returns:
+        Chart: The chart after running the backtest
+    """
+
+    ohlcv_matrix = fetch_history(exchange, coin_pair, interval, start_time, indicators)
+    chart = Chart(coin_pair, ohlcv_matrix, indicators, granularity=interval, start_time=start_time)
+    chart.run_backtest(capital, buy_strategy, sell_strategy, trading_fee=trading_fee, stop_loss=stop_loss,
+                       progress=progress)
+
+    return chart
+
+
+def fetch_history(exchange, coin_pair, interval, start_time, indicators=()):
+    """
+    Fetches the candles a backtest runs over: at least the most recent page of candles, extending further back when
+    the start time (less the warm-up of the indicators) is earlier
+
+    Args:
+        exchange (Exchange): The exchange historical data is fetched from
+        coin_pair (str): The coin pair to fetch, separated by a '-'
+        interval (int): The interval of time (in seconds) between successive candles
+        start_time (int): The time (in epoch seconds) from which the results are reported
+        indicators (list[str]): Defaults to (). The indicators that will be added to the chart
+    Returns:
+        pandas.DataFrame: The OHLCV data
+    """
+
+    window_start = start_time - warmup_candles(indicators, interval) * interval
+    history_start = min(window_start, (int(time.time()) // interval - MAX_CANDLES_PER_REQUEST) * interval)
+    return exchange.get_historical_data(coin_pair, interval=interval, start=history_start)
+
+
+def backtest_key(ohlcv_matrix, coin_pair, interval, start_time, capital, indicators, buy_strategy, sell_strategy,
+                 trading_fee=0.003, stop_loss=0):
+    """
+    Computes the key a backtest result is cached under: a hash of the normalized request together with a fingerprint
+    of the candles it runs over, so newly fetched candles never serve a stale result
+
+    Returns:
+        str: The hexadecimal key
+    """
+
+    request = {'version': RESULT_VERSION, 'pair': coin_pair, 'interval': int(interval), 'start_time': int(start_time),
+               'capital': float(capital), 'indicators': list(indicators), 'buy': strategy_hash(buy_strategy),
+               'sell': strategy_hash(sell_strategy), 'trading_fee': float(trading_fee),
+               'stop_loss': float(stop_loss)}
+
+    digest = hashlib.sha1(json.dumps(request, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+    digest.update(fingerprint(ohlcv_matrix).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def memoized_backtest(exchange, results, coin_pair, interval, start_time, capital, indicators, buy_strategy,
+                      sell_strategy, trading_fee=0.003, stop_loss=0, progress=None):
+    """
+    Runs a backtest for a single coin pair like `backtest_pair`, but serves identical requests over the same candles
+    from a result cache. Identical requests arriving while the backtest is still running wait for its result, and one
+    of them runs the backtest again if the request running it is cancelled
+
+    Args:
+        exchange (Exchange): The exchange historical data is fetched from
+        results (ResultCache): The cache backtest results are kept in
+        progress (Callable[[int, int], None]): Defaults to None. Called with the number of candles backtested so far
+          and the total number of candles, whether this request runs the backtest or waits on an identical one. It may
+          raise to stop this request only. Not called when the result is cached
+        (The remaining arguments are those of `backtest_pair`)
+    Returns:
+        tuple[pandas.DataFrame, dict[str, -], dict[str, -]]: The chart data from the start time onwards after running
+          the backtest, its position report and its performance summary (see `performance.summarize`)
+    """
+
+    ohlcv_matrix = fetch_history(exchange, coin_pair, interval, start_time, indicators)
+    key = backtest_key(ohlcv_matrix, coin_pair, interval, start_time, capital, indicators, buy_strategy, sell_strategy,
+                       trading_fee=trading_fee, stop_loss=stop_loss)
+
+    # The cache relays the progress of a shared backtest to every request waiting on it, so the backtest only reports
+    # to the callback the cache hands it rather than to this request's own
+    def compute(report_progress):
+        chart = Chart(coin_pair, ohlcv_matrix, indicators, granularity=interval, start_time=start_time)
+        chart.run_backtest(capital, buy_strategy, sell_strategy, trading_fee=trading_fee, stop_loss=stop_loss,
+                           progress=report_progress)
+        return chart.get_data(), chart.position_report(), chart.performance_report()
+
+    return results.get_or_compute(key, compute, progress)
+
+
+def walk_forward_pair(exchange, coin_pair, interval, start_time, capital, indicators, buy_strategy, sell_strategy,
+                      train_size, test_size, step=None, anchored=False, trading_fee=0.003, stop_loss=0,
+                      max_workers=None, progress=None):
+    """
+    Runs a walk-forward analysis for a single coin pair over the candles from the start time onwards (see
+    `Chart.walk_forward`)
+
+    Args:
+        train_size (int): The number of candles in each train window
+        test_size (int): The number of candles in each test window
+        step (int): Defaults to None. The number of candles between the starts of successive windows, the test size
+          by default
+        anchored (bool): Defaults to False. Whether every train window starts at the start time
+        max_workers (int): Defaults to None. The number of worker processes, one per core by default
+        progress (Callable[[int, int], None]): Defaults to None. Called with the number of windows evaluated so far and
+          the total number of windows
+        (The remaining arguments are those of `backtest_pair`)
+    Returns:
+        list[dict[str, -]]: The train and test performance of every window
+    """
+
+    ohlcv_matrix = fetch_history(exchange, coin_pair, interval, start_time, indicators)
+    chart = Chart(coin_pair, ohlcv_matrix, indicators, granularity=interval, start_time=start_time)
+
+    return chart.walk_forward(capital, buy_strategy, sell_strategy, train_size, test_size, step=step, anchored=anchored,
+                              trading_fee=trading_fee, stop_loss=stop_loss, max_workers=max_workers, progress=progress)
+
+
+def run_batch(exchange, coin_pairs, interval, start_time, capital, indicators, buy_strategy, sell_strategy,
+              trading_fee=0.003, stop_loss=0, max_workers=8):
+    """
+    Runs the same backtest over many coin pairs in parallel, yielding each pair's result as soon as it is done and
+    finally a summary over every pair. Each pair's candles are fetched once, through the exchange's candle store when
+    it has one
+
+    Args:
+        exchange (Exchange): The exchange historical data is fetched from
+        coin_pairs (list[str]): The coin pairs to trade, separated by a '-'
+        interval (int): The interval of time (in seconds) between successive candles
+        start_time (int): The time (in epoch seconds) from which the results are reported
+        capital (float): The starting capital of the quote currency
+        indicators (list[str]): The indicators to add to each chart
+        buy_strategy (dict[str, -]): The parsed buy strategy
+        sell_strategy (dict[str, -]): The parsed sell strategy
+        trading_fee (float): Defaults to 0.003. The trading fee per market order
+        stop_loss (float): Defaults to 0. The fraction below our buy price at which to sell an open position
+        max_workers (int): Defaults to 8. The number of pairs backtested at the same time
+    Returns:
+        Iterator[tuple[str, dict[str, -]]]: ('pair', result) tuples in order of completion, where each result holds the
+          pair's 'summary', 'data' and 'positions' (or an 'error' message), followed by a single ('summary', summary) tuple
+    """
+
+    def run(coin_pair):
+        # Logging every trade of every pair would only bury the results
+        with logger.suppressed():
+            chart = backtest_pair(exchange, coin_pair, interval, start_time, capital, indicators, buy_strategy,
+                                  sell_strategy, trading_fee=trading_fee, stop_loss=stop_loss)
+        data = chart.get_data(start_time=start_time)
+
+        return {'pair': coin_pair, 'summary': chart.performance_report(start_time=start_time), 'data': data,
+                'positions': chart.position_report(start_time=start_time)}
+
+    summaries = {}
+    failures = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run, coin_pair): coin_pair for coin_pair in coin_pairs}
+
+        for future in as_completed(futures):
+            coin_pair = futures[future]
+
+            try:
+                result = future.result()
+            except Exception as e:
+                failures[coin_pair] = str(e)
+                yield 'pair', {'pair': coin_pair, 'error': str(e)}
+                continue
+
+            summaries[coin_pair] = result['summary']
+            yield 'pair', result
+
+    yield 'summary', aggregate_summaries(summaries, failures)
+
+
+def aggregate_summaries(summaries, failures=None):
+    """
+    Aggregates the summaries of many backtests
+
+    Args:
+        summaries (dict[str, dict[str, -]]): A mapping of each coin pair to its backtest summary
+        failures (dict[str, str]): Defaults to None. A mapping of each coin pair that failed to its error message
+    Returns:
+        dict[str, -]: The number of pairs, the total and mean profit, the best and worst pair and the failed pairs
+    """
+
+    failures = failures or {}
+    aggregate = {'pairs': len(summaries) + len(failures), 'succeeded': len(summaries), 'failed': sorted(failures)}
+
+    if summaries:
+        profits = {pair: summary['profit'] for pair, summary in summaries.items()}
+        aggregate.update({'total_profit': sum(profits.values()),
+                          'mean_profit': sum(profits.values()) / len(profits),
+                          'best_pair': max(profits, key=profits.get),
+                          'worst_pair': min(profits, key=profits.get),
+                          'profitable_pairs': sum(profit > 0 for profit in profits.values())})
+
+    return aggregate
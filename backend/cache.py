@@ -0,0 +1,279 @@
+"""
+Contains caches shared by every request handled by the process
+"""
+
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+
+
+# The number of seconds between progress reports to callers waiting on another caller's computation
+WAITER_PROGRESS_INTERVAL = 0.5
+
+# Resolves a shared computation whose owner gave up on it, so that a waiting caller retries as the new owner
+_RETRY = object()
+
+
+class LRUCache(object):
+    """
+    A thread-safe least-recently-used cache bounded by the total size of its values. Once the budget is exceeded, the
+    least recently used entries are evicted until the cache fits again. Entries can optionally expire after a fixed
+    amount of time
+
+    Args:
+        max_bytes (int): The total size (in bytes) of the values the cache may hold
+        sizeof (Callable[[-], int]): A function returning the size (in bytes) of a cached value
+        ttl (float): Defaults to None. The number of seconds after which an entry expires. Entries never expire if None
+    """
+    def __init__(self, max_bytes, sizeof, ttl=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Retrieves a cached value and marks it as the most recently used
+
+        Args:
+            key (hashable): The key the value was cached under
+        Returns:
+            -: The cached value, or None if the key is not cached
+        """
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self.size -= self.entries.pop(key)[1]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Caches a value, evicting the least recently used entries if the cache grows over its budget. Values larger than
+        the whole budget are not cached
+
+        Args:
+            key (hashable): The key to cache the value under
+            value (-): The value to cache
+        """
+
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+
+            expires = None if self.ttl is None else time.monotonic() + self.ttl
+            self.entries[key] = (value, size, expires)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def get_or_compute(self, key, compute):
+        """
+        Retrieves a cached value, computing and caching it first if it is missing
+
+        Args:
+            key (hashable): The key the value is cached under
+            compute (Callable[[], -]): A function computing the value
+        Returns:
+            -: The cached or freshly computed value
+        """
+
+        value = self.get(key)
+
+        if value is None:
+            value = compute()
+            self.put(key, value)
+
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class ResultCache(object):
+    """
+    A cache of expensive results (i.e., finished backtests) with an in-memory LRU tier, an optional on-disk tier and
+    request coalescing: concurrent lookups of the same missing key share a single computation instead of each running it
+
+    Args:
+        max_bytes (int): The total size (in bytes) of the results held in memory
+        sizeof (Callable[[-], int]): A function returning the size (in bytes) of a result
+        ttl (float): Defaults to 300. The number of seconds a result is served for, in memory and on disk
+        directory (str): Defaults to None. A directory results are also pickled to, so they survive evictions and
+          restarts. Results are only kept in memory if None
+    """
+    def __init__(self, max_bytes, sizeof, ttl=300, directory=None):
+        self.memory = LRUCache(max_bytes, sizeof, ttl=ttl)
+        self.ttl = ttl
+        self.directory = directory
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get_or_compute(self, key, compute, progress=None):
+        """
+        Retrieves a cached result, computing it first if it is missing. If the same key is already being computed,
+        waits for that computation instead of starting another one
+
+        Only failures of the computation itself are shared with the callers waiting on it. When the caller running it
+        gives up (i.e., its progress callback raises because its job was cancelled), one of the waiting callers starts
+        the computation over instead
+
+        Args:
+            key (str): The key the result is cached under. Must be usable as a file name
+            compute (Callable[[Callable[[int, int], None]], -]): A function computing the result, called with a progress
+              callback it should call periodically with the number of units processed so far and the total number
+            progress (Callable[[int, int], None]): Defaults to None. Called with the progress of the computation,
+              whether this caller runs it or waits on it. It may raise to stop waiting. Not called when the result is
+              cached
+        Returns:
+            -: The cached or freshly computed result
+        """
+
+        while True:
+            value = self.memory.get(key)
+            if value is not None:
+                return value
+
+            with self.lock:
+                computation = self.in_flight.get(key)
+                owner = computation is None
+
+                if owner:
+                    computation = _Computation()
+                    self.in_flight[key] = computation
+
+            if owner:
+                return self.__compute(key, compute, computation, progress)
+
+            value = computation.wait(progress)
+            if value is not _RETRY:
+                return value
+
+    def __compute(self, key, compute, computation, progress):
+        abandoned = []
+
+        def report(processed, total):
+            computation.report(processed, total)
+
+            if progress is not None:
+                try:
+                    progress(processed, total)
+                except BaseException:
+                    abandoned.append(True)
+                    raise
+
+        try:
+            value = self.__load(key)
+            if value is None:
+                value = compute(report)
+                self.__store(key, value)
+
+            self.memory.put(key, value)
+
+        except Exception as e:
+            # Errors raised by this caller's own progress callback are not the computation's to share
+            self.__finish(key, computation, _RETRY if abandoned else None, None if abandoned else e)
+            raise
+
+        except BaseException:
+            self.__finish(key, computation, _RETRY)
+            raise
+
+        self.__finish(key, computation, value)
+        return value
+
+    def __finish(self, key, computation, value, error=None):
+        # The computation is no longer in flight by the time waiters wake up, so a retrying waiter starts a new one
+        with self.lock:
+            del self.in_flight[key]
+
+        if error is not None:
+            computation.future.set_exception(error)
+        else:
+            computation.future.set_result(value)
+
+    def __path(self, key):
+        return os.path.join(self.directory, '{}.pickle'.format(key))
+
+    def __load(self, key):
+        if self.directory is None:
+            return None
+
+        path = self.__path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+
+            with open(path, 'rb') as result_file:
+                return pickle.load(result_file)
+
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def __store(self, key, value):
+        if self.directory is None:
+            return
+
+        # Write to a temporary file first so concurrent readers never load a partially written result
+        path = self.__path(key)
+        with open(path + '.tmp', 'wb') as result_file:
+            pickle.dump(value, result_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+
+class _Computation(object):
+    """
+    A computation shared by every caller of `ResultCache.get_or_compute` with the same key, along with its progress
+    """
+    def __init__(self):
+        self.future = Future()
+        self.processed = None
+        self.total = None
+
+    def report(self, processed, total):
+        self.processed, self.total = processed, total
+
+    def wait(self, progress=None):
+        """
+        Blocks until the computation finishes, relaying its progress to the waiting caller's own callback. The callback
+        runs on the waiting caller's thread, so whatever it raises only stops this caller from waiting
+        """
+
+        reported = None
+
+        while True:
+            try:
+                return self.future.result(timeout=WAITER_PROGRESS_INTERVAL if progress is not None else None)
+            except TimeoutError:
+                current = (self.processed, self.total)
+                if current[1] is not None and current != reported:
+                    progress(*current)
+                    reported = current
@@ -1,18 +1,81 @@
+import os
+
+import numpy
+import pandas
+
 import analysis
-from trade import Trade
-from decision import Decision
-from util import epoch_to_str
+import metrics
+import performance
+from ledger import TradeLedger
+from cache import LRUCache
+from decision import Decision, compile_strategy, evaluate_strategy
+from workers import map_shared, shared_matrix
+
+
+def _indicator_size(columns):
+    return sum(values.nbytes for values in columns.values())
+
+
+# Indicator values keyed by (pair, granularity, data fingerprint, indicator), shared by every chart in the process
+INDICATOR_CACHE = LRUCache(max_bytes=int(os.environ.get('INDICATOR_CACHE_BYTES', 256 * 1024 * 1024)),
+                           sizeof=_indicator_size)
+
+# The number of candles between progress reports of the row-by-row backtesting engine
+PROGRESS_INTERVAL = 1000
+
+# The precision chart values are stored in by default. 'float32' halves the memory of a chart at the cost of precision
+PRECISION = os.environ.get('CHART_PRECISION', 'float64')
+
+# How much history before the start time windowed charts keep for their indicators: 'minimal' keeps just enough for
+# every indicator to have a value at the start time, while 'exact' keeps enough for EMA and RSI values to match those
+# computed over the full history (see `analysis.warmup_period`)
+WINDOW_WARMUP = os.environ.get('WINDOW_WARMUP', 'minimal')
+
+# The columns every chart ends with, which hold the results of its last backtest
+RESULT_COLUMNS = ('buy', 'sell', 'profit')
+
+
+def warmup_candles(indicators, granularity=None):
+    """
+    Computes how many candles before the start time a windowed chart needs for its indicators
+
+    Args:
+        indicators (list[str]): The indicators of the chart
+        granularity (int): Defaults to None. The interval of time (in seconds) between successive candles of the chart
+    Returns:
+        int: The largest warm-up of any of the indicators
+    """
+
+    return max([analysis.warmup_period(indicator, exact=WINDOW_WARMUP == 'exact', granularity=granularity)
+                for indicator in indicators] + [0])
 
 
 class Chart(object):
     """
     A Chart class encompassing functionality for a set of historical data in a time-series domain. Contains functionality
     for backtesting various strategies over historical data
+
+    Values are stored as a single contiguous block of floats, with missing values (i.e., indicators warming up) kept
+    as NaN; they are only mapped to null when serialized
+
+    When a start time is given, the chart is windowed: only the candles from the start time onwards, plus the warm-up
+    its indicators need before it, are kept, and backtests only trade from the start time
     """
-    def __init__(self, coin_pair, ohlcv_matrix, indicators):
+    def __init__(self, coin_pair, ohlcv_matrix, indicators, granularity=None, precision=None, start_time=None):
 
         self.pair = coin_pair
+        self.granularity = granularity
+        self.dtype = numpy.dtype(precision or PRECISION)
+        self.start_time = start_time
         self.data = ohlcv_matrix
+        self.ledger = None
+        self.equity = None
+        self.capital = None
+        self.trading_fee = 0
+
+        if start_time is not None:
+            first = ohlcv_matrix.index.searchsorted(pandas.Timestamp(start_time, unit='s', tz='UTC'))
+            self.data = ohlcv_matrix.iloc[max(0, first - warmup_candles(indicators, granularity)):]
 
         # Append the indicators to our OHLCV matrix
         self.__add_indicators(indicators)
@@ -20,7 +83,7 @@ class Chart(object):
     def get_data(self, start_time=None):
         """
         Retrieve all OHLCV data from the chart. If a start time is specified, then we return data only
-        from that time onward. By default we return all data
+        from that time onward. By default we return all data, or only the data from the start time of a windowed chart
 
         Args:
             start_time (int): Defaults to None. Otherwise is an integer denoting the starting time in epoch seconds
@@ -28,46 +91,91 @@ class Chart(object):
         Returns:
             list[Candlestick]: A list of candlestick objects
         """
+        start_time = start_time or self.start_time
+
         if start_time:
-            return self.data.loc[epoch_to_str(start_time):]
+            return self.data.loc[pandas.Timestamp(start_time, unit='s', tz='UTC'):]
 
         return self.data
 
+    def position_report(self, start_time=None):
+        """
+        Reports the positions of the last backtest that were still open at, or opened after, the start time
+
+        Args:
+            start_time (int): Defaults to None. Otherwise is an integer denoting the time in epoch seconds from which
+                positions are reported
+        Returns:
+            dict[str, -]: The position report, as described by `TradeLedger.position_report`
+        """
+
+        start_time = start_time or self.start_time
+
+        times = self.data.index.to_numpy(dtype='datetime64[ns]').astype(numpy.int64) // 10 ** 9
+        start = times.searchsorted(start_time) if start_time else 0
+
+        return self.ledger.position_report(times, start)
+
+    def performance_report(self, start_time=None):
+        """
+        Summarizes the performance of the last backtest from the start time onwards
+
+        Args:
+            start_time (int): Defaults to None. Otherwise is an integer denoting the time in epoch seconds from which
+                the backtest is summarized
+        Returns:
+            dict[str, -]: The summary, as described by `performance.summarize`
+        """
+
+        start_time = start_time or self.start_time
+        start = self.data.index.searchsorted(pandas.Timestamp(start_time, unit='s', tz='UTC')) if start_time else 0
+
+        return performance.summarize(self.equity, self.ledger, self.capital, self.trading_fee, self.granularity, start)
+
+    @metrics.timed('add_indicators')
     def __add_indicators(self, indicators):
         """
-        Updates the OHLCV dataframe with the indicators specified in the input list
+        Updates the OHLCV dataframe with the indicators specified in the input list. Indicator values are shared with
+        other charts over the same data through the process-wide indicator cache. The OHLCV and indicator values are
+        copied once into a single preallocated block of the chart's precision, which backs the whole dataframe along
+        with the buy, sell and profit columns that backtests write their results into
 
         Args:
             indicators (list[str]): A list of strings where each string is a JSON representation of an indicator
         """
-        import re
 
-        for indicator in indicators:
+        metrics.count('indicators', len(indicators))
+        data_fingerprint = analysis.fingerprint(self.data)
 
-            # Simple Moving Averages
-            if re.fullmatch('sma-\d+', indicator):
-                period = int(indicator[indicator.find('-') + 1:])
-                self.data = analysis.analyze_sma(self.data, period_count=period)
+        columns = {}
+        for indicator in indicators:
+            key = (self.pair, self.granularity, data_fingerprint, indicator)
+            columns.update(INDICATOR_CACHE.get_or_compute(key, lambda: analysis.compute_indicator(self.data, indicator)))
 
-            # Exponential Moving Averages
-            if re.fullmatch('ema-\d+', indicator):
-                period = int(indicator[indicator.find('-') + 1:])
-                self.data = analysis.analyze_ema(self.data, period_count=period)
+        # Indicators (and backtest results) that were already part of the data are replaced rather than duplicated
+        existing = [name for name in list(columns) + list(RESULT_COLUMNS) if name in self.data.columns]
+        base = self.data.drop(columns=existing) if existing else self.data
 
-            # RSIs
-            if re.fullmatch('rsi-\d+', indicator):
-                period = int(indicator[indicator.find('-') + 1:])
-                self.data = analysis.analyze_rsi(self.data, period_count=period)
+        # A column-major block is laid out the way pandas stores its columns, so the dataframe wraps it without a copy.
+        # Its last column holds the profit, and the buy and sell columns share a boolean block of their own
+        block = numpy.empty((len(base), len(base.columns) + len(columns) + 1), dtype=self.dtype, order='F')
+        block[:, :len(base.columns)] = base.to_numpy(dtype=self.dtype, na_value=numpy.nan)
+        for position, values in enumerate(columns.values(), start=len(base.columns)):
+            block[:, position] = values
+        block[:, -1] = 0
 
-            # Bollinger Bands
-            if re.fullmatch('bollinger-\d+-\d+', indicator):
-                period, std_dev = [int(m) for m in re.findall('\d+', indicator)]
+        self.__signals = numpy.zeros((len(base), 2), dtype=bool, order='F')
+        self.__profit = block[:, -1]
 
-                self.data = analysis.analyze_bollinger_bands(self.data, period_count=period)
+        names = list(base.columns) + list(columns)
+        frame = {name: block[:, position] for position, name in enumerate(names)}
+        frame.update(buy=self.__signals[:, 0], sell=self.__signals[:, 1], profit=self.__profit)
 
-        self.data = self.data.where(self.data.notnull(), None)
+        self.data = pandas.DataFrame(frame, index=base.index, copy=False)
 
-    def run_backtest(self, capital, buy_strategy, sell_strategy, trading_fee=0, stop_loss=0):
+    @metrics.timed('run_backtest')
+    def run_backtest(self, capital, buy_strategy, sell_strategy, trading_fee=0, stop_loss=0, vectorized=True,
+                     progress=None):
         """
         Runs our backtesting strategy on the set of candlestick data
 
@@ -78,23 +186,154 @@ class Chart(object):
             sell_strategy (dict[-, -]): A dictionary containing a sell strategy as specified by the parser documentation
             trading_fee (float | 0): The trading fee per market order. Defaults to 0
             stop_loss (float | 0): The amount of quote currency below our buy point at which to sell an open position
+            vectorized (bool | True): Whether to evaluate the strategies over whole columns at once. When False, the
+              original row-by-row engine is used instead. Both engines produce identical buy, sell and profit columns.
+              The profit column holds the equity of the backtest at every candle (see `performance.equity_curve`) less
+              the starting capital
+            progress (Callable[[int, int], None] | None): Defaults to None. Called periodically with the number of
+              candles processed so far and the total number of candles. It may raise to abort the backtest
         Returns:
             dict[str, -]: A dictionary mapping data to a dictionary representation of the dataframe and the profit to the
               resulting profit from the backtest
         """
 
-        reserve = capital
-        trade: Trade = None
+        metrics.count('candles', len(self.data))
+        self.capital = capital
+        self.trading_fee = trading_fee
+
+        if not vectorized:
+            return self.__run_iterative_backtest(capital, buy_strategy, sell_strategy, trading_fee, stop_loss, progress)
 
-        # First append a buy, sell and profit column to our dataframe (with default value False)
-        self.data.insert(len(self.data.columns), 'buy', False)
-        self.data.insert(len(self.data.columns), 'sell', False)
+        num_candles = len(self.data)
+        close, columns = self.__strategy_columns()
 
-        # Add the profit column (with default value 0)
-        self.data.insert(len(self.data.columns), 'profit', 0)
+        # Evaluate both strategies over every candle at once; only the position walk is sequential. Windowed charts
+        # only open positions from their start time
+        buy_points = numpy.flatnonzero(evaluate_strategy(buy_strategy, columns, num_candles))
+        buy_points = buy_points[buy_points.searchsorted(self.__start_position()):]
+        sell_points = numpy.flatnonzero(evaluate_strategy(sell_strategy, columns, num_candles))
+
+        # The results are written straight into the columns preallocated for them, so the dataframe is not copied
+        self.ledger = TradeLedger(self.pair)
+        self.__signals[:] = False
+        _simulate(close, buy_points, sell_points, capital, self.ledger, trading_fee, stop_loss, progress,
+                  buy=self.__signals[:, 0], sell=self.__signals[:, 1])
+        self.equity = performance.equity_curve(close, self.ledger, capital)
+        self.__profit[:] = self.equity - capital
+        metrics.count('trades', int(self.__signals[:, 0].sum()))
+
+        if progress:
+            progress(num_candles, num_candles)
+
+    def walk_forward(self, capital, buy_strategy, sell_strategy, train_size, test_size, step=None, anchored=False,
+                     trading_fee=0, stop_loss=0, max_workers=None, progress=None):
+        """
+        Runs a walk-forward analysis: the strategies are backtested over a series of consecutive train and test windows
+        rolling over the chart. Indicators and strategy signals are computed once over the whole chart and every window
+        is evaluated over slices of them, so windows only differ in where positions are opened and closed
+
+        Windows start once every indicator the strategies reference has warmed up (TA-Lib leaves the first values of an
+        indicator undefined). Later windows need no warm-up of their own, since their indicator values are computed from
+        all the candles before them. Windows are evaluated on a pool of worker processes (see `workers.map_shared`)
+
+        Args:
+            capital (float): The starting capital of the quote currency, in every window
+            buy_strategy (dict[-, -]): A dictionary containing a buy strategy as specified by the parser documentation
+            sell_strategy (dict[-, -]): A dictionary containing a sell strategy as specified by the parser documentation
+            train_size (int): The number of candles in each train window
+            test_size (int): The number of candles in each test window, which directly follows its train window
+            step (int | None): Defaults to None. The number of candles between the starts of successive windows. Defaults
+              to the test size, so that the test windows cover the chart without overlapping
+            anchored (bool | False): Whether every train window starts at the first warmed-up candle (and grows with each
+              window) rather than rolling forward
+            trading_fee (float | 0): The trading fee per market order. Defaults to 0
+            stop_loss (float | 0): The amount of quote currency below our buy point at which to sell an open position
+            max_workers (int | None): The number of worker processes, one per core by default
+            progress (Callable[[int, int], None] | None): Defaults to None. Called with the number of windows evaluated
+              so far and the total number of windows. It may raise to abort the analysis
+        Returns:
+            list[dict[str, -]]: One dictionary per window with the window's 'index' and the 'start' and 'end' (the
+              opening times in epoch seconds of its first and last candle) and performance summary (see
+              `performance.summarize`) of both its 'train' and 'test' windows
+        """
+        step = step or test_size
+        if train_size < 1 or test_size < 1 or step < 1:
+            raise ValueError('The train size, test size and step must be positive numbers of candles')
+
+        close, columns = self.__strategy_columns()
+        times = self.data.index.to_numpy(dtype='datetime64[ns]').astype(numpy.int64) // 10 ** 9
+
+        buy_rule = compile_strategy(buy_strategy)
+        sell_rule = compile_strategy(sell_strategy)
+
+        missing = (buy_rule.indicators | sell_rule.indicators) - set(columns)
+        if missing:
+            raise ValueError('The strategies reference indicators the chart does not have: {}'.format(
+                ', '.join(sorted(missing))))
+
+        # Skip the candles before the start time of a windowed chart, and those at which any referenced indicator is
+        # still undefined
+        warm_up = self.__start_position()
+        for indicator in buy_rule.indicators | sell_rule.indicators:
+            defined = numpy.flatnonzero(~numpy.isnan(columns[indicator]))
+            warm_up = max(warm_up, defined[0] if len(defined) else len(close))
+
+        windows = []
+        for index, start in enumerate(range(warm_up, len(close) - train_size - test_size + 1, step)):
+            windows.append((self.pair, self.granularity, capital, trading_fee, stop_loss, index,
+                            warm_up if anchored else start, start + train_size, start + train_size + test_size))
+
+        # Signals are computed once here, and shared with the workers along with the times and closing prices
+        shared = numpy.column_stack([times, close, buy_rule(columns), sell_rule(columns)])
+        return map_shared(_evaluate_window, windows, shared, max_workers, progress)
+
+    def __start_position(self):
+        """
+        Returns:
+            int: The position of the first candle positions may be opened at
+        """
+
+        if self.start_time is None:
+            return 0
+
+        return self.data.index.searchsorted(pandas.Timestamp(self.start_time, unit='s', tz='UTC'))
+
+    def __strategy_columns(self):
+        """
+        Returns:
+            tuple[numpy.ndarray, dict[str, numpy.ndarray]]: The closing prices, and a mapping of 'currentprice' and each
+              indicator to its values, as evaluated by compiled strategies
+        """
+
+        close = self.data['close'].to_numpy(dtype=float)
+
+        # All the indicator fields are placed after the 5 columns of OHLCV data (and before the backtest results)
+        indicators = [name for name in self.data.columns[5:] if name not in RESULT_COLUMNS]
+        columns = {ind: self.data[ind].to_numpy(dtype=float, na_value=numpy.nan) for ind in indicators}
+        columns['currentprice'] = close
+
+        return close, columns
+
+    def __run_iterative_backtest(self, capital, buy_strategy, sell_strategy, trading_fee=0, stop_loss=0, progress=None):
+        """
+        Runs our backtesting strategy on the set of candlestick data one row at a time. See `run_backtest` for
+        a description of the arguments
+        """
+
+        self.ledger = TradeLedger(self.pair)
+        reserve = capital
+        amount_base = None
+        start = self.__start_position()
+
+        # Start from empty buy and sell columns. The profit column is filled in from the ledger once every candle has
+        # been processed
+        buy, sell = self.__signals[:, 0], self.__signals[:, 1]
+        self.__signals[:] = False
 
         # Run our strategy on each data point in the matrix
-        for date_index, row in self.data.iterrows():
+        for position, (_, row) in enumerate(self.data.iterrows()):
+            if progress and position % PROGRESS_INTERVAL == 0:
+                progress(position, len(self.data))
 
             current_price = row['close']
 
@@ -103,19 +342,136 @@ class Chart(object):
             decision = Decision({'currentprice': current_price, **indicator_datum})
 
             # Check to see if we can open a position
-            if not trade and decision.should_execute(buy_strategy):
-                self.data.loc[date_index, 'buy'] = True
-                trade = Trade(self.pair, current_price, reserve * (1 - trading_fee))
+            if amount_base is None and position >= start and decision.should_execute(buy_strategy):
+                buy[position] = True
+                amount_base = self.ledger.open(position, current_price, reserve, trading_fee)
+                entry_price = current_price
                 reserve = 0
 
             # Check to see if we can sell our position or if we hit a stop loss
-            elif trade:
+            elif amount_base is not None:
+
+                if decision.should_execute(sell_strategy):
+                    reason = TradeLedger.SIGNAL
+                elif stop_loss and current_price < entry_price * (1 - stop_loss):
+                    reason = TradeLedger.STOP_LOSS
+                else:
+                    continue
+
+                sell[position] = True
+                reserve = self.ledger.close(position, current_price, trading_fee, reason)
+                amount_base = None
+
+        self.equity = performance.equity_curve(self.data['close'].to_numpy(dtype=float), self.ledger, capital)
+        self.__profit[:] = self.equity - capital
+        metrics.count('trades', int(buy.sum()))
+
+        if progress:
+            progress(len(self.data), len(self.data))
+
+
+def backtest_signals(pair, close, buy_signals, sell_signals, capital, trading_fee=0, stop_loss=0, granularity=None):
+    """
+    Backtests precomputed strategy signals without building a chart, i.e. for the many runs of a parameter sweep over
+    the same candles
+
+    Args:
+        pair (str): The coin pair being traded
+        close (numpy.ndarray): The closing price of every candle
+        buy_signals (numpy.ndarray): Whether the buy strategy executes at each candle
+        sell_signals (numpy.ndarray): Whether the sell strategy executes at each candle
+        capital (float): The starting capital of the quote currency
+        trading_fee (float): Defaults to 0. The trading fee per market order
+        stop_loss (float): Defaults to 0. The fraction below our buy price at which to sell an open position
+        granularity (int): Defaults to None. The interval of time (in seconds) between successive candles
+    Returns:
+        dict[str, -]: The performance summary of the backtest (see `performance.summarize`)
+    """
+
+    ledger = TradeLedger(pair)
+    _simulate(close, numpy.flatnonzero(buy_signals), numpy.flatnonzero(sell_signals), capital, ledger, trading_fee,
+              stop_loss)
+    equity = performance.equity_curve(close, ledger, capital)
+
+    return performance.summarize(equity, ledger, capital, trading_fee, granularity)
+
+
+def _evaluate_window(window):
+    pair, granularity, capital, trading_fee, stop_loss, index, train_start, train_end, test_end = window
+    shared, _ = shared_matrix()
+
+    def evaluate(start, end):
+        times, close, buy_signals, sell_signals = (shared[start:end, column] for column in range(4))
+        return {'start': int(times[0]), 'end': int(times[-1]),
+                **backtest_signals(pair, close, buy_signals > 0, sell_signals > 0, capital, trading_fee, stop_loss,
+                                   granularity)}
+
+    return {'index': index, 'train': evaluate(train_start, train_end), 'test': evaluate(train_end, test_end)}
+
+
+def _simulate(close, buy_points, sell_points, capital, ledger, trading_fee=0, stop_loss=0, progress=None, buy=None,
+              sell=None):
+    """
+    Walks through the positions opened at buy signals and closed at sell signals (or stop losses), jumping straight from
+    one signal to the next. Every position is recorded in the ledger
+
+    Args:
+        close (numpy.ndarray): The closing price of every candle
+        buy_points (numpy.ndarray): The sorted positions of the candles with a buy signal
+        sell_points (numpy.ndarray): The sorted positions of the candles with a sell signal
+        capital (float): The starting capital of the quote currency
+        ledger (TradeLedger): The ledger positions are recorded in
+        trading_fee (float): Defaults to 0. The trading fee per market order
+        stop_loss (float): Defaults to 0. The fraction below our buy price at which to sell an open position
+        progress (Callable[[int, int], None]): Defaults to None. Called with the number of candles processed so far and
+          the total number of candles
+        buy (numpy.ndarray): Defaults to None. A boolean column (i.e., a chart's) to mark the buys in, which should be
+          all False. A new one is allocated if None
+        sell (numpy.ndarray): Defaults to None. A boolean column to mark the sells in, like `buy`
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: The buy and sell columns
+    """
+
+    num_candles = len(close)
+    buy = numpy.zeros(num_candles, dtype=bool) if buy is None else buy
+    sell = numpy.zeros(num_candles, dtype=bool) if sell is None else sell
+
+    reserve = capital
+    index = 0
+
+    while index < num_candles:
+        if progress:
+            progress(index, num_candles)
+
+        # Jump straight to the next candle at which we can open a position
+        next_buy = buy_points.searchsorted(index)
+        if next_buy == len(buy_points):
+            break
+
+        entry = buy_points[next_buy]
+        buy[entry] = True
+        entry_price = close[entry]
+        amount_base = ledger.open(entry, entry_price, reserve, trading_fee)
+        reserve = 0
+
+        # The position is held until the next sell signal after our entry, or the end of the data
+        next_sell = sell_points.searchsorted(entry + 1)
+        exit_index = sell_points[next_sell] if next_sell < len(sell_points) else num_candles
+        reason = TradeLedger.SIGNAL
+
+        # A stop loss can only close the position earlier than the sell signal would
+        if stop_loss:
+            held = close[entry + 1:exit_index + 1]
+            stopped = numpy.flatnonzero(held < entry_price * (1 - stop_loss))
+            if len(stopped) and entry + 1 + stopped[0] < exit_index:
+                exit_index = entry + 1 + stopped[0]
+                reason = TradeLedger.STOP_LOSS
+
+        if exit_index == num_candles:
+            break
 
-                profit = current_price * trade.amount_base - capital
-                self.data.loc[date_index, 'profit'] = profit
+        sell[exit_index] = True
+        reserve = ledger.close(exit_index, close[exit_index], trading_fee, reason)
+        index = exit_index + 1
 
-                if decision.should_execute(sell_strategy) or (stop_loss and current_price < trade.entry_price * (1 - stop_loss)):
-                    self.data.loc[date_index, 'sell'] = True
-                    reserve = current_price * trade.amount_base * (1 - trading_fee)
-                    trade.close(current_price)
-                    trade = None
+    return buy, sell
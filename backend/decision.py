@@ -1,4 +1,11 @@
 
+import operator
+
+import numpy
+
+from cache import LRUCache
+
+
 """
 Decision encapsulates a boolean process that determines when to open and close a trade
 """
@@ -13,7 +20,7 @@ class Decision(object):
             return self.indicators['currentprice']
 
         # TODO(jbartola): Add support for bollinger bands and macd
-        return self.indicators['{}-{}'.format(indicator['kind'], indicator['period'])]
+        return self.indicators[_indicator_key(indicator)]
 
     def should_execute(self, strategy):
         """
@@ -39,6 +46,9 @@ class Decision(object):
         if strategy['kind'] == 'Not':
             return not self.should_execute(strategy['e'])
 
+        if strategy['kind'] == 'Const':
+            return strategy['val']
+
         # Indicator evaluations
         lv = self.get_indicator_value(strategy['l'])
         rv = self.get_indicator_value(strategy['r'])
@@ -58,7 +68,297 @@ class Decision(object):
         if strategy['kind'] == 'GT':
             return lv > rv
 
-        if strategy['kind'] == 'GEQ':
+        # The dashboard's parser emits 'GEq', while older clients sent 'GEQ'
+        if strategy['kind'] in ('GEq', 'GEQ'):
             return lv >= rv
 
         return False
+
+
+def evaluate_strategy(strategy, columns, num_candles):
+    """
+    Evaluates a strategy over entire columns of indicator data at once. This mirrors `Decision.should_execute`,
+    where a missing (NaN) indicator value makes its comparison False. The strategy is compiled once (see
+    `compile_strategy`), so evaluating it again skips compilation
+
+    Args:
+        strategy (dict[str, -]): A parsed Expression object containing the conditions for a buy/sell strategy
+        columns (dict[str, numpy.ndarray]): A mapping of 'currentprice' and each indicator to its column of values
+        num_candles (int): The number of candles the columns span
+    Returns:
+        numpy.ndarray: A boolean array that is True at every candle where the strategy should be executed
+    """
+
+    return numpy.broadcast_to(compile_strategy(strategy)(columns), num_candles)
+
+
+# Vectorized counterparts of the comparisons supported by `Decision.should_execute`
+COMPARATORS = {
+    'Eq': numpy.equal,
+    'LT': numpy.less,
+    'LEq': numpy.less_equal,
+    'GT': numpy.greater,
+    'GEq': numpy.greater_equal,
+    'GEQ': numpy.greater_equal
+}
+
+# Compiled strategies keyed by their canonical hash. The least recently used entry is evicted once the cache is full.
+# Strategies are compiled from request, job and batch threads alike, so the cache is shared through a thread-safe LRU
+MAX_COMPILED_STRATEGIES = 1024
+_compiled_strategies = LRUCache(MAX_COMPILED_STRATEGIES, lambda evaluator: 1)
+
+
+def strategy_hash(strategy):
+    """
+    Computes a canonical hash of a parsed strategy, so that equivalent JSON documents (i.e., with differently
+    ordered keys) map to the same value
+
+    Args:
+        strategy (dict[str, -]): A parsed Expression object containing the conditions for a buy/sell strategy
+    Returns:
+        str: A hex digest uniquely identifying the strategy
+    """
+    import hashlib
+    import json
+
+    canonical = json.dumps(strategy, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+def compile_strategy(strategy):
+    """
+    Compiles a parsed strategy into a callable that evaluates it over entire columns of indicator data at once.
+    Compiled strategies are cached by their canonical hash, so re-running the same strategy skips compilation
+
+    The returned callable takes a mapping of 'currentprice' and each indicator name (i.e., 'sma-9') to a numpy
+    array and returns a boolean array that is True at every candle where the strategy should be executed. As in
+    `Decision.should_execute`, a missing (NaN) indicator value makes its comparison False
+
+    Args:
+        strategy (dict[str, -]): A parsed Expression object containing the conditions for a buy/sell strategy
+    Returns:
+        Callable[[dict[str, numpy.ndarray]], numpy.ndarray]: The compiled strategy
+    """
+
+    def compile():
+        # Subexpressions that appear more than once are evaluated once per call and shared
+        keys = _subexpression_keys(strategy)
+        repeated = _count_subexpressions(strategy, keys)
+        root = _compile_expression(strategy, keys, {key for key, count in repeated.items() if count > 1})
+
+        def evaluator(columns):
+            return root(columns, {})
+
+        evaluator.indicators = _referenced_indicators(strategy)
+        return evaluator
+
+    return _compiled_strategies.get_or_compute(strategy_hash(strategy), compile)
+
+
+def compile_event_strategy(strategy):
+    """
+    Compiles a parsed strategy into a callable that evaluates it for a single event, i.e. a new price in live trading.
+    Unlike `compile_strategy`, no arrays are involved, so an evaluation only costs a few function calls. Compiled
+    strategies are cached like those of `compile_strategy`
+
+    The returned callable takes a mapping of 'currentprice' and each indicator name to its current value, and returns
+    True iff the strategy should be executed. A missing (NaN) indicator value makes its comparison False
+
+    Args:
+        strategy (dict[str, -]): A parsed Expression object containing the conditions for a buy/sell strategy
+    Returns:
+        Callable[[dict[str, float]], bool]: The compiled strategy
+    """
+
+    def compile():
+        evaluator = _compile_event_expression(strategy)
+        evaluator.indicators = _referenced_indicators(strategy)
+        return evaluator
+
+    return _compiled_strategies.get_or_compute('event-' + strategy_hash(strategy), compile)
+
+
+# Scalar counterparts of COMPARATORS, used by `compile_event_strategy`
+EVENT_COMPARATORS = {
+    'Eq': operator.eq,
+    'LT': operator.lt,
+    'LEq': operator.le,
+    'GT': operator.gt,
+    'GEq': operator.ge,
+    'GEQ': operator.ge
+}
+
+
+def _indicator_key(indicator):
+    if indicator['kind'] in ('real', 'currentprice'):
+        return indicator['kind']
+
+    # Indicators over a coarser timeframe are columns of their own, i.e. 'sma-9@1h'
+    if indicator.get('timeframe'):
+        return '{}-{}@{}'.format(indicator['kind'], indicator['period'], indicator['timeframe'])
+
+    return '{}-{}'.format(indicator['kind'], indicator['period'])
+
+
+def _referenced_indicators(strategy):
+    if len(strategy) == 0:
+        return set()
+    if strategy['kind'] in ('And', 'Or'):
+        return _referenced_indicators(strategy['e1']) | _referenced_indicators(strategy['e2'])
+    if strategy['kind'] == 'Not':
+        return _referenced_indicators(strategy['e'])
+    if strategy['kind'] == 'Const':
+        return set()
+
+    return {_indicator_key(side) for side in (strategy['l'], strategy['r'])} - {'real', 'currentprice'}
+
+
+def _subexpression_keys(strategy):
+    """
+    Numbers every node of a strategy so that structurally identical subexpressions get the same number. Nodes are
+    numbered bottom-up from the numbers of their children, so numbering a strategy takes linear time
+
+    Returns:
+        dict[int, int]: A mapping of the id() of every node to its number, valid while the strategy is alive
+    """
+    import json
+
+    keys = {}
+    numbers = {}
+
+    def number(node):
+        if len(node) == 0:
+            signature = ()
+        elif node['kind'] in ('And', 'Or'):
+            signature = (node['kind'], number(node['e1']), number(node['e2']))
+        elif node['kind'] == 'Not':
+            signature = (node['kind'], number(node['e']))
+        else:
+            signature = (json.dumps(node, sort_keys=True),)
+
+        keys[id(node)] = numbers.setdefault(signature, len(numbers))
+        return keys[id(node)]
+
+    number(strategy)
+    return keys
+
+
+def _count_subexpressions(strategy, keys, counts=None):
+    counts = {} if counts is None else counts
+    if len(strategy) == 0:
+        return counts
+
+    key = keys[id(strategy)]
+    counts[key] = counts.get(key, 0) + 1
+
+    # The children of a repeated subexpression are only evaluated through it, so they are counted once
+    if counts[key] == 1:
+        for child in ('e1', 'e2', 'e'):
+            if child in strategy:
+                _count_subexpressions(strategy[child], keys, counts)
+
+    return counts
+
+
+def _compile_operand(indicator):
+    if indicator['kind'] == 'real':
+        value = float(indicator['val'])
+        return lambda columns: value
+
+    key = _indicator_key(indicator)
+    return lambda columns: columns[key]
+
+
+def _compile_expression(strategy, keys, shared=frozenset()):
+    if len(strategy) == 0:
+        return lambda columns, results: numpy.ones(len(columns['currentprice']), dtype=bool)
+
+    evaluate = _compile_node(strategy, keys, shared)
+
+    key = keys[id(strategy)]
+    if key not in shared:
+        return evaluate
+
+    def evaluate_shared(columns, results):
+        if key not in results:
+            results[key] = evaluate(columns, results)
+        return results[key]
+
+    return evaluate_shared
+
+
+def _compile_node(strategy, keys, shared):
+    kind = strategy['kind']
+
+    if kind in ('And', 'Or'):
+        e1 = _compile_expression(strategy['e1'], keys, shared)
+        e2 = _compile_expression(strategy['e2'], keys, shared)
+
+        if kind == 'And':
+            return lambda columns, results: numpy.logical_and(e1(columns, results), e2(columns, results))
+        return lambda columns, results: numpy.logical_or(e1(columns, results), e2(columns, results))
+
+    if kind == 'Not':
+        e = _compile_expression(strategy['e'], keys, shared)
+        return lambda columns, results: numpy.logical_not(e(columns, results))
+
+    if kind == 'Const':
+        value = bool(strategy['val'])
+        return lambda columns, results: numpy.full(len(columns['currentprice']), value)
+
+    comparator = COMPARATORS.get(kind)
+    lv = _compile_operand(strategy['l'])
+    rv = _compile_operand(strategy['r'])
+
+    def compare(columns, results):
+        num_candles = len(columns['currentprice'])
+        if comparator is None:
+            return numpy.zeros(num_candles, dtype=bool)
+
+        # Comparisons against NaN are always False, which matches the None checks in Decision
+        with numpy.errstate(invalid='ignore'):
+            return numpy.broadcast_to(comparator(lv(columns), rv(columns)), num_candles)
+
+    return compare
+
+
+def _compile_event_expression(strategy):
+    if len(strategy) == 0:
+        return lambda values: True
+
+    kind = strategy['kind']
+
+    if kind in ('And', 'Or'):
+        e1 = _compile_event_expression(strategy['e1'])
+        e2 = _compile_event_expression(strategy['e2'])
+
+        if kind == 'And':
+            return lambda values: e1(values) and e2(values)
+        return lambda values: e1(values) or e2(values)
+
+    if kind == 'Not':
+        e = _compile_event_expression(strategy['e'])
+        return lambda values: not e(values)
+
+    if kind == 'Const':
+        value = bool(strategy['val'])
+        return lambda values: value
+
+    comparator = EVENT_COMPARATORS.get(kind)
+    if comparator is None:
+        return lambda values: False
+
+    left, right = strategy['l'], strategy['r']
+
+    # Comparisons against a number are the most common, so the number is bound directly instead of looked up.
+    # Comparisons with NaN are False, like in the vectorized evaluation
+    if right['kind'] == 'real' and left['kind'] != 'real':
+        key, value = _indicator_key(left), float(right['val'])
+        return lambda values: comparator(values[key], value)
+    if left['kind'] == 'real' and right['kind'] != 'real':
+        key, value = _indicator_key(right), float(left['val'])
+        return lambda values: comparator(value, values[key])
+
+    lv = _compile_operand(left)
+    rv = _compile_operand(right)
+    return lambda values: bool(comparator(lv(values), rv(values)))
@@ -0,0 +1,46 @@
+"""
+Contains the downsampling of backtest results for display, so that charts of long backtests can be sent with a bounded
+number of points and refined by fetching zoomed-in time ranges at full resolution
+"""
+
+import numpy
+
+
+def downsample(data, max_points):
+    """
+    Selects the rows of a backtest's data that preserve the shape of its price series: the data is split into buckets
+    of consecutive candles, and the candles with the lowest low and the highest high of each bucket are kept, along with
+    the first and last candle. Every candle with a buy or sell marker is kept as well, so the result may have more rows
+    than `max_points` when there are many trades
+
+    Args:
+        data (pandas.DataFrame): The chart data after running a backtest
+        max_points (int): The number of rows to reduce the data to, apart from buy and sell markers
+    Returns:
+        pandas.DataFrame: The selected rows of the data, or the data itself when it has at most `max_points` rows
+    """
+
+    size = len(data)
+    if max_points is None or size <= max_points:
+        return data
+
+    buckets = max(1, max_points // 2 - 1)
+    bucket = numpy.arange(size) * buckets // size
+    starts = numpy.flatnonzero(numpy.diff(bucket, prepend=-1))
+
+    keep = numpy.zeros(size, dtype=bool)
+    keep[[0, -1]] = True
+
+    for column, extreme in (('low', numpy.minimum), ('high', numpy.maximum)):
+        values = data[column].to_numpy(dtype=numpy.float64)
+        hits = numpy.flatnonzero(values == extreme.reduceat(values, starts)[bucket])
+
+        # Only the first candle reaching the extreme of its bucket is kept, so flat stretches do not add rows
+        _, first = numpy.unique(bucket[hits], return_index=True)
+        keep[hits[first]] = True
+
+    for marker in ('buy', 'sell'):
+        if marker in data.columns:
+            keep |= data[marker].to_numpy(dtype=numpy.float64, na_value=0) > 0
+
+    return data.iloc[numpy.flatnonzero(keep)]
@@ -1,29 +1,170 @@
+import threading
+import time
+
 import cbpro
 
 from analysis import convert_to_dataframe
+from backfill import RateLimiter, backfill
+from metrics import timed
+
+
+# The maximum number of candles the exchange returns for a single historical data request
+MAX_CANDLES_PER_REQUEST = 300
+
+# Public endpoints allow 3 requests per second, so a handful of workers is enough to saturate the limit
+PUBLIC_REQUESTS_PER_SECOND = 3
+MAX_CONCURRENT_REQUESTS = 4
+
+# Private endpoints (i.e., placing and polling orders) allow 5 requests per second, with bursts of up to 10
+PRIVATE_REQUESTS_PER_SECOND = 5
+PRIVATE_REQUEST_BURST = 10
+
+# The maximum number of (coin pair, granularity) series resampled from the base granularity that are kept in memory
+MAX_RESAMPLED_SERIES = 1024
 
 
 class Exchange(object):
-    def __init__(self, api_key=None, api_secret=None, password=None):
-        if api_key and api_secret and password:
+    """
+    The Exchange class wraps a Coinbase Pro client. Historical data is served from a local candle store when one is
+    given, so only the time ranges that have not been fetched before are requested from the exchange
+
+    Args:
+        api_key (str): Defaults to None. The API key used for authenticated requests
+        api_secret (str): Defaults to None. The API secret used for authenticated requests
+        password (str): Defaults to None. The API passphrase used for authenticated requests
+        client (object): Defaults to None. A client with the `cbpro.PublicClient` interface (i.e. a `LocalClient`) to
+          use instead of connecting to Coinbase Pro
+        store (CandleStore): Defaults to None. A store that historical candles are cached in
+        base_granularity (int): Defaults to None. The granularity (in seconds) of the candles that coarser granularities
+          are derived from. Only the base candles are fetched and stored then, and each coarser series is resampled
+          from them and extended as new base candles arrive. Requires a store
+    """
+    def __init__(self, api_key=None, api_secret=None, password=None, client=None, store=None, base_granularity=None):
+        self.store = store
+        self.base_granularity = base_granularity if store is not None else None
+        self.rate_limiter = RateLimiter(PUBLIC_REQUESTS_PER_SECOND)
+
+        self.resampled = {}
+        self.resampled_lock = threading.Lock()
+
+        if client is not None:
+            self.client = client
+        elif api_key and api_secret and password:
             self.client = cbpro.AuthenticatedClient(api_key, api_secret, password)
         else:
             self.client = cbpro.PublicClient()
 
-    def get_historical_data(self, coin_pair, interval=3600):
+    def get_historical_data(self, coin_pair, interval=3600, start=None, end=None):
         """
         Retrieve the historical data for a given coin pair over the specified time interval
         Args:
             coin_pair (str): The coin pair to fetch data for
             interval (int): The interval of time (in seconds) between successive datapoints
+            start (int): Defaults to None. The opening time (in epoch seconds) of the earliest candle to retrieve. Ranges
+              longer than a single page of candles are backfilled with concurrent requests
+            end (int): Defaults to None. The time (in epoch seconds) at which to stop retrieving candles
         Returns:
             pandas.DataFrame: A dataframe containing the corresponding OHLCV data
         """
 
-        # Candlesticks need to be returned in reverse order (GDAX gives us most recent data first)
-        return convert_to_dataframe(
-            self.client.get_product_historic_rates(coin_pair, granularity=interval)[::-1]
-        )
+        if self.store is None and start is None and end is None:
+            # Candlesticks need to be returned in reverse order (GDAX gives us most recent data first)
+            return convert_to_dataframe(self.__fetch_candles(coin_pair, interval)[::-1])
+
+        # Without an explicit range we retrieve the same window the exchange returns by default
+        if end is None:
+            end = (int(time.time()) // interval + 1) * interval
+        if start is None:
+            start = end - MAX_CANDLES_PER_REQUEST * interval
+
+        if self.store is None:
+            return convert_to_dataframe(self.__backfill(coin_pair, interval, start, end))
+
+        base = self.base_granularity
+        if base and interval > base and interval % base == 0:
+            return convert_to_dataframe(self.__resampled_candles(coin_pair, interval, start, end))
+
+        return convert_to_dataframe(self.__stored_candles(coin_pair, interval, start, end))
+
+    def __stored_candles(self, coin_pair, interval, start, end):
+        """
+        Loads candles from the store, fetching the parts of the time range that are not stored yet from the exchange
+
+        Args:
+            coin_pair (str): The coin pair to fetch data for
+            interval (int): The interval of time (in seconds) between successive datapoints
+            start (int): The opening time (in epoch seconds) of the earliest candle to retrieve
+            end (int): The time (in epoch seconds) at which to stop retrieving candles
+        Returns:
+            numpy.ndarray: A matrix of candles in increasing order of time
+        """
+
+        for missing_start, missing_end in self.store.missing_ranges(coin_pair, interval, start, end):
+            candles = self.__backfill(coin_pair, interval, missing_start, missing_end)
+
+            # The most recent candle is still forming, so we never mark it as fetched
+            fetched_end = min(missing_end, int(time.time()) // interval * interval)
+            self.store.merge(coin_pair, interval, candles, missing_start, max(missing_start, fetched_end))
+
+        return self.store.load(coin_pair, interval, start, end)
+
+    def __resampled_candles(self, coin_pair, interval, start, end):
+        """
+        Derives the candles of a coarser granularity from the stored base candles, extending the cached series of that
+        granularity with the base candles that arrived since it was last requested
+
+        Args:
+            coin_pair (str): The coin pair to fetch data for
+            interval (int): The interval of time (in seconds) between successive datapoints, a multiple of the base
+              granularity
+            start (int): The opening time (in epoch seconds) of the earliest candle to retrieve
+            end (int): The time (in epoch seconds) at which to stop retrieving candles
+        Returns:
+            numpy.ndarray: A matrix of candles in increasing order of time
+        """
+        from resample import ResampledSeries
+
+        # Coarse candles open at multiples of their granularity, so their first base candle may precede `start`
+        base_start = start - start % interval
+        base_candles = self.__stored_candles(coin_pair, self.base_granularity, base_start, end)
+
+        with self.resampled_lock:
+            key = (coin_pair, interval)
+            if key not in self.resampled:
+                if len(self.resampled) >= MAX_RESAMPLED_SERIES:
+                    self.resampled.pop(next(iter(self.resampled)))
+                self.resampled[key] = ResampledSeries(interval, base_start)
+
+            candles = self.resampled[key].extend(base_candles, base_start)
+
+        times = candles[:, 0]
+        return candles[times.searchsorted(start, side='left'):times.searchsorted(end, side='left')]
+
+    @timed('fetch')
+    def __fetch_candles(self, coin_pair, interval):
+        """
+        Fetches the most recent page of candles from the exchange client
+
+        Args:
+            coin_pair (str): The coin pair to fetch data for
+            interval (int): The interval of time (in seconds) between successive datapoints
+        Returns:
+            list[list[float]]: A matrix of candles, most recent first
+        """
+
+        self.rate_limiter.acquire()
+        candles = self.client.get_product_historic_rates(coin_pair, granularity=interval)
+
+        # Errors are reported as a message rather than raised by the client
+        if isinstance(candles, dict):
+            raise ValueError(candles.get('message', 'Unable to fetch historical data for {}'.format(coin_pair)))
+
+        return candles
+
+    @timed('fetch')
+    def __backfill(self, coin_pair, interval, start, end):
+        return backfill(self.client, coin_pair, interval, start, end, page_size=MAX_CANDLES_PER_REQUEST,
+                        max_workers=MAX_CONCURRENT_REQUESTS, rate_limiter=self.rate_limiter)
 
     def get_available_keypairs(self):
         return [product['display_name'] for product in self.client.get_products()]
@@ -0,0 +1,209 @@
+"""
+Contains an in-process job queue that runs long backtests in the background, so requests can return immediately
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a job is submitted while the queue already holds its maximum number of pending jobs
+    """
+    pass
+
+
+class JobCancelled(Exception):
+    """
+    Raised from a job's progress callback to stop a running job that has been cancelled
+    """
+    pass
+
+
+class Job(object):
+    """
+    A Job tracks the status, progress and result of a single background task
+
+    Args:
+        job_id (str): The unique identifier of the job
+        kind (str): Defaults to 'backtest'. What the job runs ('backtest', 'sweep' or 'walk_forward'), which determines
+          its result
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, job_id, kind='backtest'):
+        self.id = job_id
+        self.kind = kind
+        self.status = Job.QUEUED
+        self.processed = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+        self.cancel_requested = False
+        self.changed = threading.Condition()
+
+    @property
+    def is_finished(self):
+        return self.status in (Job.DONE, Job.FAILED, Job.CANCELLED)
+
+    def report_progress(self, processed, total):
+        """
+        Records how far the job has come. Used as the progress callback of the running task, so it also stops the task
+        once the job has been cancelled
+
+        Args:
+            processed (int): The number of units (i.e., candles) processed so far
+            total (int): The total number of units to process
+        """
+
+        if self.cancel_requested:
+            raise JobCancelled()
+
+        with self.changed:
+            self.processed = int(processed)
+            self.total = int(total)
+            self.changed.notify_all()
+
+    def wait_for_change(self, timeout):
+        """
+        Blocks until the job's progress or status changes, or the timeout expires
+
+        Args:
+            timeout (float): The maximum number of seconds to wait
+        """
+
+        with self.changed:
+            self.changed.wait(timeout)
+
+    def to_dict(self):
+        return {'id': self.id, 'kind': self.kind, 'status': self.status, 'processed': self.processed, 'total': self.total,
+                'error': self.error, 'created': self.created, 'finished': self.finished}
+
+    def _finish(self, status, result=None, error=None):
+        with self.changed:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished = time.time()
+            self.changed.notify_all()
+
+
+class JobManager(object):
+    """
+    A JobManager runs submitted tasks on a pool of worker threads, keeping finished jobs around for a limited time so
+    their results can be retrieved
+
+    Args:
+        max_workers (int): Defaults to 2. The number of jobs run at the same time
+        max_pending (int): Defaults to 32. The maximum number of queued and running jobs
+        result_ttl (float): Defaults to 600. The number of seconds a finished job (and its result) is kept
+    """
+    def __init__(self, max_workers=2, max_pending=32, result_ttl=600):
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, task, *args, kind='backtest', **kwargs):
+        """
+        Queues a task. The task is called with the given arguments plus a `progress` keyword argument, a callable
+        that it should call periodically with (processed, total) and that raises `JobCancelled` once the job has
+        been cancelled
+
+        Args:
+            task (Callable): The task to run
+            kind (str): Defaults to 'backtest'. What the task runs (see `Job`)
+        Returns:
+            Job: The queued job
+        """
+
+        self.evict_expired()
+
+        with self.lock:
+            pending = sum(not job.is_finished for job in self.jobs.values())
+            if pending >= self.max_pending:
+                raise QueueFullError('Too many pending jobs ({}), try again later'.format(pending))
+
+            job = Job(uuid.uuid4().hex, kind)
+            self.jobs[job.id] = job
+
+        job.future = self.executor.submit(self.__run, job, task, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        """
+        Args:
+            job_id (str): The identifier of the job
+        Returns:
+            Job: The job, or None if no such job exists (or it has expired)
+        """
+
+        self.evict_expired()
+
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancels a job. Queued jobs never start, and running jobs stop the next time they report progress
+
+        Args:
+            job_id (str): The identifier of the job
+        Returns:
+            Job: The job, or None if no such job exists
+        """
+
+        job = self.get(job_id)
+        if job is None or job.is_finished:
+            return job
+
+        job.cancel_requested = True
+        if job.future.cancel():
+            job._finish(Job.CANCELLED)
+
+        return job
+
+    def evict_expired(self):
+        """
+        Forgets every job that finished more than `result_ttl` seconds ago
+        """
+
+        expiry = time.time() - self.result_ttl
+
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items() if job.is_finished and job.finished < expiry]
+            for job_id in expired:
+                del self.jobs[job_id]
+
+    def shutdown(self):
+        for job in list(self.jobs.values()):
+            job.cancel_requested = True
+        self.executor.shutdown(wait=True)
+
+    @staticmethod
+    def __run(job, task, args, kwargs):
+        if job.cancel_requested:
+            job._finish(Job.CANCELLED)
+            return
+
+        with job.changed:
+            job.status = Job.RUNNING
+            job.changed.notify_all()
+
+        try:
+            job._finish(Job.DONE, result=task(*args, progress=job.report_progress, **kwargs))
+        except JobCancelled:
+            job._finish(Job.CANCELLED)
+        except Exception as e:
+            job._finish(Job.FAILED, error=str(e))
@@ -0,0 +1,143 @@
+"""
+Contains the trade ledger, a compact record of every position opened and closed during a backtest
+"""
+
+from array import array
+
+import numpy
+
+import logger
+
+
+class TradeLedger(object):
+    """
+    A TradeLedger records the positions of a backtest in typed arrays, one per field, so recording a trade costs a few
+    appends instead of an object and a log line. Trades are only logged when trade logging is enabled
+
+    Args:
+        pair (str): The coin pair being traded, separated by a '-'
+    """
+
+    # The reasons a position is closed for
+    OPEN = 0
+    SIGNAL = 1
+    STOP_LOSS = 2
+    EXIT_REASONS = ('open', 'signal', 'stop_loss')
+
+    __slots__ = ('pair', 'entry_index', 'exit_index', 'entry_price', 'exit_price', 'amount_base', 'spent',
+                 'proceeds', 'exit_reason')
+
+    def __init__(self, pair):
+        self.pair = pair
+        self.entry_index = array('q')
+        self.exit_index = array('q')
+        self.entry_price = array('d')
+        self.exit_price = array('d')
+        self.amount_base = array('d')
+        self.spent = array('d')
+        self.proceeds = array('d')
+        self.exit_reason = array('b')
+
+    def __len__(self):
+        return len(self.entry_index)
+
+    def open(self, index, price, amount_quote, trading_fee=0):
+        """
+        Opens a position
+
+        Args:
+            index (int): The position of the candle the position is opened at
+            price (float): The current price for one unit of the base currency
+            amount_quote (float): The amount of quote currency being spent, including fees
+            trading_fee (float): Defaults to 0. The trading fee of the market order
+        Returns:
+            float: The amount of base currency bought
+        """
+
+        invested = amount_quote * (1 - trading_fee)
+        amount_base = round(invested / price, 8)
+
+        self.entry_index.append(index)
+        self.exit_index.append(-1)
+        self.entry_price.append(price)
+        self.exit_price.append(numpy.nan)
+        self.amount_base.append(amount_base)
+        self.spent.append(amount_quote)
+        self.proceeds.append(numpy.nan)
+        self.exit_reason.append(TradeLedger.OPEN)
+
+        if logger.is_enabled('info'):
+            logger.log("Opened {} trade at {}. Spent: {} {}, Amount: {} {}".format(
+                self.pair, price, round(invested, 8), self.pair[4:], amount_base, self.pair.split('-')[0]))
+
+        return amount_base
+
+    def close(self, index, price, trading_fee=0, reason=SIGNAL):
+        """
+        Closes the most recently opened position
+
+        Args:
+            index (int): The position of the candle the position is closed at
+            price (float): The current price for one unit of the base currency
+            trading_fee (float): Defaults to 0. The trading fee of the market order
+            reason (int): Defaults to `TradeLedger.SIGNAL`. Why the position is closed
+        Returns:
+            float: The amount of quote currency received, after fees
+        """
+
+        amount_base = self.amount_base[-1]
+        proceeds = price * amount_base * (1 - trading_fee)
+
+        self.exit_index[-1] = index
+        self.exit_price[-1] = price
+        self.proceeds[-1] = proceeds
+        self.exit_reason[-1] = reason
+
+        profit = amount_base * (price - self.entry_price[-1])
+        message_type = "success" if profit > 0 else "error"
+        if logger.is_enabled(message_type):
+            logger.log("Sold {} at {}. Profit: {}, Total {}: {}".format(
+                self.pair[:3], price, round(profit, 8), self.pair[4:], round(amount_base * price, 8)),
+                type=message_type)
+
+        return proceeds
+
+    def position_report(self, times, start=0):
+        """
+        Builds a column-oriented report of every position still open at, or opened after, a candle
+
+        Args:
+            times (numpy.ndarray): The opening time (in epoch seconds) of every candle of the backtest
+            start (int): Defaults to 0. The position of the first candle to report positions from
+        Returns:
+            dict[str, -]: The entry and exit time and price, amount, quote currency spent and received (both including
+              fees), profit and exit reason of every position, plus a 'summary' of them
+        """
+
+        entry_index = numpy.asarray(self.entry_index)
+        exit_index = numpy.asarray(self.exit_index)
+        reported = (exit_index == -1) | (exit_index >= start)
+
+        exit_reason = numpy.asarray(self.exit_reason)[reported]
+        is_open = exit_reason == TradeLedger.OPEN
+        spent = numpy.asarray(self.spent)[reported]
+        proceeds = numpy.asarray(self.proceeds)[reported]
+        profit = proceeds - spent
+
+        def nullable(values):
+            return [None if value != value else value for value in values.tolist()]
+
+        closed_profit = profit[~is_open]
+        return {'entry_time': times[entry_index[reported]].tolist(),
+                'entry_price': numpy.asarray(self.entry_price)[reported].tolist(),
+                'exit_time': [None if still_open else time for still_open, time in
+                              zip(is_open.tolist(), times[exit_index[reported]].tolist())],
+                'exit_price': nullable(numpy.asarray(self.exit_price)[reported]),
+                'amount': numpy.asarray(self.amount_base)[reported].tolist(),
+                'spent': spent.tolist(),
+                'proceeds': nullable(proceeds),
+                'profit': nullable(profit),
+                'exit_reason': [TradeLedger.EXIT_REASONS[reason] for reason in exit_reason.tolist()],
+                'summary': {'positions': int(reported.sum()), 'open': int(is_open.sum()),
+                            'wins': int((closed_profit > 0).sum()), 'losses': int((closed_profit <= 0).sum()),
+                            'realized_profit': float(closed_profit.sum())}}
@@ -0,0 +1,610 @@
+"""
+Contains the event-driven trading engine, which runs a strategy against a feed of prices (the Coinbase Pro websocket
+feed, or a replayed recording) instead of historical data. Indicators are updated incrementally as candles close,
+compiled strategies are evaluated on every event, and orders are sent through an `Exchange` by a rate limited
+background order manager, so placing an order never blocks the handling of the next event
+
+Usage:
+    python live.py --pair ETH-USD --period 1m --capital 100 --buy-strategy 'current-price > sma(9)' \\
+        --sell-strategy 'current-price < sma(9)' [--replay candles.npy [--speed 60]] [--live]
+
+Without --live, orders are paper traded against the feed's prices. Live trading reads the API credentials from the
+COINBASE_API_KEY, COINBASE_API_SECRET and COINBASE_API_PASSPHRASE environment variables. Unless a recording is
+replayed, the indicators are warmed up from the history in the candle store (CANDLE_STORE_DIR) before trading starts
+"""
+
+import math
+import queue
+import threading
+import time
+from array import array
+from concurrent.futures import Future
+
+import numpy
+
+import logger
+from analysis import convert_to_candles, warmup_period
+from backfill import RateLimiter
+from decision import compile_event_strategy
+from exchange import PRIVATE_REQUEST_BURST, PRIVATE_REQUESTS_PER_SECOND
+from ledger import TradeLedger
+from streaming import create_streaming_indicator
+
+
+# The number of rows of a replay file read into memory at once
+REPLAY_CHUNK_SIZE = 65536
+
+# The percentiles of the event-to-decision latency that are reported
+LATENCY_PERCENTILES = (50, 90, 99, 99.9)
+
+# Bound once, since event times shadow the time module below
+_perf_counter = time.perf_counter
+
+
+class MarketEvent(object):
+    """
+    A new price of a feed: either a trade (tick) within the current candle, or the close of a candle
+
+    Args:
+        time (float): The time of the trade, or the opening time of the closed candle, in epoch seconds
+        price (float): The price of the trade, or the closing price of the candle
+        closed (bool): Defaults to False. True iff the event is the close of a candle
+    """
+
+    __slots__ = ('time', 'price', 'closed', 'received')
+
+    def __init__(self, time, price, closed=False):
+        self.time = time
+        self.price = price
+        self.closed = closed
+        # When the event was received, used to measure the latency of handling it
+        self.received = _perf_counter()
+
+
+class OrderError(Exception):
+    """
+    Raised when an order is rejected by the exchange, or is not filled in time
+    """
+    pass
+
+
+def replay_feed(path, speed=None):
+    """
+    Replays a recording of candles or trades. Recordings are either .npy files (which are memory mapped, so they can
+    be larger than memory) or .csv files, with one candle per row in the Coinbase Pro format ([time, low, high, open,
+    close, volume]) or one trade per row ([time, price] or [time, price, size])
+
+    Args:
+        path (str): The path of the recording
+        speed (float): Defaults to None. How many times faster than real time events are replayed. Events are replayed
+          as fast as possible by default
+    Yields:
+        MarketEvent: Each candle close or trade of the recording, in order
+    """
+
+    if path.endswith('.npy'):
+        rows = numpy.load(path, mmap_mode='r')
+    else:
+        rows = numpy.loadtxt(path, delimiter=',', ndmin=2)
+
+    candles = rows.shape[1] == 6
+    price_column = 4 if candles else 1
+    started = None
+
+    for offset in range(0, len(rows), REPLAY_CHUNK_SIZE):
+        chunk = rows[offset:offset + REPLAY_CHUNK_SIZE]
+
+        for event_time, price in zip(chunk[:, 0].tolist(), chunk[:, price_column].tolist()):
+            if speed:
+                if started is None:
+                    started = (event_time, time.monotonic())
+
+                delay = started[1] + (event_time - started[0]) / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            yield MarketEvent(event_time, price, closed=candles)
+
+
+def websocket_feed(coin_pair):
+    """
+    Streams the trades of a coin pair from the ticker channel of the Coinbase Pro websocket feed
+
+    Args:
+        coin_pair (str): The coin pair to stream, separated by a '-'
+    Yields:
+        MarketEvent: Each trade, as soon as it is received
+    """
+    import cbpro
+
+    from util import iso_to_epoch
+
+    events = queue.Queue()
+
+    class TickerClient(cbpro.WebsocketClient):
+        def on_message(self, message):
+            if message.get('type') == 'ticker' and 'price' in message:
+                events.put(MarketEvent(iso_to_epoch(message.get('time', time.time())), float(message['price'])))
+
+        def on_error(self, error, data=None):
+            events.put(error)
+
+    client = TickerClient(products=[coin_pair], channels=['ticker'], should_print=False)
+    client.start()
+
+    try:
+        while True:
+            event = events.get()
+            if isinstance(event, Exception):
+                raise event
+
+            yield event
+    finally:
+        client.close()
+
+
+class OrderManager(object):
+    """
+    An OrderManager places orders through an `Exchange` on a background thread, keeping within the exchange's rate
+    limit, and waits for them to be filled. Orders are placed in the order they are submitted
+
+    Args:
+        exchange (Exchange): The exchange orders are placed on
+        requests_per_second (float): Defaults to the rate limit of private Coinbase Pro endpoints
+        burst (int): Defaults to the burst allowed by private Coinbase Pro endpoints
+        poll_interval (float): Defaults to 0.25. The number of seconds between checks of an unfilled order
+        timeout (float): Defaults to 60. The number of seconds an order may take to be filled
+        max_retries (int): Defaults to 3. The number of times a request rejected by the exchange's rate limit (or, when
+          checking on an order, a failed request) is retried before the order fails. Orders are never placed again
+          after any other failure, since they may have been placed after all
+        backoff (float): Defaults to 0.5. The number of seconds to wait before the first retry, doubled on each retry
+    """
+    def __init__(self, exchange, requests_per_second=PRIVATE_REQUESTS_PER_SECOND, burst=PRIVATE_REQUEST_BURST,
+                 poll_interval=0.25, timeout=60, max_retries=3, backoff=0.5):
+        self.exchange = exchange
+        self.rate_limiter = RateLimiter(requests_per_second, burst)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.orders = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+
+    def submit(self, side, coin_pair, amount, limit=None):
+        """
+        Queues an order to be placed
+
+        Args:
+            side (str): Either 'buy' or 'sell'
+            coin_pair (str): The coin pair being traded
+            amount (float): The amount of the base currency to buy or sell
+            limit (float): Defaults to None. The limit price, if this is not a market order
+        Returns:
+            concurrent.futures.Future: Resolves to the fill of the order, a dict with its 'id', 'side', 'size',
+              average 'price' and 'fees', or fails with an `OrderError`
+        """
+
+        self.__ensure_worker()
+
+        future = Future()
+        self.orders.put((future, side, coin_pair, amount, limit))
+        return future
+
+    def close(self):
+        """
+        Stops the background thread once every queued order has been placed
+        """
+
+        with self.lock:
+            if self.worker is not None:
+                self.orders.put(None)
+                self.worker.join()
+                self.worker = None
+
+    def __ensure_worker(self):
+        if self.worker is not None:
+            return
+
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.__place_orders, name='orders', daemon=True)
+                self.worker.start()
+
+    def __place_orders(self):
+        while True:
+            order = self.orders.get()
+            if order is None:
+                return
+
+            future, side, coin_pair, amount, limit = order
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(self.__execute(side, coin_pair, amount, limit))
+            except Exception as e:
+                future.set_exception(e)
+
+    def __execute(self, side, coin_pair, amount, limit):
+        place = self.exchange.buy if side == 'buy' else self.exchange.sell
+        order = self.__request(place, coin_pair, amount, limit)
+        deadline = time.monotonic() + self.timeout
+
+        while 'message' not in order and order.get('status') != 'done':
+            if time.monotonic() > deadline:
+                raise OrderError('Order {} was not filled within {} seconds'.format(order['id'], self.timeout))
+
+            time.sleep(self.poll_interval)
+            order = self.__request(self.exchange.get_order, order['id'], retry_errors=True)
+
+        if 'message' in order:
+            raise OrderError('{} order for {} {} was rejected: {}'.format(side, amount, coin_pair, order['message']))
+
+        size = float(order.get('filled_size') or 0)
+        if size == 0:
+            raise OrderError('Order {} was {}'.format(order['id'], order.get('done_reason', 'not filled')))
+
+        return {'id': order['id'], 'side': side, 'size': size, 'price': float(order['executed_value']) / size,
+                'fees': float(order.get('fill_fees') or 0)}
+
+    def __request(self, call, *args, retry_errors=False):
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+
+            try:
+                response = call(*args)
+            except OSError as e:
+                if not retry_errors or attempt == self.max_retries:
+                    raise OrderError('Request to the exchange failed: {}'.format(e))
+                response = None
+
+            # Errors are reported as a message rather than raised by the client. Requests rejected by the rate limit
+            # were not acted on, so they are safe to send again
+            if response is not None and 'rate limit' not in response.get('message', '').lower():
+                return response
+            if attempt == self.max_retries:
+                raise OrderError('Request to the exchange was rate limited {} times'.format(attempt + 1))
+
+            time.sleep(self.backoff * 2 ** attempt)
+
+
+class LiveTrader(object):
+    """
+    A LiveTrader runs a strategy against a feed of events. The indicators are updated once per candle, when the
+    candle closes, and the strategies are evaluated on every event with the event's price as the current price. At
+    most one order is outstanding at a time; while it is being filled, events only update the indicators
+
+    Args:
+        orders (OrderManager): The order manager placing the trader's orders
+        coin_pair (str): The coin pair being traded
+        granularity (int): The interval of time (in seconds) between successive candles
+        capital (float): The starting capital of the quote currency
+        buy_strategy (dict[str, -]): A parsed Expression object containing the conditions for buying
+        sell_strategy (dict[str, -]): A parsed Expression object containing the conditions for selling
+        indicators (list[str]): Defaults to (). Indicators to track besides the ones the strategies reference
+        trading_fee (float): Defaults to 0. The trading fee per market order, used to size buy orders
+        stop_loss (float): Defaults to 0. The fraction below our buy price at which to sell an open position
+        max_failed_orders (int): Defaults to 3. The number of orders in a row that may fail before the trader stops
+          placing orders. After a failed order, the next one is placed no earlier than the next candle
+    """
+    def __init__(self, orders, coin_pair, granularity, capital, buy_strategy, sell_strategy, indicators=(),
+                 trading_fee=0, stop_loss=0, max_failed_orders=3):
+        self.orders = orders
+        self.coin_pair = coin_pair
+        self.granularity = granularity
+        self.capital = capital
+        self.trading_fee = trading_fee
+        self.stop_loss = stop_loss
+        self.max_failed_orders = max_failed_orders
+
+        self.buy_signal = compile_event_strategy(buy_strategy)
+        self.sell_signal = compile_event_strategy(sell_strategy)
+
+        names = list(indicators)
+        names += sorted((self.buy_signal.indicators | self.sell_signal.indicators) - set(names))
+        self.indicators = [create_streaming_indicator(name) for name in names]
+
+        self.values = {'currentprice': math.nan}
+        for indicator in self.indicators:
+            self.values.update(indicator.values())
+
+        self.reserve = capital
+        self.amount_base = 0.0
+        self.entry_price = None
+        self.ledger = TradeLedger(coin_pair)
+
+        # The opening time of every candle seen, and the state of the current one
+        self.times = array('q')
+        self.candle_start = None
+        self.candle_close = None
+        self.candle_open = False
+
+        # The opening time of the last candle the indicators were warmed up with, if any
+        self.warmed_until = None
+
+        # The outstanding order as (future, candle position, exit reason), if any
+        self.pending = None
+        self.latencies = array('d')
+
+        # Every failed order as {'side', 'candle', 'error'}, the number of them in a row and the first candle position
+        # at which another order may be placed
+        self.failed_orders = []
+        self.consecutive_failures = 0
+        self.next_order = 0
+
+    @property
+    def halted(self):
+        return self.consecutive_failures >= self.max_failed_orders
+
+    def warmup_period(self):
+        """
+        Returns:
+            int: The number of closed candles the indicators need for all of them to have a value before the first
+              event, equal to the one computed over the full history
+        """
+
+        periods = [warmup_period(indicator.name) for indicator in self.indicators]
+        return max(periods) + 1 if periods else 0
+
+    def warm_up(self, exchange, now=None):
+        """
+        Updates the indicators with the candles that closed before the current one, so the strategies are evaluated
+        from the first event on rather than once enough candles of the feed have closed. Candles of the feed that were
+        part of the warm-up are not counted twice
+
+        Args:
+            exchange (Exchange): The exchange (or candle store) the history is retrieved from
+            now (int): Defaults to the current time. The time (in epoch seconds) the feed starts at
+        Returns:
+            int: The number of candles the indicators were warmed up with
+        """
+
+        count = self.warmup_period()
+        if count == 0:
+            return 0
+
+        now = int(time.time() if now is None else now)
+        end = now - now % self.granularity
+        history = exchange.get_historical_data(self.coin_pair, interval=self.granularity,
+                                               start=end - count * self.granularity, end=end)
+
+        candles = convert_to_candles(history)
+        candles = candles[candles[:, 0] < end]
+
+        for start, close in zip(candles[:, 0].astype(int).tolist(), candles[:, 4].tolist()):
+            for indicator in self.indicators:
+                indicator.update(close, start)
+
+        for indicator in self.indicators:
+            self.values.update(indicator.values())
+
+        if len(candles):
+            self.warmed_until = int(candles[-1, 0])
+
+        return len(candles)
+
+    def run(self, feed, wait_for_fills=False):
+        """
+        Handles every event of a feed, then waits for the outstanding order (if any) to be filled
+
+        Args:
+            feed (Iterable[MarketEvent]): The events to trade on
+            wait_for_fills (bool): Defaults to False. Whether to wait for each order to be filled before handling the
+              next event, i.e. when replaying a recording faster than real time, where events would otherwise pass by
+              while an order is being placed
+        Returns:
+            dict[str, -]: The report of the trader, see `report`
+        """
+
+        for event in feed:
+            self.on_event(event)
+
+            if wait_for_fills and self.pending is not None:
+                self.pending[0].exception()
+
+        self.flush()
+        return self.report()
+
+    def on_event(self, event):
+        """
+        Handles a single event, updating the indicators and placing an order if a strategy is satisfied
+
+        Args:
+            event (MarketEvent): The event to handle
+        """
+
+        self.__advance(event.time)
+        self.candle_close = event.price
+        if event.closed:
+            self.__close_candle()
+
+        self.values['currentprice'] = event.price
+        self.__decide(event.price)
+
+        self.latencies.append(_perf_counter() - event.received)
+
+    def flush(self):
+        """
+        Waits for the outstanding order (if any) to be filled and records it
+        """
+
+        if self.pending is not None:
+            self.__settle(self.pending[0].exception() or self.pending[0].result())
+
+    def report(self):
+        """
+        Returns:
+            dict[str, -]: The number of events and candles handled, the current capital and holdings, the position
+              report of every trade, the failed orders and whether they stopped the trader from placing more, and the
+              event-to-decision latency percentiles
+        """
+
+        price = self.candle_close if self.candle_close is not None else math.nan
+
+        return {'pair': self.coin_pair, 'events': len(self.latencies), 'candles': len(self.times),
+                'reserve': self.reserve, 'amount_base': self.amount_base,
+                'value': self.reserve + self.amount_base * price,
+                'positions': self.ledger.position_report(numpy.asarray(self.times)),
+                'failed_orders': self.failed_orders, 'halted': self.halted,
+                'latency': self.latency_report()}
+
+    def latency_report(self):
+        """
+        Returns:
+            dict[str, float]: The mean, maximum and `LATENCY_PERCENTILES` of the time (in microseconds) between
+              receiving an event and having acted on it
+        """
+
+        latencies = numpy.frombuffer(self.latencies, dtype=float) * 1e6
+        if len(latencies) == 0:
+            return {}
+
+        report = {'p{:g}'.format(p): value for p, value in
+                  zip(LATENCY_PERCENTILES, numpy.percentile(latencies, LATENCY_PERCENTILES).tolist())}
+        report.update(mean=float(latencies.mean()), max=float(latencies.max()))
+        return report
+
+    def __advance(self, event_time):
+        # Trades are grouped into candles by time, closing the current candle when the first trade of the next arrives
+        start = int(event_time - event_time % self.granularity)
+        if start == self.candle_start:
+            return
+
+        if self.candle_open:
+            self.__close_candle()
+
+        self.candle_start = start
+        self.candle_open = True
+        self.times.append(start)
+
+    def __close_candle(self):
+        if self.warmed_until is None or self.candle_start > self.warmed_until:
+            for indicator in self.indicators:
+                indicator.update(self.candle_close, self.candle_start)
+                self.values.update(indicator.values())
+
+        self.candle_open = False
+
+    def __decide(self, price):
+        if self.pending is not None:
+            future = self.pending[0]
+            if not future.done():
+                return
+
+            self.__settle(future.exception() or future.result())
+
+        index = len(self.times) - 1
+        if self.halted or index < self.next_order:
+            return
+
+        if self.entry_price is None:
+            if self.buy_signal(self.values):
+                amount = round(self.reserve * (1 - self.trading_fee) / price, 8)
+                self.pending = (self.orders.submit('buy', self.coin_pair, amount), index, TradeLedger.OPEN)
+            return
+
+        if self.stop_loss and price < self.entry_price * (1 - self.stop_loss):
+            reason = TradeLedger.STOP_LOSS
+        elif self.sell_signal(self.values):
+            reason = TradeLedger.SIGNAL
+        else:
+            return
+
+        self.pending = (self.orders.submit('sell', self.coin_pair, self.amount_base), index, reason)
+
+    def __settle(self, fill):
+        _, index, reason = self.pending
+        self.pending = None
+
+        if isinstance(fill, Exception):
+            # The position is left as it was, and no order is placed again until the next candle has started
+            side = 'buy' if reason == TradeLedger.OPEN else 'sell'
+            self.failed_orders.append({'side': side, 'candle': self.times[index], 'error': str(fill)})
+            self.consecutive_failures += 1
+            self.next_order = len(self.times)
+
+            if logger.is_enabled('error'):
+                logger.log('{} order for {} failed: {}'.format(side.capitalize(), self.coin_pair, fill), type='error')
+                if self.halted:
+                    logger.log('Stopped placing orders for {} after {} failed orders in a row'.format(
+                        self.coin_pair, self.consecutive_failures), type='error')
+            return
+
+        self.consecutive_failures = 0
+
+        # The fees are given as the fraction of the traded value the ledger expects
+        if fill['side'] == 'buy':
+            spent = fill['size'] * fill['price'] + fill['fees']
+            self.ledger.open(index, fill['price'], spent, trading_fee=fill['fees'] / spent)
+            self.reserve -= spent
+            self.amount_base = fill['size']
+            self.entry_price = fill['price']
+        else:
+            value = fill['size'] * fill['price']
+            self.reserve += self.ledger.close(index, fill['price'], trading_fee=fill['fees'] / value, reason=reason)
+            self.amount_base = 0.0
+            self.entry_price = None
+
+
+def main():
+    import argparse
+    import json
+    import os
+
+    from exchange import Exchange
+    from local_client import PaperClient
+    from store import CandleStore
+    from strategy_parser import parse_strategy
+    from util import period_to_integer
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pair', required=True, help="The coin pair to trade, i.e. 'ETH-USD'")
+    parser.add_argument('--period', default='1m', help="The duration of each candle, i.e. '15m'")
+    parser.add_argument('--capital', type=float, default=1.0)
+    parser.add_argument('--buy-strategy', required=True, help="The buy strategy, i.e. 'current-price > sma(9)'")
+    parser.add_argument('--sell-strategy', required=True, help="The sell strategy, i.e. 'current-price < sma(9)'")
+    parser.add_argument('--indicators', nargs='*', default=[], help='Additional indicators to track')
+    parser.add_argument('--trading-fee', type=float, default=0.003)
+    parser.add_argument('--stop-loss', type=float, default=0, help='The stop loss as a percentage')
+    parser.add_argument('--replay', default=None, help='A recording of candles or trades to replay')
+    parser.add_argument('--speed', type=float, default=None, help='The replay speed, as fast as possible by default')
+    parser.add_argument('--live', action='store_true', help='Place real orders instead of paper trading')
+    args = parser.parse_args()
+
+    feed = replay_feed(args.replay, args.speed) if args.replay else websocket_feed(args.pair)
+
+    if args.live:
+        orders = OrderManager(Exchange(os.environ['COINBASE_API_KEY'], os.environ['COINBASE_API_SECRET'],
+                                       os.environ['COINBASE_API_PASSPHRASE']))
+    else:
+        # Paper orders are filled locally, so they are not rate limited
+        paper = PaperClient(trading_fee=args.trading_fee)
+        orders = OrderManager(Exchange(client=paper), requests_per_second=1e6, burst=1000)
+        feed = paper.watch(feed, args.pair)
+    trader = LiveTrader(orders, args.pair, period_to_integer(args.period), args.capital,
+                        parse_strategy(args.buy_strategy), parse_strategy(args.sell_strategy), args.indicators,
+                        trading_fee=args.trading_fee, stop_loss=args.stop_loss / 100)
+
+    # A recording starts where its own history starts, so only live feeds are warmed up
+    if not args.replay:
+        candle_directory = os.environ.get('CANDLE_STORE_DIR',
+                                          os.path.join(os.path.dirname(__file__), '..', 'data', 'candles'))
+        warmed = trader.warm_up(Exchange(store=CandleStore(candle_directory)))
+        logger.log('Warmed up the indicators of {} with {} candles'.format(args.pair, warmed))
+
+    try:
+        report = trader.run(feed, wait_for_fills=bool(args.replay and not args.speed))
+    except KeyboardInterrupt:
+        trader.flush()
+        report = trader.report()
+    finally:
+        orders.close()
+
+    logger.flush()
+    print(json.dumps({key: value for key, value in report.items() if key != 'positions'}, indent=2))
+    print(json.dumps(report['positions']['summary'], indent=2))
+
+
+if __name__ == '__main__':
+    main()
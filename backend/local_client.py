@@ -0,0 +1,214 @@
+"""
+Contains local stand-ins for the Coinbase Pro clients, so that historical data can be served without network access
+and orders can be paper traded
+"""
+
+import threading
+import time
+
+import numpy
+
+from util import iso_to_epoch
+
+
+class LocalClient(object):
+    """
+    A LocalClient answers historical data queries from candles held in memory, using the same interface and response
+    format as `cbpro.PublicClient`. It can be handed to `Exchange` in place of the real client, i.e. to replay recorded
+    data or to exercise the candle store offline
+
+    Args:
+        candles (dict[tuple[str, int], list]): A mapping of (coin pair, granularity) to a matrix of candles in the
+          Coinbase Pro format ([time, low, high, open, close, volume])
+        page_size (int): Defaults to 300. The maximum number of candles returned per request, like the real API
+        max_requests_per_second (int): Defaults to None. When given, requests beyond this rate are rejected with a
+          rate limit message, like the real API
+    """
+    def __init__(self, candles, page_size=300, max_requests_per_second=None):
+        self.candles = {key: numpy.asarray(rows, dtype=float).reshape(-1, 6) for key, rows in candles.items()}
+        self.page_size = page_size
+        self.max_requests_per_second = max_requests_per_second
+        self.requests = []
+        self.rejected = 0
+        self.recent = []
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, coin_pair, granularity, page_size=300):
+        """
+        Creates a LocalClient serving the candles recorded in a .npy or .csv file
+
+        Args:
+            path (str): The path of the recorded candles, one candle per row in the Coinbase Pro format
+            coin_pair (str): The coin pair the candles belong to
+            granularity (int): The interval of time (in seconds) between successive candles
+            page_size (int): Defaults to 300. The maximum number of candles returned per request
+        Returns:
+            LocalClient: A client serving the recorded candles
+        """
+
+        if path.endswith('.npy'):
+            rows = numpy.load(path)
+        else:
+            rows = numpy.loadtxt(path, delimiter=',', ndmin=2)
+
+        return cls({(coin_pair, granularity): rows}, page_size=page_size)
+
+    def get_product_historic_rates(self, product_id, start=None, end=None, granularity=None):
+        if self.__rate_limited():
+            return {'message': 'Public rate limit exceeded'}
+
+        self.requests.append((product_id, start, end, granularity))
+
+        rows = self.candles.get((product_id, granularity))
+        if rows is None:
+            return {'message': 'NotFound'}
+
+        rows = rows[numpy.argsort(rows[:, 0])]
+
+        if start is not None:
+            rows = rows[rows[:, 0] >= iso_to_epoch(start)]
+        if end is not None:
+            rows = rows[rows[:, 0] <= iso_to_epoch(end)]
+
+        # Like the real API, only the most recent page of candles is returned, most recent first
+        return rows[-self.page_size:][::-1].tolist()
+
+    def get_products(self):
+        return [{'id': pair, 'display_name': pair.replace('-', '/')} for pair, _ in self.candles]
+
+    def get_product_ticker(self, product_id):
+        rows = [candles for (pair, _), candles in self.candles.items() if pair == product_id and len(candles)]
+        if not rows:
+            return {'message': 'NotFound'}
+
+        latest = max(rows, key=lambda candles: candles[:, 0].max())
+        return {'price': str(latest[latest[:, 0].argmax(), 4])}
+
+    def __rate_limited(self):
+        if self.max_requests_per_second is None:
+            return False
+
+        with self.lock:
+            now = time.monotonic()
+            self.recent = [t for t in self.recent if now - t < 1] + [now]
+
+            if len(self.recent) > self.max_requests_per_second:
+                self.recent.pop()
+                self.rejected += 1
+                return True
+
+        return False
+
+
+class PaperClient(object):
+    """
+    A PaperClient fills orders against the most recent price of a live (or replayed) feed instead of sending them to
+    Coinbase Pro, using the same interface and response format as `cbpro.AuthenticatedClient`. It can be handed to
+    `Exchange` to paper trade a strategy
+
+    Args:
+        trading_fee (float): Defaults to 0. The fee charged on the executed value of every order
+    """
+    def __init__(self, trading_fee=0):
+        self.trading_fee = trading_fee
+        self.prices = {}
+        self.orders = {}
+        self.open_orders = []
+        self.lock = threading.Lock()
+
+    def watch(self, feed, coin_pair):
+        """
+        Passes the events of a feed through, recording their prices so orders are filled at the latest one
+
+        Args:
+            feed (Iterable[MarketEvent]): The events of a feed
+            coin_pair (str): The coin pair the feed belongs to
+        Yields:
+            MarketEvent: Each event of the feed
+        """
+
+        for event in feed:
+            self.update_price(coin_pair, event.price)
+            yield event
+
+    def update_price(self, coin_pair, price):
+        """
+        Records the latest price of a coin pair, filling any open limit order it crosses
+
+        Args:
+            coin_pair (str): The coin pair being traded
+            price (float): The latest price for one unit of the base currency
+        """
+
+        self.prices[coin_pair] = price
+
+        if self.open_orders:
+            with self.lock:
+                for order in list(self.open_orders):
+                    limit = float(order['price'])
+                    crossed = price <= limit if order['side'] == 'buy' else price >= limit
+
+                    if order['product_id'] == coin_pair and crossed:
+                        self.__fill(order, limit)
+                        self.open_orders.remove(order)
+
+    def place_market_order(self, product_id, side, size=None, funds=None):
+        price = self.prices.get(product_id)
+        if price is None:
+            return {'message': 'NotFound'}
+
+        size = size if size is not None else float(funds) / price
+
+        with self.lock:
+            order = self.__create_order(product_id, side, 'market', size)
+            self.__fill(order, price)
+
+        return dict(order)
+
+    def place_limit_order(self, product_id, side, price, size):
+        last = self.prices.get(product_id)
+        if last is None:
+            return {'message': 'NotFound'}
+
+        # Marketable limit orders are filled right away, the others once the price crosses their limit
+        with self.lock:
+            order = self.__create_order(product_id, side, 'limit', size, price=str(price))
+            if last <= price if side == 'buy' else last >= price:
+                self.__fill(order, price)
+            else:
+                self.open_orders.append(order)
+
+        return dict(order)
+
+    def get_order(self, order_id):
+        with self.lock:
+            order = self.orders.get(order_id)
+            return dict(order) if order is not None else {'message': 'NotFound'}
+
+    def cancel_order(self, order_id):
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None or order['status'] == 'done':
+                return {'message': 'NotFound'}
+
+            self.open_orders.remove(order)
+            order.update(status='done', done_reason='canceled', settled=True)
+            return [order_id]
+
+    def get_product_ticker(self, product_id):
+        price = self.prices.get(product_id)
+        return {'price': str(price)} if price is not None else {'message': 'NotFound'}
+
+    def __create_order(self, product_id, side, order_type, size, **fields):
+        import uuid
+
+        order = dict(fields, id=str(uuid.uuid4()), product_id=product_id, side=side, type=order_type,
+                     size=str(size), status='open', settled=False, filled_size='0', executed_value='0', fill_fees='0')
+        self.orders[order['id']] = order
+        return order
+
+    def __fill(self, order, price):
+        executed_value = float(order['size']) * price
+        order.update(status='done', done_reason='filled', settled=True, filled_size=order['size'],
+                     executed_value=repr(executed_value), fill_fees=repr(executed_value * self.trading_fee))
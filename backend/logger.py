@@ -1,14 +1,111 @@
+import atexit
 import datetime
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+
+
+# Message types in increasing order of severity. Messages below the current level are dropped before being formatted
+LEVELS = {'debug': 10, 'info': 20, 'success': 25, 'warning': 30, 'error': 40, 'off': 100}
+
+# The maximum number of buffered messages written to the console at once
+MAX_BATCH = 1024
+
+# The maximum number of messages waiting to be written. Once the buffer is full, messages below BLOCKING_LEVEL are
+# dropped (and counted, so the console shows how many were lost) while more severe ones wait for room, so a burst of
+# trade messages can neither grow memory without bound nor push out warnings and errors
+MAX_BUFFERED = int(os.environ.get('LOG_BUFFER_SIZE', 100000))
+BLOCKING_LEVEL = LEVELS['warning']
+
+_level = LEVELS[os.environ.get('LOG_LEVEL', 'info').lower()]
+_local = threading.local()
+_messages = queue.Queue(maxsize=MAX_BUFFERED)
+_dropped = 0
+_dropped_lock = threading.Lock()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def set_level(level):
+    """
+    Sets the minimum type of message that is logged
+
+    Args:
+        level (str): One of ['debug', 'info', 'success', 'warning', 'error', 'off']
+    """
+    global _level
+
+    _level = LEVELS[level]
+
+
+def is_enabled(type="info"):
+    """
+    Determines whether messages of a type are logged by the current thread, so callers can skip formatting messages
+    that would be dropped
+
+    Args:
+        type (str): One of ['debug', 'info', 'success', 'warning', or 'error']
+    Returns:
+        bool: True iff messages of the type are logged
+    """
+
+    return LEVELS[type] >= _level and not getattr(_local, 'suppressed', False)
+
+
+@contextmanager
+def suppressed():
+    """
+    Drops every message logged by the current thread within the block, i.e. while running batch backtests
+    """
+
+    previous = getattr(_local, 'suppressed', False)
+    _local.suppressed = True
+    try:
+        yield
+    finally:
+        _local.suppressed = previous
 
 
 def log(message, type="info"):
     """
-    Logs the given message with a specified message typ
+    Logs the given message with a specified message typ. Messages are buffered and written to the console by a
+    background thread, so logging never blocks on console I/O. When the buffer is full, messages less severe than a
+    warning are dropped, and warnings and errors wait for room in it
+
     Args:
         message (str): A message to be logged to the console
-        type (str): One of ['success', 'info', 'warning', or 'error']. Will color the text appropriately
+        type (str): One of ['debug', 'info', 'success', 'warning', or 'error']. Will color the text appropriately
+    """
+    global _dropped
+
+    if not is_enabled(type):
+        return
+
+    message = _format(message, type)
+    _ensure_writer()
+
+    if LEVELS[type] >= BLOCKING_LEVEL:
+        _messages.put(message)
+        return
+
+    try:
+        _messages.put_nowait(message)
+    except queue.Full:
+        with _dropped_lock:
+            _dropped += 1
+
+
+def flush():
+    """
+    Blocks until every buffered message has been written to the console
     """
 
+    _messages.join()
+
+
+def _format(message, type):
     timestamp = datetime.datetime.now().strftime('%m-%d-%Y %H:%M:%S')
     message = "[ {} ]  ".format(timestamp) + message
 
@@ -19,4 +116,46 @@ def log(message, type="info"):
     elif type == 'error':
         message = "\033[1;33;91m" + message + "\033[0m"
 
-    print(message)
+    return message
+
+
+def _ensure_writer():
+    global _writer
+
+    if _writer is not None:
+        return
+
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_messages, name='logger', daemon=True)
+            _writer.start()
+
+
+def _write_messages():
+    global _dropped
+
+    while True:
+        batch = [_messages.get()]
+        while len(batch) < MAX_BATCH:
+            try:
+                batch.append(_messages.get_nowait())
+            except queue.Empty:
+                break
+
+        with _dropped_lock:
+            dropped, _dropped = _dropped, 0
+
+        try:
+            lines = batch
+            if dropped:
+                notice = 'Dropped {} messages while the log buffer was full'.format(dropped)
+                lines = batch + [_format(notice, 'warning')]
+
+            sys.stdout.write('\n'.join(lines) + '\n')
+            sys.stdout.flush()
+        finally:
+            for _ in batch:
+                _messages.task_done()
+
+
+atexit.register(flush)
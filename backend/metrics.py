@@ -0,0 +1,323 @@
+"""
+Contains the instrumentation of the backtest pipeline: stage timers and counters, which are aggregated for the
+/metrics endpoint and attached to the request being handled (for its Server-Timing header), and sampled profiling
+"""
+
+import functools
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+
+# The upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram(object):
+    """
+    A cumulative histogram of observed values, in the format of a Prometheus histogram
+
+    Args:
+        buckets (tuple[float]): The upper bounds of the buckets, in increasing order
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry(object):
+    """
+    A thread-safe collection of labelled counters and histograms that can be rendered in the Prometheus text format
+
+    Args:
+        prefix (str): Defaults to 'backtester'. The prefix of every metric name
+    """
+    def __init__(self, prefix='backtester'):
+        self.prefix = prefix
+        self.counters = OrderedDict()
+        self.histograms = OrderedDict()
+        self.descriptions = {}
+        self.lock = threading.Lock()
+
+    def describe(self, name, description):
+        self.descriptions[name] = description
+
+    def inc(self, name, amount=1, **labels):
+        """
+        Increments a counter
+
+        Args:
+            name (str): The name of the counter, without the prefix
+            amount (float): Defaults to 1. The amount to increment the counter by
+            labels (dict[str, str]): The labels identifying the counter's series
+        """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """
+        Records an observation (i.e., a duration in seconds) in a histogram
+
+        Args:
+            name (str): The name of the histogram, without the prefix
+            value (float): The observed value
+            labels (dict[str, str]): The labels identifying the histogram's series
+        """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(value)
+
+    def render(self):
+        """
+        Returns:
+            str: Every metric in the Prometheus text exposition format
+        """
+
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self.descriptions:
+                    lines.append('# HELP {}_{} {}'.format(self.prefix, name, self.descriptions[name]))
+                lines.append('# TYPE {}_{} {}'.format(self.prefix, name, kind))
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                header(name, 'counter')
+                lines.append('{}_{}{} {}'.format(self.prefix, name, _format_labels(labels), _format_value(value)))
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                header(name, 'histogram')
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    bucket_labels = labels + (('le', _format_value(bound)),)
+                    lines.append('{}_{}_bucket{} {}'.format(self.prefix, name, _format_labels(bucket_labels), count))
+                lines.append('{}_{}_bucket{} {}'.format(self.prefix, name, _format_labels(labels + (('le', '+Inf'),)),
+                                                        histogram.count))
+                lines.append('{}_{}_sum{} {}'.format(self.prefix, name, _format_labels(labels),
+                                                     _format_value(histogram.sum)))
+                lines.append('{}_{}_count{} {}'.format(self.prefix, name, _format_labels(labels), histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+
+class Trace(object):
+    """
+    The stage timings and counters of a single request, in the order they were recorded
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+
+    def server_timing(self):
+        """
+        Returns:
+            str: The value of a Server-Timing header listing the total duration of each stage, in milliseconds, and
+              every counter
+        """
+
+        timings = ['{};dur={:.2f}'.format(name, seconds * 1000) for name, seconds in self.stages.items()]
+        timings += ['{};desc="{}"'.format(name, _format_value(value)) for name, value in self.counters.items()]
+        timings.append('total;dur={:.2f}'.format((time.perf_counter() - self.start) * 1000))
+
+        return ', '.join(timings)
+
+
+METRICS = Registry()
+METRICS.describe('stage_seconds', 'Time spent in each stage of the backtest pipeline')
+METRICS.describe('request_seconds', 'Time spent handling each request, by endpoint')
+METRICS.describe('requests_total', 'Requests handled, by endpoint and status code')
+METRICS.describe('candles_total', 'Candles backtested')
+METRICS.describe('indicators_total', 'Indicators added to charts')
+METRICS.describe('trades_total', 'Trades simulated')
+METRICS.describe('bytes_out_total', 'Response bytes sent, after compression')
+
+# The trace of the request being handled by the current thread, if any
+_local = threading.local()
+
+
+def start_trace():
+    """
+    Starts recording the stages and counters of the request handled by the current thread
+
+    Returns:
+        Trace: The new trace
+    """
+
+    _local.trace = Trace()
+    return _local.trace
+
+
+def finish_trace():
+    """
+    Stops recording for the current thread
+
+    Returns:
+        Trace: The finished trace, or None if no trace was started
+    """
+
+    trace = getattr(_local, 'trace', None)
+    _local.trace = None
+    return trace
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a stage of the pipeline. The duration is recorded in the stage histogram and added to the current request's
+    trace, so a stage that runs several times per request is reported once with its total duration
+
+    Args:
+        name (str): The name of the stage, i.e. 'add_indicators'
+    """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        METRICS.observe('stage_seconds', elapsed, stage=name)
+
+        trace = getattr(_local, 'trace', None)
+        if trace is not None:
+            trace.stages[name] = trace.stages.get(name, 0.0) + elapsed
+
+
+def timed(name):
+    """
+    Decorates a function so that every call is timed as a stage of the pipeline
+
+    Args:
+        name (str): The name of the stage
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, amount=1):
+    """
+    Increments a counter, both in the aggregated metrics and in the current request's trace
+
+    Args:
+        name (str): The name of the counter, i.e. 'candles'
+        amount (float): Defaults to 1. The amount to increment the counter by
+    """
+
+    METRICS.inc('{}_total'.format(name), amount)
+
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.counters[name] = trace.counters.get(name, 0) + amount
+
+
+class Profiler(object):
+    """
+    Profiles a random sample of requests with cProfile or pyinstrument, writing one report per profiled request
+
+    Args:
+        sample_rate (float): Defaults to 0. The fraction of requests to profile. Profiling is disabled if 0
+        directory (str): Defaults to 'profiles'. The directory reports are written to
+        kind (str): Defaults to 'cprofile'. Either 'cprofile' (reports are pstats dumps, readable with `python -m
+          pstats` or snakeviz) or 'pyinstrument' (reports are HTML)
+    """
+    def __init__(self, sample_rate=0, directory='profiles', kind='cprofile'):
+        if kind == 'pyinstrument' and pyinstrument is None:
+            raise ValueError('pyinstrument is not installed')
+        if kind not in ('cprofile', 'pyinstrument'):
+            raise ValueError('Unsupported profiler: {}'.format(kind))
+
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.kind = kind
+
+    def start(self):
+        """
+        Starts profiling the current request if it is sampled
+
+        Returns:
+            object: The running profiler, or None if the request is not sampled
+        """
+
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+
+        if self.kind == 'pyinstrument':
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+        else:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        return profiler
+
+    def finish(self, profiler, name):
+        """
+        Stops a profiler returned by `start` and writes its report
+
+        Args:
+            profiler (object): The running profiler
+            name (str): A name identifying the request, used in the report's file name
+        Returns:
+            str: The path of the report
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, '{}-{}-{}'.format(int(time.time() * 1000), name, threading.get_ident()))
+
+        if self.kind == 'pyinstrument':
+            profiler.stop()
+            path += '.html'
+            with open(path, 'w') as report:
+                report.write(profiler.output_html())
+        else:
+            profiler.disable()
+            path += '.prof'
+            profiler.dump_stats(path)
+
+        return path
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join('{}="{}"'.format(name, value) for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,115 @@
+"""
+Contains the performance metrics of backtests: the equity curve of a backtest and a compact summary of it (profit,
+drawdown, risk-adjusted returns, win rate, exposure and fees), both computed from whole columns at once so they are
+cheap enough to compute for every run of a parameter sweep
+"""
+
+import numpy
+
+
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+
+
+def equity_curve(close, ledger, capital):
+    """
+    Computes the value of a backtest's holdings at every candle: the quote currency held while no position is open,
+    and the amount of base currency held valued at the closing price while one is. Fees are deducted when paid, so a
+    position is worth less than its cost at the candle it is opened at
+
+    Args:
+        close (numpy.ndarray): The closing price of every candle
+        ledger (TradeLedger): The ledger of the backtest's positions
+        capital (float): The starting capital of the quote currency
+    Returns:
+        numpy.ndarray: The equity at every candle, in the quote currency
+    """
+
+    num_candles = len(close)
+    entries = numpy.asarray(ledger.entry_index, dtype=numpy.int64)
+    exits = numpy.asarray(ledger.exit_index, dtype=numpy.int64)
+    closed = exits >= 0
+
+    # Every entry and exit sets how much quote and base currency is held until the next one
+    cash = numpy.zeros(num_candles)
+    held = numpy.zeros(num_candles)
+    event = numpy.zeros(num_candles, dtype=bool)
+
+    held[entries] = numpy.asarray(ledger.amount_base)
+    cash[exits[closed]] = numpy.asarray(ledger.proceeds)[closed]
+    event[entries] = True
+    event[exits[closed]] = True
+
+    last_event = numpy.maximum.accumulate(numpy.where(event, numpy.arange(num_candles), -1))
+    before_first = last_event < 0
+    last_event[before_first] = 0
+
+    return numpy.where(before_first, capital, cash[last_event] + held[last_event] * close)
+
+
+def summarize(equity, ledger, capital, trading_fee=0, granularity=None, start=0):
+    """
+    Summarizes a backtest from its equity curve and ledger
+
+    Args:
+        equity (numpy.ndarray): The equity at every candle, as computed by `equity_curve`
+        ledger (TradeLedger): The ledger of the backtest's positions
+        capital (float): The starting capital of the quote currency
+        trading_fee (float): Defaults to 0. The trading fee per market order
+        granularity (int): Defaults to None. The interval of time (in seconds) between successive candles, used to
+          annualize the Sharpe and Sortino ratios. They are per candle when it is not given
+        start (int): Defaults to 0. The position of the first candle to summarize. Only the positions still open at, or
+          opened after, it are counted, and the equity at it is measured against the starting capital
+    Returns:
+        dict[str, -]: The 'profit' and 'return' (as a fraction of the capital) at the last candle, the 'max_drawdown'
+          (as a fraction of the peak), the annualized 'sharpe' and 'sortino' ratios of the per-candle returns, the
+          number of 'trades', 'wins' and 'losses', the 'win_rate' of the closed positions, the 'exposure' (the fraction
+          of candles a position was held over), and the 'fees' paid along with the 'fee_drag' (as a fraction of the
+          capital). Ratios to a capital or equity of zero are 0
+    """
+
+    equity = numpy.concatenate([[capital], numpy.asarray(equity, dtype=numpy.float64)[start:]])
+    num_candles = len(equity) - 1
+
+    entries = numpy.asarray(ledger.entry_index, dtype=numpy.int64)
+    exits = numpy.asarray(ledger.exit_index, dtype=numpy.int64)
+    reported = (exits == -1) | (exits >= start)
+    entries, exits = entries[reported], exits[reported]
+    closed = exits >= 0
+
+    spent = numpy.asarray(ledger.spent)[reported]
+    proceeds = numpy.asarray(ledger.proceeds)[reported]
+    closed_profit = proceeds[closed] - spent[closed]
+
+    # Positions are held from the candle they are opened at until the candle they are closed at
+    held_candles = numpy.where(closed, exits, start + num_candles) - numpy.maximum(entries, start)
+
+    fees = float((spent * trading_fee).sum())
+    if trading_fee < 1:
+        fees += float((proceeds[closed] / (1 - trading_fee) * trading_fee).sum())
+
+    # Once the equity has reached zero nothing is left to lose, so the candles after it (and the drawdown of a
+    # backtest that never had any capital) count as flat rather than dividing by zero
+    peak = numpy.maximum.accumulate(equity)
+    drawdown = numpy.divide(peak - equity, peak, out=numpy.zeros_like(equity), where=peak > 0)
+    if num_candles:
+        returns = numpy.divide(numpy.diff(equity), equity[:-1], out=numpy.zeros(num_candles), where=equity[:-1] > 0)
+    else:
+        returns = numpy.zeros(1)
+    scale = numpy.sqrt(SECONDS_PER_YEAR / granularity) if granularity else 1.0
+
+    deviation = returns.std()
+    downside = numpy.sqrt(numpy.mean(numpy.minimum(returns, 0) ** 2))
+    wins = int((closed_profit > 0).sum())
+
+    return {'profit': float(equity[-1] - capital),
+            'return': float(equity[-1] / capital - 1) if capital > 0 else 0.0,
+            'max_drawdown': float(drawdown.max()),
+            'sharpe': float(returns.mean() / deviation * scale) if deviation > 0 else 0.0,
+            'sortino': float(returns.mean() / downside * scale) if downside > 0 else 0.0,
+            'trades': int(len(entries)),
+            'wins': wins,
+            'losses': int(len(closed_profit) - wins),
+            'win_rate': wins / len(closed_profit) if len(closed_profit) else 0.0,
+            'exposure': float(held_candles.sum() / num_candles) if num_candles else 0.0,
+            'fees': fees,
+            'fee_drag': fees / capital if capital > 0 else 0.0}
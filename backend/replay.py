@@ -0,0 +1,340 @@
+"""
+Contains the replay engine, which backtests a strategy over recordings of 1-minute candles or trades that may be far
+larger than memory. Recordings are read in chunks (memory mapped when they are .npy files), indicators are computed
+per chunk over just enough preceding candles to match their values over the full history, and the strategies are
+evaluated with the same vectorized evaluation as `Chart.run_backtest`, so memory use stays constant however long the
+recording is
+
+Unlike `Chart.run_backtest`, fills are simulated within each candle: stop losses trigger as soon as the candle's low
+reaches them (filling at the stop price, or at the open if the candle gaps below it), limit orders fill when the
+candle's high or low crosses their price, and market orders can be charged slippage on top of the trading fee
+
+Usage:
+    python replay.py candles.npy --pair ETH-USD --capital 1 --buy-strategy 'current-price > sma(9)' \\
+        --sell-strategy 'current-price < sma(9)' [--stop-loss 2] [--slippage 0.05] [--limit-offset 0.1]
+"""
+
+import math
+import time
+from array import array
+
+import numpy
+import pandas
+
+from analysis import compute_indicator, warmup_period
+from decision import compile_strategy
+from ledger import TradeLedger
+
+
+# The number of rows of a recording read into memory at once
+REPLAY_CHUNK_SIZE = 1 << 20
+
+
+def read_rows(path, chunk_size=REPLAY_CHUNK_SIZE):
+    """
+    Reads the rows of a recording in chunks, memory mapping .npy files and streaming .csv files
+
+    Args:
+        path (str): The path of the recording
+        chunk_size (int): Defaults to `REPLAY_CHUNK_SIZE`. The number of rows per chunk
+    Yields:
+        numpy.ndarray: Each chunk of rows, as a float64 matrix
+    """
+
+    if path.endswith('.npy'):
+        with open(path, 'rb') as recording:
+            version = numpy.lib.format.read_magic(recording)
+            if version == (1, 0):
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(recording)
+            else:
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(recording)
+            header_size = recording.tell()
+
+        if fortran_order or len(shape) != 2:
+            raise ValueError('{} is not a C-ordered matrix'.format(path))
+
+        # Each chunk is mapped on its own and unmapped once copied, so the pages read are released as we go
+        for offset in range(0, shape[0], chunk_size):
+            rows = numpy.memmap(path, dtype=dtype, mode='r', shape=(min(chunk_size, shape[0] - offset), shape[1]),
+                                offset=header_size + offset * shape[1] * dtype.itemsize)
+            chunk = numpy.array(rows, dtype=numpy.float64)
+            del rows
+            yield chunk
+        return
+
+    for chunk in pandas.read_csv(path, header=None, chunksize=chunk_size):
+        yield chunk.to_numpy(dtype=numpy.float64)
+
+
+def read_candles(path, granularity=60, chunk_size=REPLAY_CHUNK_SIZE):
+    """
+    Reads the candles of a recording in chunks. Recordings hold either one candle per row in the Coinbase Pro format
+    ([time, low, high, open, close, volume]), in increasing order of time, or one trade per row ([time, price] or
+    [time, price, size]), which are grouped into candles
+
+    Args:
+        path (str): The path of the recording
+        granularity (int): Defaults to 60. The interval of time (in seconds) of the candles trades are grouped into
+        chunk_size (int): Defaults to `REPLAY_CHUNK_SIZE`. The number of rows read at once
+    Yields:
+        numpy.ndarray: Each chunk of candles in the Coinbase Pro format
+    """
+
+    # The trades of the last candle of a chunk may continue in the next chunk, so they are carried over
+    carried = None
+
+    for rows in read_rows(path, chunk_size):
+        if rows.shape[1] == 6:
+            yield rows
+            continue
+
+        if carried is not None:
+            rows = numpy.concatenate([carried, rows])
+
+        starts = rows[:, 0] - rows[:, 0] % granularity
+        boundaries = numpy.flatnonzero(numpy.diff(starts)) + 1
+        last = boundaries[-1] if len(boundaries) else 0
+
+        carried = rows[last:]
+        if last:
+            yield _group_trades(rows[:last], starts[:last])
+
+    if carried is not None and len(carried):
+        yield _group_trades(carried, carried[:, 0] - carried[:, 0] % granularity)
+
+
+def _group_trades(trades, starts):
+    first = numpy.concatenate([[0], numpy.flatnonzero(numpy.diff(starts)) + 1])
+    last = numpy.append(first[1:] - 1, len(trades) - 1)
+    prices = trades[:, 1]
+    volume = numpy.add.reduceat(trades[:, 2], first) if trades.shape[1] > 2 else numpy.zeros(len(first))
+
+    return numpy.column_stack([starts[first], numpy.minimum.reduceat(prices, first),
+                               numpy.maximum.reduceat(prices, first), prices[first], prices[last], volume])
+
+
+class ReplaySimulator(object):
+    """
+    A ReplaySimulator simulates the trades of a strategy over consecutive chunks of candles, carrying any open
+    position and pending order from one chunk to the next. Signals are taken at the close of a candle. Market orders
+    fill at that close (plus slippage), while limit orders are placed `limit_offset` below (buying) or above (selling)
+    it and fill during the next candle if its low or high reaches them, or are cancelled otherwise
+
+    Args:
+        coin_pair (str): The coin pair being traded
+        capital (float): The starting capital of the quote currency
+        trading_fee (float): Defaults to 0. The trading fee per order
+        stop_loss (float): Defaults to 0. The fraction below our buy price at which to sell an open position
+        slippage (float): Defaults to 0. The fraction by which market orders fill at a worse price than the close
+        limit_offset (float): Defaults to 0. The fraction away from the close at which limit orders are placed.
+          Orders are market orders if 0
+    """
+    def __init__(self, coin_pair, capital, trading_fee=0, stop_loss=0, slippage=0, limit_offset=0):
+        self.capital = capital
+        self.trading_fee = trading_fee
+        self.stop_loss = stop_loss
+        self.slippage = slippage
+        self.limit_offset = limit_offset
+
+        self.reserve = capital
+        self.amount_base = 0.0
+        self.stop_price = None
+        self.holding = False
+        # The limit order waiting for the next candle, as (side, price), if any
+        self.pending = None
+
+        # Ledger positions refer to the times of the trades, so memory grows with the trades rather than the candles
+        self.ledger = TradeLedger(coin_pair)
+        self.trade_times = array('q')
+        self.candles = 0
+        self.last_close = math.nan
+
+    def feed(self, candles, buy, sell):
+        """
+        Simulates the trades over a chunk of candles
+
+        Args:
+            candles (numpy.ndarray): The candles in the Coinbase Pro format ([time, low, high, open, close, volume])
+            buy (numpy.ndarray): True at every candle where the buy strategy is satisfied
+            sell (numpy.ndarray): True at every candle where the sell strategy is satisfied
+        """
+
+        times, low, high, opening, close = (candles[:, column] for column in range(5))
+        buy_points = numpy.flatnonzero(buy)
+        sell_points = numpy.flatnonzero(sell)
+
+        num_candles = len(close)
+        index = 0
+
+        while index < num_candles:
+            if self.pending is not None:
+                side, limit = self.pending
+                self.pending = None
+
+                if side == 'buy' and low[index] <= limit:
+                    self.__open(times[index], min(opening[index], limit))
+                    index += 1
+                    continue
+                if side == 'sell' and high[index] >= limit:
+                    self.__close(times[index], max(opening[index], limit), TradeLedger.SIGNAL)
+                    index += 1
+                    continue
+
+            if not self.holding:
+                # Jump straight to the next buy signal
+                next_buy = buy_points.searchsorted(index)
+                if next_buy == len(buy_points):
+                    break
+
+                entry = buy_points[next_buy]
+                if self.limit_offset:
+                    self.pending = ('buy', close[entry] * (1 - self.limit_offset))
+                else:
+                    self.__open(times[entry], close[entry] * (1 + self.slippage))
+
+                index = entry + 1
+                continue
+
+            next_sell = sell_points.searchsorted(index)
+            exit_index = sell_points[next_sell] if next_sell < len(sell_points) else num_candles
+
+            # A stop loss reached within a candle closes the position before that candle's sell signal would
+            if self.stop_price is not None:
+                stopped = numpy.flatnonzero(low[index:exit_index + 1] <= self.stop_price)
+                if len(stopped):
+                    stop_index = index + stopped[0]
+                    price = min(opening[stop_index], self.stop_price) * (1 - self.slippage)
+                    self.__close(times[stop_index], price, TradeLedger.STOP_LOSS)
+                    index = stop_index + 1
+                    continue
+
+            if exit_index == num_candles:
+                break
+
+            if self.limit_offset:
+                self.pending = ('sell', close[exit_index] * (1 + self.limit_offset))
+            else:
+                self.__close(times[exit_index], close[exit_index] * (1 - self.slippage), TradeLedger.SIGNAL)
+
+            index = exit_index + 1
+
+        self.candles += num_candles
+        if num_candles:
+            self.last_close = float(close[-1])
+
+    def report(self):
+        """
+        Returns:
+            dict[str, -]: The number of candles simulated, the final value and profit of the capital (open positions
+              are valued at the last close), and the position report of every trade
+        """
+
+        value = self.reserve + self.amount_base * self.last_close if self.holding else self.reserve
+
+        return {'candles': self.candles, 'value': value, 'profit': value - self.capital,
+                'positions': self.ledger.position_report(numpy.asarray(self.trade_times))}
+
+    def __open(self, time, price):
+        self.trade_times.append(int(time))
+        self.amount_base = self.ledger.open(len(self.trade_times) - 1, float(price), self.reserve, self.trading_fee)
+        self.reserve = 0
+        self.holding = True
+
+        if self.stop_loss:
+            self.stop_price = float(price) * (1 - self.stop_loss)
+
+    def __close(self, time, price, reason):
+        self.trade_times.append(int(time))
+        self.reserve = self.ledger.close(len(self.trade_times) - 1, float(price), self.trading_fee, reason)
+        self.amount_base = 0.0
+        self.stop_price = None
+        self.holding = False
+
+
+def replay_backtest(path, coin_pair, capital, buy_strategy, sell_strategy, indicators=(), granularity=60,
+                    trading_fee=0, stop_loss=0, slippage=0, limit_offset=0, chunk_size=REPLAY_CHUNK_SIZE):
+    """
+    Backtests a strategy over a recording of candles or trades, chunk by chunk
+
+    Args:
+        path (str): The path of the recording, see `read_candles`
+        coin_pair (str): The coin pair being traded
+        capital (float): The starting capital of the quote currency
+        buy_strategy (dict[str, -]): A parsed Expression object containing the conditions for buying
+        sell_strategy (dict[str, -]): A parsed Expression object containing the conditions for selling
+        indicators (list[str]): Defaults to (). Indicators to compute besides the ones the strategies reference
+        granularity (int): Defaults to 60. The interval of time (in seconds) of the candles trades are grouped into
+        trading_fee (float): Defaults to 0. The trading fee per order
+        stop_loss (float): Defaults to 0. The fraction below our buy price at which to sell an open position
+        slippage (float): Defaults to 0. The fraction by which market orders fill at a worse price than the close
+        limit_offset (float): Defaults to 0. The fraction away from the close at which limit orders are placed
+        chunk_size (int): Defaults to `REPLAY_CHUNK_SIZE`. The number of rows read at once
+    Returns:
+        dict[str, -]: The report of the `ReplaySimulator`, plus the number of rows read and the rate they were read at
+    """
+
+    buy_signal = compile_strategy(buy_strategy)
+    sell_signal = compile_strategy(sell_strategy)
+
+    names = list(indicators)
+    names += sorted((buy_signal.indicators | sell_signal.indicators) - set(names))
+
+    # Each chunk's indicators are computed over the preceding candles they depend on as well
+    warmup = max([warmup_period(name) for name in names] + [0])
+    history = numpy.empty(0)
+
+    simulator = ReplaySimulator(coin_pair, capital, trading_fee, stop_loss, slippage, limit_offset)
+    started = time.perf_counter()
+
+    for candles in read_candles(path, granularity, chunk_size):
+        close = candles[:, 4]
+        extended = numpy.concatenate([history, close])
+        frame = pandas.DataFrame({'close': extended}, copy=False)
+
+        columns = {'currentprice': close}
+        for name in names:
+            for column, values in compute_indicator(frame, name).items():
+                columns[column] = values[len(history):]
+
+        simulator.feed(candles, buy_signal(columns), sell_signal(columns))
+        history = extended[len(extended) - warmup:] if warmup else history
+
+    elapsed = time.perf_counter() - started
+    report = simulator.report()
+    report.update(seconds=elapsed, candles_per_second=simulator.candles / elapsed if elapsed else math.inf)
+    return report
+
+
+def main():
+    import argparse
+    import json
+
+    from strategy_parser import parse_strategy
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='A .npy or .csv recording of candles or trades')
+    parser.add_argument('--pair', default='BTC-USD')
+    parser.add_argument('--capital', type=float, default=1.0)
+    parser.add_argument('--buy-strategy', required=True, help="The buy strategy, i.e. 'current-price > sma(9)'")
+    parser.add_argument('--sell-strategy', required=True, help="The sell strategy, i.e. 'current-price < sma(9)'")
+    parser.add_argument('--indicators', nargs='*', default=[], help='Additional indicators to compute')
+    parser.add_argument('--granularity', type=int, default=60, help='The candle size trades are grouped into')
+    parser.add_argument('--trading-fee', type=float, default=0.003)
+    parser.add_argument('--stop-loss', type=float, default=0, help='The stop loss as a percentage')
+    parser.add_argument('--slippage', type=float, default=0, help='The slippage of market orders as a percentage')
+    parser.add_argument('--limit-offset', type=float, default=0,
+                        help='Place limit orders this percentage away from the close instead of market orders')
+    parser.add_argument('--chunk-size', type=int, default=REPLAY_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    report = replay_backtest(args.path, args.pair, args.capital, parse_strategy(args.buy_strategy),
+                             parse_strategy(args.sell_strategy), args.indicators, args.granularity,
+                             args.trading_fee, args.stop_loss / 100, args.slippage / 100, args.limit_offset / 100,
+                             args.chunk_size)
+
+    summary = report.pop('positions')['summary']
+    print(json.dumps(dict(report, **summary), indent=2))
+
+
+if __name__ == '__main__':
+    main()
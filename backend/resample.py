@@ -0,0 +1,77 @@
+"""
+Contains the resampling of candles into coarser granularities, so that every granularity of a coin pair can be derived
+from a single fine-grained base series (i.e., 1 minute candles) instead of being fetched from the exchange separately
+"""
+
+import numpy
+
+
+def resample_candles(candles, granularity):
+    """
+    Groups candles into candles of a coarser granularity. Coarse candles start at multiples of their granularity in
+    epoch time, like those of the exchange: the first open, highest high, lowest low, last close and total volume of the
+    candles within each make up its OHLCV
+
+    Args:
+        candles (numpy.ndarray): A matrix of candles in the Coinbase Pro format ([time, low, high, open, close, volume]),
+          in increasing order of time
+        granularity (int): The interval of time (in seconds) of the coarse candles
+    Returns:
+        numpy.ndarray: The coarse candles in the Coinbase Pro format
+    """
+
+    candles = numpy.asarray(candles, dtype=numpy.float64).reshape(-1, 6)
+    if len(candles) == 0:
+        return numpy.empty((0, 6))
+
+    starts = candles[:, 0] - candles[:, 0] % granularity
+    first = numpy.flatnonzero(numpy.concatenate([[True], starts[1:] != starts[:-1]]))
+    last = numpy.append(first[1:] - 1, len(candles) - 1)
+
+    return numpy.column_stack([starts[first], numpy.minimum.reduceat(candles[:, 1], first),
+                               numpy.maximum.reduceat(candles[:, 2], first), candles[first, 3], candles[last, 4],
+                               numpy.add.reduceat(candles[:, 5], first)])
+
+
+class ResampledSeries(object):
+    """
+    A ResampledSeries holds the coarse candles derived from a base series, and is extended incrementally as base
+    candles arrive: only the last coarse candle (which may still have been forming) and the ones after it are rebuilt
+
+    Args:
+        granularity (int): The interval of time (in seconds) of the coarse candles
+        start (int): The opening time (in epoch seconds) of the first base candle the series is derived from
+    """
+    def __init__(self, granularity, start):
+        self.granularity = granularity
+        self.start = start
+        self.candles = numpy.empty((0, 6))
+        self.base_end = None
+
+    def extend(self, base_candles, base_start):
+        """
+        Folds the base candles that are not part of the series yet into it
+
+        Args:
+            base_candles (numpy.ndarray): The base candles from `base_start` onwards, in increasing order of time
+            base_start (int): The opening time (in epoch seconds) the base candles were requested from
+        Returns:
+            numpy.ndarray: Every coarse candle of the series
+        """
+
+        # Older base candles than the ones already included, or a gap after them, mean starting over
+        last_start = self.candles[-1, 0] if len(self.candles) else self.start
+        if base_start < self.start or base_start > last_start:
+            self.__init__(self.granularity, base_start)
+            last_start = base_start
+
+        if len(base_candles) == 0 or (self.base_end is not None and base_candles[-1, 0] < self.base_end):
+            return self.candles
+
+        tail = base_candles[base_candles[:, 0].searchsorted(last_start):]
+        kept = self.candles[:self.candles[:, 0].searchsorted(last_start)]
+
+        self.candles = numpy.concatenate([kept, resample_candles(tail, self.granularity)])
+        self.base_end = base_candles[-1, 0]
+
+        return self.candles
@@ -0,0 +1,88 @@
+"""
+Contains helpers for encoding and compressing the server's HTTP responses
+"""
+
+import gzip
+import json
+
+from flask import Response, request
+
+from metrics import timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Responses smaller than this are not worth the cost of compressing
+MIN_COMPRESSED_SIZE = 1024
+
+
+def json_response(payload):
+    """
+    Encodes a payload as a JSON response. orjson is used when it is installed, in which case numpy arrays in the
+    payload are encoded natively (with NaN as null); otherwise the payload must only contain plain python values
+
+    Args:
+        payload (dict[str, -]): The payload to encode
+    Returns:
+        flask.Response: A response containing the encoded payload
+    """
+
+    if orjson is not None:
+        body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        body = json.dumps(payload, separators=(',', ':'))
+
+    return Response(body, mimetype='application/json')
+
+
+def binary_response(body):
+    """
+    Wraps a binary buffer (i.e., from `util.serialize_binary`) in a response
+
+    Args:
+        body (bytes): The buffer to send
+    Returns:
+        flask.Response: A response containing the buffer
+    """
+
+    return Response(body, mimetype='application/octet-stream')
+
+
+@timed('compress')
+def compress_response(response):
+    """
+    Compresses a response with brotli or gzip, depending on what the client accepts. Meant to be registered as an
+    `after_request` handler, so responses that are streamed, already encoded or too small are left untouched
+
+    Args:
+        response (flask.Response): The response about to be sent
+    Returns:
+        flask.Response: The (possibly compressed) response
+    """
+
+    if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    body = response.get_data()
+    if len(body) < MIN_COMPRESSED_SIZE:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(body, quality=4))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+
+    return response
@@ -1,9 +1,156 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template
+import os
+import time
 import traceback
 
-from util import period_to_integer, serialize_ohlcv
+from util import period_to_integer, serialize_ohlcv, serialize_columns, serialize_binary
+from responses import binary_response, compress_response, json_response, orjson
 from exchange import Exchange
-from chart import Chart
+from store import CandleStore
+from backtest import memoized_backtest, run_batch, walk_forward_pair
+from cache import ResultCache
+from analysis import convert_to_candles, parse_indicator, split_timeframe
+from downsample import downsample
+from decision import compile_strategy
+from strategy_parser import StrategySyntaxError, optimize, parse_strategy, validate_strategy
+from sweep import run_sweep, validate_templates
+from jobs import Job, JobManager, QueueFullError
+from metrics import METRICS, Profiler, count, finish_trace, start_trace, timed
+
+
+# The maximum number of seconds between two progress events sent for a running job
+JOB_EVENT_INTERVAL = 15
+
+# The smallest number of points results can be downsampled to: the first and last candle plus one bucket's extremes
+MIN_POINTS = 4
+
+# The format results are sent in when none is requested. Row-oriented until every client (i.e., the built dashboard
+# bundle) asks for the format it reads, since older clients expect rows
+DEFAULT_FORMAT = 'rows'
+
+# The number of worker processes each parameter sweep or walk-forward analysis runs on, one per core by default
+SWEEP_WORKERS = int(os.environ.get('SWEEP_WORKERS', 0)) or None
+
+
+def parse_strategies(post_data):
+    """
+    Parses and validates the strategies of a request, which are either JSON expressions (as sent by the dashboard) or
+    strategy text, i.e. 'rsi(14) <= 30 && current-price > ema(15)'. The indicators the strategies reference are
+    derived from them, so listing them in the request is optional
+
+    Args:
+        post_data (dict[str, -]): The body of the request
+    Returns:
+        tuple[list[str], dict[str, -], dict[str, -]]: The indicators to compute, and the buy and sell strategies
+    """
+    import json
+
+    def strategy(value):
+        if isinstance(value, str) and not value.lstrip().startswith('{'):
+            return parse_strategy(value)
+
+        try:
+            parsed = json.loads(value) if isinstance(value, str) else value
+        except ValueError as e:
+            raise StrategySyntaxError('Invalid strategy JSON: {}'.format(e))
+
+        return optimize(validate_strategy(parsed))
+
+    buy_strategy = strategy(post_data.get('buyStrategy', ''))
+    sell_strategy = strategy(post_data.get('sellStrategy', ''))
+
+    indicators = list(post_data.get('indicators') or [])
+    for indicator in indicators:
+        if parse_indicator(indicator) is None:
+            raise StrategySyntaxError('Unsupported indicator: {}'.format(indicator))
+
+    referenced = compile_strategy(buy_strategy).indicators | compile_strategy(sell_strategy).indicators
+    indicators += sorted(referenced - set(indicators))
+
+    return indicators, buy_strategy, sell_strategy
+
+
+def parse_backtest_request():
+    """
+    Parses the parameters of a backtest from the current request, as sent by the dashboard
+
+    Returns:
+        dict[str, -]: The keyword arguments of `backtest.backtest_pair` (other than the exchange)
+    """
+
+    indicators, buy_strategy, sell_strategy = parse_strategies(request.get_json())
+    interval = period_to_integer(request.args.get('period'))
+
+    # Indicators over another timeframe are resampled from the chart's candles, so it must be a multiple of the period
+    for indicator in indicators:
+        timeframe = split_timeframe(indicator)[1]
+        if timeframe is not None and (timeframe < interval or timeframe % interval != 0):
+            raise StrategySyntaxError('The timeframe of {} is not a multiple of the period'.format(indicator))
+
+    # Our Exchange client only accepts coin pairs separated by a '-', not '/'
+    return {'coin_pair': request.args.get('pair').replace('/', '-'),
+            'interval': interval,
+            'start_time': int(request.args.get('startTime')),
+            'capital': float(request.args.get('capital')),
+            'indicators': indicators,
+            'buy_strategy': buy_strategy,
+            'sell_strategy': sell_strategy,
+            'trading_fee': 0.003,
+            'stop_loss': float(request.args.get('stopLoss')) / 100}
+
+
+def parse_max_points():
+    """
+    Parses the optional number of points the data of a backtest is downsampled to from the current request
+
+    Returns:
+        int: The maximum number of points, or None if the data is sent at full resolution
+    """
+
+    max_points = request.args.get('maxPoints')
+    if max_points is None:
+        return None
+
+    max_points = int(max_points)
+    if max_points < MIN_POINTS:
+        raise ValueError('maxPoints must be at least {}'.format(MIN_POINTS))
+
+    return max_points
+
+
+@timed('serialize')
+def serialize_result(data, output_format=DEFAULT_FORMAT, positions=None, performance=None, max_points=None):
+    """
+    Builds the response for the data of a finished backtest
+
+    Args:
+        data (pandas.DataFrame): The chart data after running the backtest
+        output_format (str): Defaults to DEFAULT_FORMAT. One of 'columns', 'rows', 'binary' or 'summary', which only
+          sends the performance summary instead of the data
+        positions (dict[str, -]): Defaults to None. The position report of the backtest, sent alongside the data in
+          the JSON formats
+        performance (dict[str, -]): Defaults to None. The performance summary of the backtest, sent alongside the data
+          in the JSON formats
+        max_points (int): Defaults to None. The number of points to downsample the data to (see
+          `downsample.downsample`). The position report and the total number of rows are always those of the full data
+    Returns:
+        flask.Response: The response containing the serialized data
+    """
+
+    rows = len(data)
+    if output_format == 'summary':
+        return jsonify(response=200, result=performance, rows=rows)
+
+    data = downsample(data, max_points)
+
+    if output_format == 'rows':
+        return jsonify(response=200, result=serialize_ohlcv(data), positions=positions, performance=performance,
+                       rows=rows)
+    if output_format == 'binary':
+        return binary_response(serialize_binary(data))
+
+    return json_response({'response': 200, 'result': serialize_columns(data, numpy_arrays=orjson is not None),
+                          'positions': positions, 'performance': performance, 'rows': rows})
 
 
 """
@@ -19,10 +166,50 @@ class Server(object):
         """
 
         self.exchange = exchange_interface
+        self.results = ResultCache(max_bytes=int(os.environ.get('RESULT_CACHE_BYTES', 128 * 1024 * 1024)),
+                                   sizeof=lambda result: int(result[0].memory_usage(index=True, deep=True).sum()),
+                                   ttl=int(os.environ.get('RESULT_CACHE_TTL', 300)),
+                                   directory=os.environ.get('RESULT_CACHE_DIR'))
+        self.jobs = JobManager(max_workers=int(os.environ.get('JOB_WORKERS', 2)),
+                               max_pending=int(os.environ.get('JOB_QUEUE_SIZE', 32)),
+                               result_ttl=int(os.environ.get('JOB_RESULT_TTL', 600)))
+
+        # A fraction of requests can be profiled in production, i.e. PROFILE_SAMPLE_RATE=0.01 profiles 1 in 100
+        self.profiler = Profiler(sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+                                 directory=os.environ.get('PROFILE_DIR', 'profiles'),
+                                 kind=os.environ.get('PROFILER', 'cprofile'))
 
         self.app = Flask(__name__, static_folder='../www/static', template_folder='../www/static/templates')
+        self.app.before_request(self.__start_request)
+
+        # After request handlers run in the reverse order they are registered, so the response is measured once
+        # it has been compressed
+        self.app.after_request(self.__finish_request)
+        self.app.after_request(compress_response)
         self.__add_backtesting_endpoints()
 
+    def __start_request(self):
+        start_trace()
+        g.profiler = self.profiler.start()
+
+    def __finish_request(self, response):
+        endpoint = request.endpoint or 'unknown'
+
+        if g.get('profiler') is not None:
+            response.headers['X-Profile'] = os.path.basename(self.profiler.finish(g.profiler, endpoint))
+
+        # The size of streamed responses is not known until they have been sent
+        if not response.is_streamed:
+            count('bytes_out', response.content_length or 0)
+
+        trace = finish_trace()
+        if trace is not None:
+            response.headers['Server-Timing'] = trace.server_timing()
+            METRICS.observe('request_seconds', time.perf_counter() - trace.start, endpoint=endpoint)
+
+        METRICS.inc('requests_total', endpoint=endpoint, status=str(response.status_code))
+        return response
+
     def __add_backtesting_endpoints(self):
 
         def index_action():
@@ -33,39 +220,239 @@ class Server(object):
             return jsonify(response=200, result=pairs)
 
         def backtesting_action():
+            try:
+                params = parse_backtest_request()
+                max_points = parse_max_points()
+            except ValueError as e:
+                # Invalid strategies are rejected before any data is fetched
+                return jsonify(response=400, result={'message': str(e)})
+
+            try:
+                data, positions, performance = memoized_backtest(self.exchange, self.results, **params)
+                return serialize_result(data, request.args.get('format', DEFAULT_FORMAT), positions, performance,
+                                        max_points)
+
+            except Exception as e:
+                # Return the exception message if the exchange encounters an error while fetching historical data
+                return jsonify(response=500, result={'message': str(e), 'stack_trace': traceback.format_exc()})
+
+        def zoom_action():
+            import pandas
+
+            try:
+                params = parse_backtest_request()
+                max_points = parse_max_points()
+                if request.args.get('from') is None or request.args.get('to') is None:
+                    raise ValueError('A zoomed range needs both a from and a to time')
+                start, end = int(request.args.get('from')), int(request.args.get('to'))
+            except ValueError as e:
+                return jsonify(response=400, result={'message': str(e)})
+
+            try:
+                # The same request as the one being zoomed into is served from the result cache
+                data, positions, performance = memoized_backtest(self.exchange, self.results, **params)
+                # Label slices include their end, so the zoomed range [start, end) is located by position instead
+                index = data.index
+                zoomed = data.iloc[index.searchsorted(pandas.Timestamp(start, unit='s', tz='UTC')):
+                                   index.searchsorted(pandas.Timestamp(end, unit='s', tz='UTC'))]
+                return serialize_result(zoomed, request.args.get('format', DEFAULT_FORMAT), positions, performance,
+                                        max_points)
+
+            except Exception as e:
+                return jsonify(response=500, result={'message': str(e), 'stack_trace': traceback.format_exc()})
+
+        def submit_job_action():
+            try:
+                params = parse_backtest_request()
+            except ValueError as e:
+                return jsonify(response=400, result={'message': str(e)})
+
+            def backtest_job(progress):
+                return memoized_backtest(self.exchange, self.results, progress=progress, **params)
+
+            try:
+                job = self.jobs.submit(backtest_job)
+            except QueueFullError as e:
+                return jsonify(response=503, result={'message': str(e)})
+
+            return jsonify(response=200, result=job.to_dict())
+
+        def walk_forward_action():
+            try:
+                params = parse_backtest_request()
+                if request.args.get('trainSize') is None or request.args.get('testSize') is None:
+                    raise ValueError('A walk-forward analysis needs both a trainSize and a testSize')
+                train_size = int(request.args.get('trainSize'))
+                test_size = int(request.args.get('testSize'))
+                step = int(request.args.get('step')) if request.args.get('step') else None
+                anchored = request.args.get('anchored', 'false') == 'true'
+            except (TypeError, ValueError) as e:
+                return jsonify(response=400, result={'message': str(e)})
+
+            # Like sweeps, walk-forward analyses are spread over worker processes and run as jobs
+            def walk_forward_job(progress):
+                return walk_forward_pair(self.exchange, train_size=train_size, test_size=test_size, step=step,
+                                         anchored=anchored, max_workers=SWEEP_WORKERS, progress=progress, **params)
+
+            try:
+                job = self.jobs.submit(walk_forward_job, kind='walk_forward')
+            except QueueFullError as e:
+                return jsonify(response=503, result={'message': str(e)})
+
+            return jsonify(response=200, result=job.to_dict())
+
+        def job_status_action(job_id):
+            job = self.jobs.get(job_id)
+            if job is None:
+                return jsonify(response=404, result={'message': 'No job with id {}'.format(job_id)})
+
+            return jsonify(response=200, result=job.to_dict())
+
+        def job_result_action(job_id):
+            job = self.jobs.get(job_id)
+            if job is None:
+                return jsonify(response=404, result={'message': 'No job with id {}'.format(job_id)})
+            if job.status != Job.DONE:
+                return jsonify(response=409, result=job.to_dict())
+
+            try:
+                max_points = parse_max_points()
+            except ValueError as e:
+                return jsonify(response=400, result={'message': str(e)})
+
+            # Sweeps and walk-forward analyses only have summaries, and no chart data to serialize
+            if job.kind != 'backtest':
+                return jsonify(response=200, result=job.result)
+
+            data, positions, performance = job.result
+            return serialize_result(data, request.args.get('format', DEFAULT_FORMAT), positions, performance,
+                                    max_points)
+
+        def job_events_action(job_id):
+            import json
+
+            job = self.jobs.get(job_id)
+            if job is None:
+                return jsonify(response=404, result={'message': 'No job with id {}'.format(job_id)})
+
+            # Server-sent events with the job's progress, ending once the job has finished
+            def stream():
+                while True:
+                    finished = job.is_finished
+                    yield 'event: {}\ndata: {}\n\n'.format(job.status if finished else 'progress',
+                                                           json.dumps(job.to_dict()))
+                    if finished:
+                        return
+                    job.wait_for_change(timeout=JOB_EVENT_INTERVAL)
+
+            return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+        def cancel_job_action(job_id):
+            job = self.jobs.cancel(job_id)
+            if job is None:
+                return jsonify(response=404, result={'message': 'No job with id {}'.format(job_id)})
+
+            return jsonify(response=200, result=job.to_dict())
+
+        def batch_backtesting_action():
             import json
 
-            # Our Exchange client only accepts coin pairs separated by a '-', not '/'
-            coin_pair = request.args.get('pair').replace('/', '-')
             period_length = request.args.get('period')
             capital = float(request.args.get('capital'))
             stop_loss = float(request.args.get('stopLoss')) / 100
             start_time = int(request.args.get('startTime'))
+            include_data = request.args.get('includeData', 'false') == 'true'
 
             post_data = request.get_json()
-            indicators = post_data['indicators']
-            buy_strategy = json.loads(post_data['buyStrategy'])
-            sell_strategy = json.loads(post_data['sellStrategy'])
+            try:
+                indicators, buy_strategy, sell_strategy = parse_strategies(post_data)
+            except ValueError as e:
+                return jsonify(response=400, result={'message': str(e)})
+
+            # Every available pair is backtested unless a list of pairs is given
+            pairs = post_data.get('pairs') or self.exchange.get_available_keypairs()
+            coin_pairs = [pair.replace('/', '-') for pair in pairs]
+
+            results = run_batch(self.exchange, coin_pairs, period_to_integer(period_length), start_time, capital,
+                                indicators, buy_strategy, sell_strategy, trading_fee=0.003, stop_loss=stop_loss)
+
+            # Stream one JSON document per line, so each pair's result is sent as soon as it is done
+            def stream():
+                for kind, result in results:
+                    if kind == 'pair' and 'data' in result:
+                        data = result.pop('data')
+                        positions = result.pop('positions')
+                        if include_data:
+                            result['data'] = serialize_columns(data)
+                            result['positions'] = positions
+
+                    yield json.dumps({'kind': kind, 'response': 500 if 'error' in result else 200,
+                                      'result': result}) + '\n'
+
+            return Response(stream(), mimetype='application/x-ndjson')
+
+        def metrics_action():
+            return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+        def sweep_action():
+            import json
+
+            post_data = request.get_json()
+
+            def strategy(value):
+                return json.loads(value) if isinstance(value, str) else value
 
             try:
-                ohlcv_matrix = self.exchange.get_historical_data(coin_pair, interval=period_to_integer(period_length))
-                chart = Chart(coin_pair, ohlcv_matrix, indicators)
-                chart.run_backtest(capital, buy_strategy, sell_strategy, trading_fee=0.003, stop_loss=stop_loss)
+                coin_pair = post_data['pair'].replace('/', '-')
+                interval = period_to_integer(post_data['period'])
+                start_time = post_data.get('startTime')
+                capital = float(post_data['capital'])
+                buy_template = strategy(post_data['buyStrategy'])
+                sell_template = strategy(post_data['sellStrategy'])
+                parameters = post_data.get('parameters', {})
 
-                result = serialize_ohlcv(chart.get_data(start_time=start_time))
+                # Stop losses are given as percentages, like in /backtest
+                stop_losses = [float(stop_loss) / 100 for stop_loss in post_data.get('stopLoss', [0])]
+                trading_fees = [float(trading_fee) for trading_fee in post_data.get('tradingFee', [0.003])]
 
-                return jsonify(response=200, result=result)
+                # Templates are checked here, since workers would only fail on them after the candles are fetched
+                validate_templates(buy_template, sell_template, parameters)
+            except (KeyError, TypeError, ValueError) as e:
+                return jsonify(response=400, result={'message': 'Invalid sweep request: {}'.format(e)})
 
-            except Exception as e:
-                # Return the exception message if the exchange encounters an error while fetching historical data
-                return jsonify(response=500, result={'message': str(e), 'stack_trace': traceback.format_exc()})
+            # A sweep runs for much longer than a request should, so it is run as a job like long backtests are
+            def sweep_job(progress):
+                ohlcv_matrix = self.exchange.get_historical_data(coin_pair, interval=interval, start=start_time)
+                return run_sweep(coin_pair, interval, convert_to_candles(ohlcv_matrix), capital, buy_template,
+                                 sell_template, parameters, stop_losses=stop_losses, trading_fees=trading_fees,
+                                 max_workers=SWEEP_WORKERS, progress=progress)
+
+            try:
+                job = self.jobs.submit(sweep_job, kind='sweep')
+            except QueueFullError as e:
+                return jsonify(response=503, result={'message': str(e)})
+
+            return jsonify(response=200, result=job.to_dict())
 
         self.add_endpoint(endpoint='/', endpoint_name='index', handler=index_action)
         self.add_endpoint(endpoint='/backtest', endpoint_name='backtest', methods=['POST'], handler=backtesting_action)
+        self.add_endpoint(endpoint='/backtest/zoom', endpoint_name='zoom_backtest', methods=['POST'],
+                          handler=zoom_action)
+        self.add_endpoint(endpoint='/backtest/batch', endpoint_name='batch_backtest', methods=['POST'],
+                          handler=batch_backtesting_action)
+        self.add_endpoint(endpoint='/backtest/walkforward', endpoint_name='walk_forward', methods=['POST'],
+                          handler=walk_forward_action)
+        self.add_endpoint(endpoint='/jobs', endpoint_name='submit_job', methods=['POST'], handler=submit_job_action)
+        self.add_endpoint(endpoint='/jobs/<job_id>', endpoint_name='job_status', handler=job_status_action)
+        self.add_endpoint(endpoint='/jobs/<job_id>', endpoint_name='cancel_job', methods=['DELETE'],
+                          handler=cancel_job_action)
+        self.add_endpoint(endpoint='/jobs/<job_id>/result', endpoint_name='job_result', handler=job_result_action)
+        self.add_endpoint(endpoint='/jobs/<job_id>/events', endpoint_name='job_events', handler=job_events_action)
         self.add_endpoint(endpoint='/pairs', endpoint_name='pairs', handler=pairs_action)
+        self.add_endpoint(endpoint='/metrics', endpoint_name='metrics', handler=metrics_action)
+        self.add_endpoint(endpoint='/sweep', endpoint_name='sweep', methods=['POST'], handler=sweep_action)
 
     def run(self, debug=True):
-        import os
         port = int(os.environ.get('PORT', 5000))
         self.app.run(debug=debug, host='0.0.0.0', port=port)
 
@@ -78,11 +465,14 @@ class EndpointAction(object):
     def __init__(self, action):
         self.action = action
 
-    def __call__(self, *args):
-        return self.action()
+    def __call__(self, *args, **kwargs):
+        return self.action(*args, **kwargs)
 
 
 if __name__ == '__main__':
-    exchange = Exchange()
+    candle_directory = os.environ.get('CANDLE_STORE_DIR', os.path.join(os.path.dirname(__file__), '..', 'data', 'candles'))
+    base_granularity = os.environ.get('BASE_GRANULARITY')
+    exchange = Exchange(store=CandleStore(candle_directory),
+                        base_granularity=period_to_integer(base_granularity) if base_granularity else None)
     server = Server(exchange)
     server.run()
@@ -0,0 +1,224 @@
+"""
+Contains a persistent on-disk store of historical OHLCV candles
+"""
+
+import json
+import os
+import threading
+
+import numpy
+
+
+# The number of candles appended past the stored series before they are compacted into it
+MAX_TAIL_CANDLES = 4096
+
+# The size (in bytes) of a stored candle
+CANDLE_BYTES = 6 * 8
+
+
+class CandleStore(object):
+    """
+    A CandleStore persists raw candles on disk as one memory-mapped numpy array per (coin pair, granularity), along with
+    the time ranges that have already been fetched from the exchange. Each stored row is a single candle whose first
+    column is its opening time in epoch seconds, sorted in ascending order of time
+
+    Candles past the end of the stored series (i.e., the most recent candles, including the one still forming) are
+    appended to a small tail file instead, so keeping a series up to date never rewrites it. The tail is compacted
+    into the series once it grows past `MAX_TAIL_CANDLES`
+
+    Args:
+        directory (str): The directory the candle files are stored in. It is created if it does not exist
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.RLock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self, coin_pair, granularity, start=None, end=None):
+        """
+        Loads the stored candles for a coin pair and granularity within the time range [start, end)
+
+        Args:
+            coin_pair (str): The coin pair the candles belong to
+            granularity (int): The interval of time (in seconds) between successive candles
+            start (int): Defaults to None. The earliest opening time (in epoch seconds) of the returned candles
+            end (int): Defaults to None. The opening time (in epoch seconds) at which to stop returning candles
+        Returns:
+            numpy.ndarray: A read-only matrix with one candle per row
+        """
+
+        with self.lock:
+            candles = self.__load_series(coin_pair, granularity)
+            tail = self.__load_tail(coin_pair, granularity)
+
+        # Tail candles replace any stored candles from the opening time of the first one on
+        if len(tail) > 0:
+            candles = candles[:candles[:, 0].searchsorted(tail[0, 0], side='left')]
+
+        parts = [_window(rows, start, end) for rows in (candles, tail)]
+        if len(parts[1]) == 0:
+            return parts[0]
+        if len(parts[0]) == 0:
+            return parts[1]
+
+        combined = numpy.concatenate(parts)
+        combined.flags.writeable = False
+        return combined
+
+    def missing_ranges(self, coin_pair, granularity, start, end):
+        """
+        Determines which parts of the time range [start, end) have not been fetched from the exchange yet
+
+        Args:
+            coin_pair (str): The coin pair the candles belong to
+            granularity (int): The interval of time (in seconds) between successive candles
+            start (int): The start of the time range in epoch seconds
+            end (int): The end of the time range in epoch seconds
+        Returns:
+            list[tuple[int, int]]: A list of [start, end) time ranges that are not covered by the store
+        """
+
+        missing = []
+        cursor = start
+
+        for covered_start, covered_end in self.__load_coverage(coin_pair, granularity):
+            if covered_end <= cursor:
+                continue
+            if covered_start >= end:
+                break
+            if covered_start > cursor:
+                missing.append((cursor, covered_start))
+            cursor = max(cursor, covered_end)
+
+        if cursor < end:
+            missing.append((cursor, end))
+
+        return missing
+
+    def merge(self, coin_pair, granularity, candles, start, end):
+        """
+        Merges freshly fetched candles into the store and records [start, end) as fetched. Candles that are already
+        stored are replaced by their fresh counterparts
+
+        Args:
+            coin_pair (str): The coin pair the candles belong to
+            granularity (int): The interval of time (in seconds) between successive candles
+            candles (list | numpy.ndarray): A matrix of candles fetched from the exchange, in any order
+            start (int): The start of the fetched time range in epoch seconds
+            end (int): The end of the fetched time range in epoch seconds
+        """
+
+        fresh = numpy.asarray(candles, dtype=float).reshape(-1, 6)
+        _, first = numpy.unique(fresh[:, 0], return_index=True)
+        fresh = fresh[first]
+
+        with self.lock:
+            series = self.__load_series(coin_pair, granularity)
+            tail = self.__load_tail(coin_pair, granularity)
+            last = tail[-1, 0] if len(tail) > 0 else series[-1, 0] if len(series) > 0 else None
+
+            if len(fresh) > 0 and (last is None or fresh[0, 0] >= last):
+                # The fresh candles extend the series, replacing the last stored candle if it was still forming
+                replaced = int(fresh[0, 0] == last and len(tail) > 0)
+                self.__append_tail(coin_pair, granularity, fresh, len(tail) - replaced)
+
+                if len(tail) - replaced + len(fresh) > MAX_TAIL_CANDLES:
+                    self.__compact(coin_pair, granularity)
+            elif len(fresh) > 0:
+                # Backfills that precede the end of the series are merged in by rewriting it. Fresh candles come first
+                # so that numpy.unique keeps them over the stored ones
+                combined = numpy.concatenate([fresh, self.load(coin_pair, granularity)])
+                _, first = numpy.unique(combined[:, 0], return_index=True)
+                self.__save(self.__candle_path(coin_pair, granularity), combined[first])
+                self.__remove_tail(coin_pair, granularity)
+
+            coverage = self.__load_coverage(coin_pair, granularity) + [(start, end)]
+            self.__save_coverage(coin_pair, granularity, coverage)
+
+    def __candle_path(self, coin_pair, granularity):
+        return os.path.join(self.directory, '{}_{}.npy'.format(coin_pair, granularity))
+
+    def __tail_path(self, coin_pair, granularity):
+        return os.path.join(self.directory, '{}_{}.tail'.format(coin_pair, granularity))
+
+    def __coverage_path(self, coin_pair, granularity):
+        return os.path.join(self.directory, '{}_{}.json'.format(coin_pair, granularity))
+
+    def __load_series(self, coin_pair, granularity):
+        path = self.__candle_path(coin_pair, granularity)
+
+        if not os.path.exists(path):
+            return numpy.empty((0, 6))
+
+        return numpy.load(path, mmap_mode='r')
+
+    def __load_tail(self, coin_pair, granularity):
+        path = self.__tail_path(coin_pair, granularity)
+
+        if not os.path.exists(path):
+            return numpy.empty((0, 6))
+
+        with open(path, 'rb') as tail_file:
+            data = tail_file.read()
+
+        # Ignore a partially written candle, i.e. if the process died while appending it
+        return numpy.frombuffer(data[:len(data) - len(data) % CANDLE_BYTES], dtype=numpy.float64).reshape(-1, 6)
+
+    def __append_tail(self, coin_pair, granularity, candles, position):
+        path = self.__tail_path(coin_pair, granularity)
+
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as tail_file:
+            tail_file.seek(position * CANDLE_BYTES)
+            tail_file.write(numpy.ascontiguousarray(candles, dtype=numpy.float64).tobytes())
+            tail_file.truncate()
+
+    def __compact(self, coin_pair, granularity):
+        self.__save(self.__candle_path(coin_pair, granularity), numpy.array(self.load(coin_pair, granularity)))
+        self.__remove_tail(coin_pair, granularity)
+
+    def __remove_tail(self, coin_pair, granularity):
+        try:
+            os.remove(self.__tail_path(coin_pair, granularity))
+        except FileNotFoundError:
+            pass
+
+    def __load_coverage(self, coin_pair, granularity):
+        path = self.__coverage_path(coin_pair, granularity)
+
+        if not os.path.exists(path):
+            return []
+
+        with open(path) as coverage_file:
+            return [tuple(time_range) for time_range in json.load(coverage_file)]
+
+    def __save_coverage(self, coin_pair, granularity, coverage):
+
+        # Collapse overlapping and adjacent ranges so lookups stay cheap as the store grows
+        merged = []
+        for start, end in sorted(coverage):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        path = self.__coverage_path(coin_pair, granularity)
+        with open(path + '.tmp', 'w') as coverage_file:
+            json.dump(merged, coverage_file)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def __save(path, candles):
+
+        # Write to a temporary file first so concurrent readers never observe a partially written array
+        with open(path + '.tmp', 'wb') as candle_file:
+            numpy.save(candle_file, candles)
+        os.replace(path + '.tmp', path)
+
+
+def _window(candles, start, end):
+    times = candles[:, 0]
+    lo = 0 if start is None else times.searchsorted(start, side='left')
+    hi = len(times) if end is None else times.searchsorted(end, side='left')
+
+    return candles[lo:hi]
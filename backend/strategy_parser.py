@@ -0,0 +1,315 @@
+"""
+Contains a parser for the strategy grammar described in the README, mirroring the dashboard's parser
+(www/react/util/parser/parser.ts), so strategies can be posted as text:
+
+    <integer>   := /([+-]?[1-9]\\d*|0)/
+    <real>      := /-?\\d+(\\.\\d*)?/
+    <timeframe> := /\\d+[mhd]/
+    <indicator> := <real> | current-price | sma(<integer>[, <timeframe>]) | ema(<integer>[, <timeframe>])
+                 | rsi(<integer>[, <timeframe>])
+    <op>        := = | > | < | >= | <= | !=
+    <exp>       := <indicator> <op> <indicator> | (<exp>) | !(<exp>) | <exp> && <exp> | <exp> || <exp>
+
+Parsing produces the same expression objects as the dashboard, i.e. `current-price > sma(9)` becomes
+{"kind": "GT", "l": {"kind": "currentprice"}, "r": {"kind": "sma", "period": 9}}. Parsed strategies are validated and
+optimized (comparisons between constants are folded), and the resulting plans are cached by their text.
+
+Indicators given a timeframe, i.e. `sma(9, 1h)`, are computed over candles of that timeframe (resampled from the chart's
+candles) and become {"kind": "sma", "period": 9, "timeframe": "1h"}.
+"""
+
+import re
+
+from analysis import parse_indicator
+from cache import LRUCache
+
+
+# The operators of the grammar, longest first so that '>=' is not read as '>'
+OPERATORS = {'>=': 'GEq', '<=': 'LEq', '!=': 'NEq', '=': 'Eq', '>': 'GT', '<': 'LT'}
+COMPARISONS = ('Eq', 'LT', 'LEq', 'GT', 'GEq', 'GEQ')
+
+TOKEN_PATTERN = re.compile(r'\s*(?:(?P<timeframe>\d+[mhd])|(?P<real>[+-]?\d+(?:\.\d*)?)|'
+                           r'(?P<name>current-price|sma|ema|rsi)|(?P<symbol>&&|\|\||>=|<=|!=|[=<>!(),]))')
+TIMEFRAME_PATTERN = re.compile(r'[1-9]\d*[mhd]')
+
+# Parsed plans keyed by strategy text. The least recently used entry is evicted once the cache is full. Strategies are
+# parsed from request, job and batch threads alike, so the cache is shared through a thread-safe LRU
+MAX_CACHED_PLANS = 1024
+_plans = LRUCache(MAX_CACHED_PLANS, lambda plan: 1)
+
+
+class StrategySyntaxError(ValueError):
+    """
+    Raised when a strategy does not follow the grammar, or references an indicator that is not supported
+
+    Args:
+        message (str): A description of the error
+        position (int): Defaults to None. The offset in the strategy text at which the error was found
+    """
+    def __init__(self, message, position=None):
+        if position is not None:
+            message = '{} at position {}'.format(message, position)
+
+        super(StrategySyntaxError, self).__init__(message)
+        self.position = position
+
+
+def parse_strategy(text):
+    """
+    Parses, validates and optimizes the text of a strategy. Plans are cached by text, so the returned expression is
+    shared and must not be modified
+
+    Args:
+        text (str): A strategy in the README grammar, i.e. 'rsi(14) <= 30 && current-price > ema(15)'. An empty
+          strategy is always executed
+    Returns:
+        dict[str, -]: The parsed Expression object
+    """
+
+    text = text.strip()
+    return _plans.get_or_compute(text, lambda: optimize(_Parser(text).parse()) if text else {})
+
+
+def validate_strategy(strategy):
+    """
+    Checks that a parsed strategy (i.e., posted as JSON) is well formed and only references supported indicators, so
+    that invalid strategies are rejected before any data is fetched
+
+    Args:
+        strategy (dict[str, -]): A parsed Expression object
+    Returns:
+        dict[str, -]: The strategy
+    """
+
+    if not isinstance(strategy, dict):
+        raise StrategySyntaxError('A strategy must be an object, not {}'.format(type(strategy).__name__))
+    if len(strategy) == 0:
+        return strategy
+
+    kind = strategy.get('kind')
+
+    if kind in ('And', 'Or'):
+        validate_strategy(strategy.get('e1'))
+        validate_strategy(strategy.get('e2'))
+    elif kind == 'Not':
+        validate_strategy(strategy.get('e'))
+    elif kind == 'Const':
+        if not isinstance(strategy.get('val'), bool):
+            raise StrategySyntaxError('Constant expressions must be true or false')
+    elif kind in COMPARISONS:
+        for side in ('l', 'r'):
+            _validate_operand(strategy.get(side))
+    else:
+        raise StrategySyntaxError('Unknown expression kind: {}'.format(kind))
+
+    return strategy
+
+
+def optimize(strategy):
+    """
+    Simplifies a parsed strategy: comparisons between two numbers are folded into constant expressions, which are then
+    propagated through And, Or and Not, and double negations are removed
+
+    Args:
+        strategy (dict[str, -]): A parsed Expression object
+    Returns:
+        dict[str, -]: An equivalent, possibly simpler, Expression object
+    """
+
+    if len(strategy) == 0:
+        return strategy
+
+    kind = strategy['kind']
+
+    if kind in ('And', 'Or'):
+        e1, e2 = optimize(strategy['e1']), optimize(strategy['e2'])
+
+        # A constant either decides the expression or can be dropped from it
+        for constant, other in ((e1, e2), (e2, e1)):
+            if constant['kind'] == 'Const':
+                if constant['val'] == (kind == 'Or'):
+                    return constant
+                return other
+
+        return {'kind': kind, 'e1': e1, 'e2': e2}
+
+    if kind == 'Not':
+        e = optimize(strategy['e'])
+
+        if e['kind'] == 'Const':
+            return {'kind': 'Const', 'val': not e['val']}
+        if e['kind'] == 'Not':
+            return e['e']
+
+        return {'kind': 'Not', 'e': e}
+
+    if kind in COMPARISONS and strategy['l']['kind'] == 'real' and strategy['r']['kind'] == 'real':
+        lv, rv = float(strategy['l']['val']), float(strategy['r']['val'])
+        result = {'Eq': lv == rv, 'LT': lv < rv, 'LEq': lv <= rv, 'GT': lv > rv}.get(kind, lv >= rv)
+        return {'kind': 'Const', 'val': result}
+
+    return strategy
+
+
+def _validate_operand(operand):
+    if not isinstance(operand, dict):
+        raise StrategySyntaxError('A comparison needs two operands')
+
+    kind = operand.get('kind')
+
+    if kind == 'currentprice':
+        return
+    if kind == 'real':
+        try:
+            float(operand.get('val'))
+        except (TypeError, ValueError):
+            raise StrategySyntaxError('Invalid number: {}'.format(operand.get('val')))
+        return
+
+    indicator = '{}-{}'.format(kind, operand.get('period'))
+    parsed = parse_indicator(indicator)
+
+    timeframe = operand.get('timeframe')
+    if timeframe is not None and not (isinstance(timeframe, str) and TIMEFRAME_PATTERN.fullmatch(timeframe)):
+        raise StrategySyntaxError('Invalid timeframe of {}: {}'.format(indicator, timeframe))
+
+    # Bands produce several columns, so they cannot be compared directly
+    if parsed is None or parsed[0] == 'bollinger':
+        raise StrategySyntaxError('Unsupported indicator: {}'.format(indicator))
+    if parsed[1][0] < 2:
+        raise StrategySyntaxError('The period of {} must be at least 2'.format(indicator))
+
+
+class _Parser(object):
+    """
+    A recursive descent parser over the tokens of a strategy. Like the dashboard's parser, && binds tighter than ||
+    and both are right associative
+    """
+    def __init__(self, text):
+        self.text = text
+        self.tokens = self.__tokenize(text)
+        self.index = 0
+
+    def parse(self):
+        expression = self.__or()
+
+        if self.index < len(self.tokens):
+            _, value, position = self.tokens[self.index]
+            raise StrategySyntaxError("Unexpected '{}'".format(value), position)
+
+        return expression
+
+    def __tokenize(self, text):
+        tokens = []
+        position = 0
+
+        while position < len(text):
+            if text[position:].strip() == '':
+                break
+
+            match = TOKEN_PATTERN.match(text, position)
+            if match is None:
+                start = len(text) - len(text[position:].lstrip())
+                raise StrategySyntaxError("Unexpected '{}'".format(text[start]), start)
+
+            kind = match.lastgroup
+            tokens.append((kind, match.group(kind), match.start(kind)))
+            position = match.end()
+
+        return tokens
+
+    def __peek(self):
+        return self.tokens[self.index] if self.index < len(self.tokens) else (None, None, len(self.text))
+
+    def __expect(self, value):
+        kind, token, position = self.__peek()
+        if token != value:
+            raise StrategySyntaxError("Expected '{}'".format(value), position)
+
+        self.index += 1
+
+    def __or(self):
+        expression = self.__and()
+
+        if self.__peek()[1] == '||':
+            self.index += 1
+            return {'kind': 'Or', 'e1': expression, 'e2': self.__or()}
+
+        return expression
+
+    def __and(self):
+        expression = self.__atom()
+
+        if self.__peek()[1] == '&&':
+            self.index += 1
+            return {'kind': 'And', 'e1': expression, 'e2': self.__and()}
+
+        return expression
+
+    def __atom(self):
+        kind, token, position = self.__peek()
+
+        if token == '(':
+            self.index += 1
+            expression = self.__or()
+            self.__expect(')')
+            return expression
+
+        if token == '!':
+            self.index += 1
+            self.__expect('(')
+            expression = self.__or()
+            self.__expect(')')
+            return {'kind': 'Not', 'e': expression}
+
+        left = self.__indicator()
+
+        kind, token, position = self.__peek()
+        if token not in OPERATORS:
+            raise StrategySyntaxError('Expected a comparison', position)
+        self.index += 1
+
+        comparison = {'kind': OPERATORS[token], 'l': left, 'r': self.__indicator()}
+
+        # As in the dashboard, a != b is parsed as !(a = b)
+        if comparison['kind'] == 'NEq':
+            return {'kind': 'Not', 'e': dict(comparison, kind='Eq')}
+
+        return comparison
+
+    def __indicator(self):
+        kind, token, position = self.__peek()
+
+        if kind == 'real':
+            self.index += 1
+            return {'kind': 'real', 'val': token}
+
+        if token == 'current-price':
+            self.index += 1
+            return {'kind': 'currentprice'}
+
+        if kind == 'name':
+            self.index += 1
+            self.__expect('(')
+
+            _, period, period_position = self.__peek()
+            if period is None or not re.fullmatch(r'[+-]?[1-9]\d*|0', period):
+                raise StrategySyntaxError('Expected an integer period', period_position)
+            self.index += 1
+
+            operand = {'kind': token, 'period': int(period)}
+
+            if self.__peek()[1] == ',':
+                self.index += 1
+                timeframe_kind, timeframe, timeframe_position = self.__peek()
+                if timeframe_kind != 'timeframe':
+                    raise StrategySyntaxError('Expected a timeframe', timeframe_position)
+                self.index += 1
+                operand['timeframe'] = timeframe
+
+            self.__expect(')')
+
+            _validate_operand(operand)
+            return operand
+
+        raise StrategySyntaxError('Expected an indicator', position)
@@ -0,0 +1,288 @@
+"""
+Contains streaming counterparts of the indicators in `analysis`. Each one is updated in constant time per appended
+candle, follows the same warm-up and seeding rules as TA-Lib, and can be checkpointed and resumed later
+"""
+
+import math
+from collections import deque
+
+from analysis import parse_indicator, split_timeframe
+
+
+class StreamingIndicator(object):
+    """
+    Base class of every streaming indicator
+
+    Args:
+        name (str): The indicator string, i.e. 'sma-9'
+    """
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.last_time = None
+
+    def update(self, close, time=None):
+        """
+        Appends a candle to the indicator
+
+        Args:
+            close (float): The closing price of the candle
+            time (int): Defaults to None. The opening time of the candle in epoch seconds, recorded for resuming
+        Returns:
+            float: The new indicator value, or NaN while the indicator is warming up
+        """
+
+        self.count += 1
+        if time is not None:
+            self.last_time = time
+
+        return self._update(float(close))
+
+    def values(self):
+        """
+        Returns:
+            dict[str, float]: A mapping of each column the indicator produces to its current value, named as in
+              `analysis.compute_indicator`
+        """
+
+        return {self.name: self.value}
+
+    def state(self):
+        """
+        Returns:
+            dict[str, -]: A JSON serializable checkpoint of the indicator, which can be restored with `from_state`
+        """
+
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Restores an indicator from a checkpoint produced by `state`
+
+        Args:
+            state (dict[str, -]): The checkpoint to restore
+        Returns:
+            StreamingIndicator: The restored indicator
+        """
+
+        indicator = cls.__new__(cls)
+        indicator.__dict__.update(state)
+        return indicator
+
+    def _update(self, close):
+        raise NotImplementedError
+
+
+class StreamingSMA(StreamingIndicator):
+    """
+    A simple moving average over the last `period` closing prices
+    """
+    def __init__(self, name, period):
+        super(StreamingSMA, self).__init__(name)
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+        self.value = math.nan
+
+    def _update(self, close):
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+
+        self.window.append(close)
+        self.total += close
+
+        if len(self.window) == self.period:
+            self.value = self.total / self.period
+
+        return self.value
+
+    def state(self):
+        return {**super(StreamingSMA, self).state(), 'window': list(self.window)}
+
+    @classmethod
+    def from_state(cls, state):
+        indicator = super(StreamingSMA, cls).from_state(state)
+        indicator.window = deque(state['window'], maxlen=state['period'])
+        return indicator
+
+
+class StreamingEMA(StreamingIndicator):
+    """
+    An exponential moving average seeded, like TA-Lib, with the simple average of the first `period` closing prices
+    """
+    def __init__(self, name, period):
+        super(StreamingEMA, self).__init__(name)
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.seed = 0.0
+        self.value = math.nan
+
+    def _update(self, close):
+        if self.count < self.period:
+            self.seed += close
+        elif self.count == self.period:
+            self.value = (self.seed + close) / self.period
+        else:
+            self.value += (close - self.value) * self.alpha
+
+        return self.value
+
+
+class StreamingRSI(StreamingIndicator):
+    """
+    Wilder's relative strength index, seeded like TA-Lib with the average gain and loss of the first `period` changes
+    """
+    def __init__(self, name, period):
+        super(StreamingRSI, self).__init__(name)
+        self.period = period
+        self.previous = None
+        self.gain = 0.0
+        self.loss = 0.0
+        self.value = math.nan
+
+    def _update(self, close):
+        if self.previous is None:
+            self.previous = close
+            return self.value
+
+        change = close - self.previous
+        self.previous = close
+
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+
+        # The first `period` changes are summed and then averaged to seed the smoothed gain and loss
+        if self.count <= self.period + 1:
+            self.gain += gain
+            self.loss += loss
+
+            if self.count < self.period + 1:
+                return self.value
+
+            self.gain /= self.period
+            self.loss /= self.period
+        else:
+            self.gain = (self.gain * (self.period - 1) + gain) / self.period
+            self.loss = (self.loss * (self.period - 1) + loss) / self.period
+
+        total = self.gain + self.loss
+        self.value = 100.0 * (self.gain / total) if abs(total) >= 1e-14 else 0.0
+
+        return self.value
+
+
+class StreamingBollinger(StreamingIndicator):
+    """
+    Bollinger bands `std_dev` population standard deviations around the simple moving average of the last `period`
+    closing prices. The middle band is the indicator's value
+    """
+    def __init__(self, name, period, std_dev):
+        super(StreamingBollinger, self).__init__(name)
+        self.period = period
+        self.std_dev = std_dev
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.value = math.nan
+        self.upper = math.nan
+        self.lower = math.nan
+
+    def _update(self, close):
+        if len(self.window) == self.period:
+            trailing = self.window[0]
+            self.total -= trailing
+            self.total_squares -= trailing * trailing
+
+        self.window.append(close)
+        self.total += close
+        self.total_squares += close * close
+
+        if len(self.window) == self.period:
+            mean = self.total / self.period
+            variance = self.total_squares / self.period - mean * mean
+            deviation = math.sqrt(variance) * self.std_dev if variance > 0 else 0.0
+
+            self.value = mean
+            self.upper = mean + deviation
+            self.lower = mean - deviation
+
+        return self.value
+
+    def values(self):
+        return {'{}-upper'.format(self.name): self.upper, self.name: self.value,
+                '{}-lower'.format(self.name): self.lower}
+
+    def state(self):
+        return {**super(StreamingBollinger, self).state(), 'window': list(self.window)}
+
+    @classmethod
+    def from_state(cls, state):
+        indicator = super(StreamingBollinger, cls).from_state(state)
+        indicator.window = deque(state['window'], maxlen=state['period'])
+        return indicator
+
+
+STREAMING_INDICATORS = {
+    'sma': StreamingSMA,
+    'ema': StreamingEMA,
+    'rsi': StreamingRSI,
+    'bollinger': StreamingBollinger
+}
+
+
+def create_streaming_indicator(indicator):
+    """
+    Creates the streaming counterpart of an indicator string
+
+    Args:
+        indicator (str): The indicator string, i.e. 'sma-9', 'ema-15', 'rsi-14' or 'bollinger-21-2'
+    Returns:
+        StreamingIndicator: A fresh streaming indicator
+    """
+
+    parsed = parse_indicator(indicator)
+    if parsed is None or split_timeframe(indicator)[1] is not None:
+        raise ValueError('Unsupported indicator: {}'.format(indicator))
+
+    kind, params = parsed
+    return STREAMING_INDICATORS[kind](indicator, *params)
+
+
+def restore_streaming_indicator(state):
+    """
+    Restores a streaming indicator of any kind from a checkpoint produced by its `state` method
+
+    Args:
+        state (dict[str, -]): The checkpoint to restore
+    Returns:
+        StreamingIndicator: The restored indicator
+    """
+
+    kind, _ = parse_indicator(state['name'])
+    return STREAMING_INDICATORS[kind].from_state(state)
+
+
+def resume_from_store(indicator, store, coin_pair, granularity, end=None):
+    """
+    Brings a (possibly restored) streaming indicator up to date with the candles in a candle store, feeding it every
+    stored candle opened after the last one it has seen
+
+    Args:
+        indicator (StreamingIndicator): The indicator to update
+        store (CandleStore): The store holding the candles
+        coin_pair (str): The coin pair the candles belong to
+        granularity (int): The interval of time (in seconds) between successive candles
+        end (int): Defaults to None. The opening time (in epoch seconds) at which to stop feeding candles
+    Returns:
+        StreamingIndicator: The updated indicator
+    """
+
+    start = None if indicator.last_time is None else indicator.last_time + 1
+    candles = store.load(coin_pair, granularity, start=start, end=end)
+
+    # Stored candles are in the Coinbase Pro format: [time, low, high, open, close, volume]
+    for time, close in zip(candles[:, 0].tolist(), candles[:, 4].tolist()):
+        indicator.update(close, time)
+
+    return indicator
@@ -0,0 +1,224 @@
+"""
+Contains a parameter sweep (grid search) that runs many backtests over the same candles on a process pool
+
+Strategies are given as templates in which any value may be a placeholder such as "$fast", i.e.
+{"kind": "GT", "l": {"kind": "sma", "period": "$fast"}, "r": {"kind": "sma", "period": "$slow"}}. Every combination
+of placeholder values, stop losses and trading fees is backtested and the results are ranked by profit. Stop losses
+are given as percentages, like everywhere else.
+
+Usage:
+    python sweep.py --pair ETH-BTC --period 1h --capital 1 --buy-strategy '<json>' --sell-strategy '<json>' \\
+        --param fast=5,9,12 --param slow=15,21 --stop-loss 0,1,2 --trading-fee 0.003
+"""
+
+import itertools
+
+from analysis import compute_indicator, convert_to_candles, convert_to_dataframe
+from chart import INDICATOR_CACHE, backtest_signals
+from decision import compile_strategy
+from strategy_parser import validate_strategy
+from workers import map_shared, shared_matrix
+
+
+# A dataframe viewing the columns of the candles shared with a worker process (for computing indicators), and the path
+# they are mapped from. Only the time index is built per worker
+_worker_frame = None
+_worker_path = None
+
+
+def substitute(template, values):
+    """
+    Replaces every "$name" placeholder in a strategy template with its value
+
+    Args:
+        template (dict[str, -]): A strategy that may contain placeholders
+        values (dict[str, -]): A mapping of placeholder names to values
+    Returns:
+        dict[str, -]: The strategy with every placeholder replaced
+    """
+
+    if isinstance(template, dict):
+        return {key: substitute(value, values) for key, value in template.items()}
+    if isinstance(template, list):
+        return [substitute(value, values) for value in template]
+    if isinstance(template, str) and template.startswith('$'):
+        return values[template[1:]]
+
+    return template
+
+
+def placeholders(template):
+    """
+    Finds the names of every "$name" placeholder in a strategy template
+
+    Args:
+        template (dict[str, -]): A strategy that may contain placeholders
+    Returns:
+        set[str]: The names of the placeholders, without the "$"
+    """
+
+    if isinstance(template, dict):
+        return set().union(*[placeholders(value) for value in template.values()])
+    if isinstance(template, list):
+        return set().union(*[placeholders(value) for value in template])
+    if isinstance(template, str) and template.startswith('$'):
+        return {template[1:]}
+
+    return set()
+
+
+def validate_templates(buy_template, sell_template, parameters):
+    """
+    Checks that a sweep can run before any data is fetched for it: every placeholder must have values to try, and every
+    combination of them must turn the templates into valid strategies. Raises a ValueError otherwise
+
+    Args:
+        buy_template (dict[str, -]): The buy strategy, which may contain "$name" placeholders
+        sell_template (dict[str, -]): The sell strategy, which may contain "$name" placeholders
+        parameters (dict[str, list]): A mapping of placeholder names to the values to try
+    """
+
+    if not isinstance(parameters, dict):
+        raise ValueError('The parameters must map placeholder names to the values to try')
+
+    for name, values in parameters.items():
+        if not isinstance(values, list) or len(values) == 0:
+            raise ValueError('No values given for ${}'.format(name))
+
+    missing = (placeholders(buy_template) | placeholders(sell_template)) - set(parameters)
+    if missing:
+        raise ValueError('No values given for {}'.format(', '.join('$' + name for name in sorted(missing))))
+
+    for combination in expand_grid(parameters, [0], [0]):
+        for template in (buy_template, sell_template):
+            validate_strategy(substitute(template, combination['params']))
+
+
+def expand_grid(parameters, stop_losses, trading_fees):
+    """
+    Enumerates every combination of strategy parameters, stop losses and trading fees
+
+    Args:
+        parameters (dict[str, list]): A mapping of placeholder names to the values to try
+        stop_losses (list[float]): The stop losses to try
+        trading_fees (list[float]): The trading fees to try
+    Returns:
+        list[dict[str, -]]: One dictionary per combination, with 'params', 'stop_loss' and 'trading_fee' keys
+    """
+
+    names = sorted(parameters)
+    combinations = []
+
+    for values in itertools.product(*[parameters[name] for name in names]):
+        for stop_loss, trading_fee in itertools.product(stop_losses, trading_fees):
+            combinations.append({'params': dict(zip(names, values)), 'stop_loss': stop_loss,
+                                 'trading_fee': trading_fee})
+
+    return combinations
+
+
+def _run_combination(task):
+    global _worker_frame, _worker_path
+
+    pair, granularity, capital, buy_template, sell_template, combination = task
+    candles, path = shared_matrix()
+
+    if path != _worker_path:
+        _worker_frame = convert_to_dataframe(candles, copy=False)
+        _worker_path = path
+
+    buy_rule = compile_strategy(substitute(buy_template, combination['params']))
+    sell_rule = compile_strategy(substitute(sell_template, combination['params']))
+
+    # Combinations share most of their indicators, so each is computed once per worker
+    columns = {'currentprice': candles[:, 4]}
+    for indicator in sorted(buy_rule.indicators | sell_rule.indicators):
+        key = (pair, granularity, path, indicator)
+        columns.update(INDICATOR_CACHE.get_or_compute(key, lambda: compute_indicator(_worker_frame, indicator)))
+
+    return {**combination, **backtest_signals(pair, columns['currentprice'], buy_rule(columns), sell_rule(columns),
+                                              capital, combination['trading_fee'], combination['stop_loss'],
+                                              granularity)}
+
+
+def run_sweep(pair, granularity, candles, capital, buy_template, sell_template, parameters, stop_losses=(0,),
+              trading_fees=(0,), max_workers=None, progress=None):
+    """
+    Backtests every combination of strategy parameters, stop losses and trading fees over the same candles in
+    parallel, and ranks the results by profit. Invalid templates are rejected up front (see `validate_templates`)
+
+    Args:
+        pair (str): The coin pair being traded
+        granularity (int): The interval of time (in seconds) between successive candles
+        candles (numpy.ndarray): A matrix of candles in the Coinbase Pro format ([time, low, high, open, close, volume])
+        capital (float): The starting capital of the quote currency
+        buy_template (dict[str, -]): The buy strategy, which may contain "$name" placeholders
+        sell_template (dict[str, -]): The sell strategy, which may contain "$name" placeholders
+        parameters (dict[str, list]): A mapping of placeholder names to the values to try
+        stop_losses (list[float]): Defaults to (0,). The stop losses to try, as fractions below the buy price
+        trading_fees (list[float]): Defaults to (0,). The trading fees to try
+        max_workers (int): Defaults to None. The number of worker processes, one per core by default
+        progress (Callable[[int, int], None]): Defaults to None. Called with the number of combinations backtested so
+          far and the total number of combinations. It may raise to abort the sweep
+    Returns:
+        list[dict[str, -]]: One result per combination, with its performance summary (see `performance.summarize`),
+          most profitable first
+    """
+
+    validate_templates(buy_template, sell_template, parameters)
+
+    combinations = expand_grid(parameters, list(stop_losses), list(trading_fees))
+    tasks = [(pair, granularity, capital, buy_template, sell_template, combination) for combination in combinations]
+
+    results = map_shared(_run_combination, tasks, candles, max_workers, progress)
+    return sorted(results, key=lambda result: result['profit'], reverse=True)
+
+
+def main():
+    import argparse
+    import json
+
+    from exchange import Exchange
+    from util import period_to_integer
+
+    def values(argument):
+        return [json.loads(value) for value in argument.split(',')]
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pair', required=True, help="The coin pair to trade, i.e. 'ETH-BTC'")
+    parser.add_argument('--period', default='1h', help="The duration of each candle, i.e. '15m'")
+    parser.add_argument('--start-time', type=int, default=None, help='The start of the history in epoch seconds')
+    parser.add_argument('--capital', type=float, default=1.0)
+    parser.add_argument('--buy-strategy', required=True, help='The buy strategy template as JSON')
+    parser.add_argument('--sell-strategy', required=True, help='The sell strategy template as JSON')
+    parser.add_argument('--param', action='append', default=[], help="A placeholder and its values, i.e. 'fast=5,9'")
+    parser.add_argument('--stop-loss', type=values, default=[0],
+                        help="The stop losses to try as percentages, i.e. '0,1,2'")
+    parser.add_argument('--trading-fee', type=values, default=[0.003])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--top', type=int, default=20, help='The number of results to print')
+    args = parser.parse_args()
+
+    parameters = {}
+    for param in args.param:
+        name, _, param_values = param.partition('=')
+        parameters[name] = values(param_values)
+
+    granularity = period_to_integer(args.period)
+    data = Exchange().get_historical_data(args.pair, interval=granularity, start=args.start_time)
+
+    results = run_sweep(args.pair, granularity, convert_to_candles(data), args.capital, json.loads(args.buy_strategy),
+                        json.loads(args.sell_strategy), parameters, [stop_loss / 100 for stop_loss in args.stop_loss],
+                        args.trading_fee, args.workers)
+
+    print('{:>12} {:>12} {:>8} {:>8} {:>10} {:>8}  {}'.format('profit', 'drawdown', 'sharpe', 'trades', 'stop loss',
+                                                               'fee', 'params'))
+    for result in results[:args.top]:
+        print('{:>12.8f} {:>12.4%} {:>8.2f} {:>8} {:>10} {:>8}  {}'.format(result['profit'], result['max_drawdown'],
+                                                                           result['sharpe'], result['trades'],
+                                                                           result['stop_loss'], result['trading_fee'],
+                                                                           result['params']))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,17 +3,38 @@ Contains utility functions to help with parsing OHLCV data
 """
 
 
-def epoch_to_str(epoch_time):
+def epoch_to_iso(epoch_time):
     """
-    Converts from epoch time (in seconds) to an ISO-1806 timestamp
+    Converts from epoch time (in seconds) to an ISO-8601 timestamp in UTC, as accepted by the Coinbase Pro API
     Args:
         epoch_time (int | float): A numerical value representing the seconds since epoch
     Returns:
-        str: A string representation of the given time in ISO-1806 format
+        str: A string representation of the given time in ISO-8601 format
     """
-    import time
+    from datetime import datetime, timezone
 
-    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(epoch_time))
+    return datetime.fromtimestamp(epoch_time, tz=timezone.utc).isoformat()
+
+
+def iso_to_epoch(iso_time):
+    """
+    Converts from an ISO-8601 timestamp to epoch time (in seconds). Timestamps without a timezone are assumed to be UTC
+    Args:
+        iso_time (str | int | float): A string representation of a time in ISO-8601 format. Numerical values are
+          assumed to already be in epoch seconds
+    Returns:
+        float: The number of seconds since epoch
+    """
+    from datetime import datetime, timezone
+
+    if isinstance(iso_time, (int, float)):
+        return float(iso_time)
+
+    parsed = datetime.fromisoformat(iso_time.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+
+    return parsed.timestamp()
 
 
 def period_to_integer(period):
@@ -43,7 +64,9 @@ def period_to_integer(period):
 
 def serialize_ohlcv(ohlcv_matrix):
     """
-    Maps a OHLCV dataframe into a python dictionary
+    Maps a OHLCV dataframe into a list of python dictionaries, one per candle, with missing values mapped to None.
+    This row-oriented format is kept for compatibility; prefer `serialize_columns`, which is much cheaper to produce
+    and encode
 
     Args:
         ohlcv_matrix (pandas.DataFrame): A pandas dataframe containing OHLCV + indicator data
@@ -51,10 +74,92 @@ def serialize_ohlcv(ohlcv_matrix):
         list[dict[str,-]]: A dictionary mapping ohlcv column strings to their values
     """
 
-    # Map each row in the dataframe to a dictionary representation
-    json_dataframe = []
-    for index, row in ohlcv_matrix.iterrows():
-        datum = {'time': index.value // 1e9, **{col: row[col] for col in row.index}}
-        json_dataframe.append(datum)
+    # Serialize column by column, then map each row in the dataframe to a dictionary representation
+    columns = serialize_columns(ohlcv_matrix)
+    names = list(columns)
+
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
+def serialize_columns(ohlcv_matrix, numpy_arrays=False):
+    """
+    Maps a OHLCV dataframe into a column-oriented python dictionary: a 'time' array of epoch seconds plus one array
+    per column. Missing values are mapped to None once per column rather than once per cell
+
+    Args:
+        ohlcv_matrix (pandas.DataFrame): A pandas dataframe containing OHLCV + indicator data
+        numpy_arrays (bool): Defaults to False. Whether to return numpy arrays (with NaNs) instead of lists, for
+          encoders such as orjson that serialize numpy arrays natively
+    Returns:
+        dict[str, list]: A dictionary mapping 'time' and each column name to its list of values
+    """
+    import numpy
+
+    columns = {'time': ohlcv_matrix.index.to_numpy(dtype='datetime64[ns]').astype(numpy.int64) / 1e9}
+
+    for name in ohlcv_matrix.columns:
+        values = ohlcv_matrix[name].to_numpy()
+
+        if values.dtype == object:
+            values = ohlcv_matrix[name].to_numpy(dtype=float, na_value=numpy.nan)
+
+        columns[name] = values
+
+    if numpy_arrays:
+        return columns
+
+    serialized = {}
+    for name, values in columns.items():
+        missing = numpy.isnan(values) if values.dtype.kind == 'f' else None
+
+        if missing is not None and missing.any():
+            values = values.astype(object)
+            values[missing] = None
+
+        serialized[name] = values.tolist()
+
+    return serialized
+
+
+def serialize_binary(ohlcv_matrix):
+    """
+    Maps a OHLCV dataframe into a compact binary buffer. The buffer starts with the byte length of a JSON header as a
+    little-endian uint32, followed by the header itself and then each column's raw little-endian values. The header
+    describes every column's name, dtype ('<f8', '<f4' or 'bits'), byte offset (relative to the end of the header) and
+    length, so that clients can view each column as a typed array (i.e., a JavaScript Float64Array) without parsing.
+    Boolean columns are packed into bitsets, least significant bit first. Missing values are kept as NaN
+
+    Args:
+        ohlcv_matrix (pandas.DataFrame): A pandas dataframe containing OHLCV + indicator data
+    Returns:
+        bytes: The binary representation of the dataframe
+    """
+    import json
+    import struct
+
+    import numpy
+
+    header = {'rows': len(ohlcv_matrix), 'columns': []}
+    buffers = []
+    offset = 0
+
+    for name, values in serialize_columns(ohlcv_matrix, numpy_arrays=True).items():
+        if values.dtype == bool:
+            dtype = 'bits'
+            buffer = numpy.packbits(values, bitorder='little').tobytes()
+        else:
+            dtype = '<f4' if values.dtype == numpy.float32 else '<f8'
+            buffer = numpy.ascontiguousarray(values, dtype=dtype).tobytes()
+
+        header['columns'].append({'name': name, 'dtype': dtype, 'offset': offset, 'length': len(values)})
+        buffers.append(buffer)
+
+        # Keep every column 8-byte aligned so typed array views can be created directly over the buffer
+        padding = -len(buffer) % 8
+        buffers.append(b'\0' * padding)
+        offset += len(buffer) + padding
+
+    encoded_header = json.dumps(header).encode('utf-8')
+    encoded_header += b' ' * (-(len(encoded_header) + 4) % 8)
 
-    return json_dataframe
+    return struct.pack('<I', len(encoded_header)) + encoded_header + b''.join(buffers)
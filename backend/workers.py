@@ -0,0 +1,104 @@
+"""
+Contains the process pool that CPU-bound batches of backtests (parameter sweeps and walk-forward analyses) are spread
+over. The arrays every task reads are memory mapped read-only into each worker process rather than copied into it
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy
+
+import logger
+
+
+# How worker processes are started. Forking a multi-threaded process (i.e., the server, with its logger and job
+# threads) can copy locks held by other threads into the workers, so they are started fresh instead
+START_METHOD = os.environ.get('WORKER_START_METHOD', 'forkserver' if 'forkserver' in
+                              multiprocessing.get_all_start_methods() else 'spawn')
+
+# The number of chunks of tasks handed to each worker, so progress is reported regularly
+CHUNKS_PER_WORKER = 4
+
+# The matrix shared by every task run in a worker process, and the path it is mapped from
+_matrix = None
+_path = None
+
+
+def shared_matrix():
+    """
+    Returns:
+        tuple[numpy.ndarray, str]: The matrix shared with the tasks of `map_shared`, memory mapped read-only, and the
+          path it is mapped from, which identifies it (i.e., in caches) for as long as the pool runs
+    """
+
+    return _matrix, _path
+
+
+def map_shared(function, tasks, matrix, max_workers=None, progress=None):
+    """
+    Runs a function over every task in a pool of worker processes. The matrix is stored column by column, so every
+    column is a contiguous view over pages shared by every worker, which read it through `shared_matrix`
+
+    Args:
+        function (Callable[[-], -]): A module-level function run for each task
+        tasks (list): The tasks to run the function for. Tasks and results are pickled, so they should be small
+        matrix (numpy.ndarray): A two-dimensional array of the data shared by every task
+        max_workers (int): Defaults to None. The number of worker processes, one per core by default
+        progress (Callable[[int, int], None]): Defaults to None. Called with the number of tasks finished so far and
+          the total number of tasks. It may raise to stop running the remaining tasks
+    Returns:
+        list: The result of each task, in the order of the tasks
+    """
+
+    if not tasks:
+        return []
+
+    max_workers = max_workers or os.cpu_count()
+    chunk_size = max(1, len(tasks) // (max_workers * CHUNKS_PER_WORKER))
+    chunks = [tasks[start:start + chunk_size] for start in range(0, len(tasks), chunk_size)]
+
+    # Prefer a RAM backed directory for the shared matrix when the platform has one
+    directory = tempfile.mkdtemp(dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    path = os.path.join(directory, 'shared.npy')
+
+    results = [None] * len(chunks)
+    finished = 0
+
+    try:
+        numpy.save(path, numpy.asfortranarray(matrix, dtype=numpy.float64))
+
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(START_METHOD),
+                                 initializer=_init_worker, initargs=(path,)) as executor:
+            futures = {executor.submit(_run_chunk, function, chunk): position for position, chunk in enumerate(chunks)}
+
+            try:
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+                    finished += len(results[futures[future]])
+                    if progress:
+                        progress(finished, len(tasks))
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return [result for chunk in results for result in chunk]
+
+
+def _init_worker(path):
+    global _matrix, _path
+
+    # Batches run far too many trades for logging each of them to be useful
+    logger.set_level('off')
+
+    _matrix = numpy.load(path, mmap_mode='r')
+    _path = path
+
+
+def _run_chunk(function, tasks):
+    return [function(task) for task in tasks]
@@ -0,0 +1,82 @@
+"""
+Measures the memory of a backtested chart in each storage mode: the previous object-dtype frame (every value boxed,
+missing values as None), and the compact float64 and float32 blocks. Every mode runs in a fresh interpreter, so the
+peak RSS reported is its own
+
+Usage:
+    python benchmarks/chart_memory.py [--sizes 100000 1000000] [--indicators sma-9 ema-21 rsi-14 bollinger-21-2]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND)
+
+from suite import synthetic_candles
+
+
+MODES = ('object', 'float64', 'float32')
+
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def measure(mode, size, indicators):
+    import logger
+    from analysis import convert_to_dataframe
+    from chart import Chart
+
+    logger.set_level('off')
+    ohlcv = convert_to_dataframe(synthetic_candles(size))
+    before = peak_rss()
+
+    chart = Chart('BENCH-USD', ohlcv, indicators, granularity=60, precision='float32' if mode == 'float32' else None)
+    del ohlcv
+
+    if mode == 'object':
+        # The previous representation: every value boxed in a python object, with None for missing values
+        chart.data = chart.data.astype(object).where(chart.data.notnull(), None)
+
+    strategy = {'kind': 'GT', 'l': {'kind': 'currentprice'}, 'r': {'kind': 'sma', 'period': 9}}
+    chart.run_backtest(1.0, strategy, {'kind': 'Not', 'e': strategy}, trading_fee=0.003)
+
+    return {'mode': mode, 'candles': size, 'frame_bytes': int(chart.data.memory_usage(index=True, deep=True).sum()),
+            'peak_rss_bytes': peak_rss(), 'rss_growth_bytes': peak_rss() - before}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--indicators', nargs='+', default=['sma-9', 'ema-21', 'rsi-14', 'bollinger-21-2'])
+    parser.add_argument('--measure', nargs=2, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        mode, size = args.measure
+        print(json.dumps(measure(mode, int(size), args.indicators)))
+        return
+
+    print('{:>10} {:>8} {:>12} {:>12} {:>12}'.format('candles', 'mode', 'frame (MB)', 'growth (MB)', 'peak (MB)'))
+
+    for size in args.sizes:
+        for mode in MODES:
+            process = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', mode, str(size),
+                                      '--indicators'] + args.indicators, stdout=subprocess.PIPE,
+                                     universal_newlines=True, check=True)
+            result = json.loads(process.stdout.strip().splitlines()[-1])
+
+            print('{:>10} {:>8} {:>12.1f} {:>12.1f} {:>12.1f}'.format(
+                size, mode, result['frame_bytes'] / 2 ** 20, result['rss_growth_bytes'] / 2 ** 20,
+                result['peak_rss_bytes'] / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark comparing the bulk `analysis.convert_to_dataframe` against the previous per-row implementation
+
+Usage:
+    python benchmarks/convert_to_dataframe.py [--sizes 10000 100000 1000000] [--legacy-limit 100000]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy
+import pandas
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from analysis import convert_to_dataframe
+
+
+def legacy_convert_to_dataframe(historical_data):
+    """
+    The per-row conversion `convert_to_dataframe` used before the bulk path, kept here as the baseline
+    """
+
+    dataframe = pandas.DataFrame(historical_data)
+    dataframe.transpose()
+
+    dataframe = pandas.DataFrame(historical_data)
+    dataframe.transpose()
+    dataframe.columns = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+    dataframe['datetime'] = dataframe.timestamp.apply(
+        lambda x: pandas.to_datetime(datetime.fromtimestamp(x).strftime('%c'))
+    )
+
+    dataframe.set_index('datetime', inplace=True, drop=True)
+    dataframe.drop('timestamp', axis=1, inplace=True)
+
+    return dataframe
+
+
+def synthetic_candles(num_candles, interval=60):
+    """
+    Generates a random walk of candles in the Coinbase Pro format ([time, low, high, open, close, volume])
+    """
+
+    rng = numpy.random.default_rng(0)
+    close = 100 + numpy.cumsum(rng.normal(0, 1, num_candles))
+    times = numpy.arange(num_candles, dtype=numpy.float64) * interval + 1500000000
+
+    return numpy.column_stack([times, close - 1, close + 1, close, close, rng.uniform(0, 10, num_candles)]).tolist()
+
+
+def best_of(function, argument, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--legacy-limit', type=int, default=100000,
+                        help='Largest size the (slow) per-row implementation is run at')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('{:>10} {:>12} {:>12} {:>10}'.format('candles', 'bulk (s)', 'legacy (s)', 'speedup'))
+
+    for size in args.sizes:
+        candles = synthetic_candles(size)
+        bulk = best_of(convert_to_dataframe, candles, args.repeat)
+
+        if size <= args.legacy_limit:
+            legacy = best_of(legacy_convert_to_dataframe, candles, 1)
+            print('{:>10} {:>12.4f} {:>12.4f} {:>9.1f}x'.format(size, bulk, legacy, legacy / bulk))
+        else:
+            print('{:>10} {:>12.4f} {:>12} {:>10}'.format(size, bulk, '-', '-'))
+
+
+if __name__ == '__main__':
+    main()
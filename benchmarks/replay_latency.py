@@ -0,0 +1,83 @@
+"""
+Measures the event-to-decision latency of the live trading engine by replaying a recording (or a synthetic random
+walk) through `live.LiveTrader` with paper trading. Every candle can be split into several trades, to measure the cost
+of events that only evaluate the strategies as well as that of candle closes, which also update the indicators
+
+Usage:
+    python benchmarks/replay_latency.py [--size 100000] [--ticks-per-candle 4] [--fixture recorded.npy] \\
+        [--buy-strategy 'current-price > sma(9)'] [--sell-strategy 'current-price < ema(21)']
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND)
+
+from suite import load_fixture, synthetic_candles
+
+
+def recording(candles, ticks_per_candle, granularity):
+    """
+    Builds the rows of a replay file from candles: the candles themselves, or `ticks_per_candle` evenly spaced trades
+    per candle at prices interpolated from its open to its close
+    """
+
+    if ticks_per_candle <= 1:
+        return candles
+
+    offsets = numpy.arange(ticks_per_candle) / ticks_per_candle
+    times = candles[:, [0]] + offsets * granularity
+    prices = candles[:, [3]] + (candles[:, [4]] - candles[:, [3]]) * numpy.linspace(0, 1, ticks_per_candle)
+
+    return numpy.column_stack([times.ravel(), prices.ravel()])
+
+
+def main():
+    import logger
+    from exchange import Exchange
+    from live import LiveTrader, OrderManager, replay_feed
+    from local_client import PaperClient
+    from strategy_parser import parse_strategy
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100000, help='The number of synthetic candles')
+    parser.add_argument('--fixture', default=None, help='Candles recorded to a .npy or .csv file')
+    parser.add_argument('--granularity', type=int, default=60)
+    parser.add_argument('--ticks-per-candle', type=int, default=4)
+    parser.add_argument('--buy-strategy', default='current-price > sma(9) && rsi(14) < 70')
+    parser.add_argument('--sell-strategy', default='current-price < ema(21) || rsi(14) > 80')
+    parser.add_argument('--indicators', nargs='*', default=[])
+    args = parser.parse_args()
+
+    logger.set_level('off')
+
+    candles = load_fixture(args.fixture) if args.fixture else synthetic_candles(args.size, args.granularity)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'replay.npy')
+    numpy.save(path, recording(candles, args.ticks_per_candle, args.granularity))
+
+    try:
+        paper = PaperClient(trading_fee=0.003)
+        orders = OrderManager(Exchange(client=paper), requests_per_second=1e6, burst=1000)
+        trader = LiveTrader(orders, 'BENCH-USD', args.granularity, 1.0, parse_strategy(args.buy_strategy),
+                            parse_strategy(args.sell_strategy), args.indicators, trading_fee=0.003)
+
+        report = trader.run(paper.watch(replay_feed(path), 'BENCH-USD'), wait_for_fills=True)
+        orders.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(json.dumps({'events': report['events'], 'candles': report['candles'],
+                      'positions': report['positions']['summary']['positions'],
+                      'latency_us': report['latency']}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
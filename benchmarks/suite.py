@@ -0,0 +1,377 @@
+"""
+Benchmark suite for the backtesting engine and indicator pipeline. Every case runs in a fresh interpreter, so its peak
+RSS is its own, and reports the latency of each stage (`convert_to_dataframe`, `Chart.__add_indicators`,
+`Chart.run_backtest`, `serialize_ohlcv`, `serialize_columns` and, optionally, the end-to-end Flask /backtest through
+the test client with a stubbed Exchange) together with the throughput in candles per second
+
+Cases combine a fixture (synthetic random walks of any size, or candles recorded to a .npy or .csv file in the
+Coinbase Pro format), an indicator mix and a strategy. Results are written as JSON, and a previous run can be given
+to compare against, in which case any stage slower than the baseline by more than the threshold is flagged and the
+suite exits with a non-zero status.
+
+Usage:
+    python benchmarks/suite.py --sizes 1000 100000 1000000 --output results.json
+    python benchmarks/suite.py --fixture recorded.npy --mixes light heavy --strategies simple nested
+    python benchmarks/suite.py --output new.json --compare results.json --threshold 0.1
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND)
+
+
+# The indicators added to the chart in each mix
+INDICATOR_MIXES = {
+    'light': ['sma-9'],
+    'medium': ['sma-9', 'ema-21', 'rsi-14'],
+    'heavy': ['sma-9', 'sma-50', 'ema-21', 'ema-100', 'rsi-14', 'bollinger-21-2']
+}
+
+# The largest fixture the end-to-end benchmark runs at by default, since it serializes the whole result
+E2E_LIMIT = 1000000
+
+# Stages faster than this (in seconds) are dominated by noise, so they are never flagged as regressions
+MIN_COMPARED_SECONDS = 0.01
+
+
+def comparison(kind, left, right):
+    return {'kind': kind, 'l': left, 'r': right}
+
+
+def build_strategies(indicators, depth):
+    """
+    Builds a buy and sell strategy over an indicator mix: 'simple' compares the price with the first indicator, and
+    'nested' chains `depth` comparisons over every indicator with alternating And/Or/Not expressions
+
+    Returns:
+        dict[str, tuple[dict, dict]]: A mapping of each strategy name to its (buy, sell) strategies
+    """
+
+    def operand(indicator):
+        kind, _, period = indicator.partition('-')
+        return {'kind': kind, 'period': int(period)}
+
+    # Strategies can only reference single valued indicators, not bands
+    indicators = [indicator for indicator in indicators if not indicator.startswith('bollinger')]
+
+    price = {'kind': 'currentprice'}
+    first = operand(indicators[0])
+    strategies = {'simple': (comparison('GT', price, first), comparison('LT', price, first))}
+
+    def nested(kind):
+        expression = comparison(kind, price, first)
+        for level in range(depth):
+            term = comparison(kind, price, operand(indicators[(level + 1) % len(indicators)]))
+            if level % 3 == 0:
+                expression = {'kind': 'Or', 'e1': expression, 'e2': term}
+            elif level % 3 == 1:
+                expression = {'kind': 'And', 'e1': expression, 'e2': {'kind': 'Not', 'e': {'kind': 'Not', 'e': term}}}
+            else:
+                expression = {'kind': 'Or', 'e1': term, 'e2': expression}
+        return expression
+
+    strategies['nested'] = (nested('GT'), nested('LT'))
+    return strategies
+
+
+def synthetic_candles(num_candles, interval=60, seed=0):
+    """
+    Generates a geometric random walk of candles in the Coinbase Pro format ([time, low, high, open, close, volume])
+    """
+
+    rng = numpy.random.default_rng(seed)
+    close = 100 * numpy.exp(numpy.cumsum(rng.normal(0, 0.002, num_candles)))
+    spread = close * rng.uniform(0, 0.002, num_candles)
+    times = numpy.arange(num_candles, dtype=numpy.float64) * interval + 1500000000
+
+    return numpy.column_stack([times, close - spread, close + spread, numpy.roll(close, 1), close,
+                               rng.uniform(0, 10, num_candles)])
+
+
+def load_fixture(fixture):
+    """
+    Loads the candles of a fixture: either 'synthetic:<size>' or the path of a recorded .npy or .csv file
+    """
+
+    if fixture.startswith('synthetic:'):
+        return synthetic_candles(int(fixture.split(':', 1)[1]))
+    if fixture.endswith('.npy'):
+        return numpy.load(fixture)
+
+    return numpy.loadtxt(fixture, delimiter=',', ndmin=2)
+
+
+def timed(function, repeat, setup=None):
+    """
+    Runs a function `repeat` times and returns its best time in seconds along with its last result. `setup` is
+    called (untimed) before every run and its result is passed to the function
+    """
+
+    best = None
+    result = None
+
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        result = function(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, result
+
+
+def run_case(case):
+    """
+    Runs a single case in the current process
+
+    Args:
+        case (dict[str, -]): The fixture, mix, strategy, depth, repeat count and whether to run the end-to-end stage
+    Returns:
+        dict[str, -]: The case, the number of candles and trades, the latency of each stage, the throughput and the
+          peak RSS
+    """
+
+    import logger
+    from analysis import convert_to_dataframe
+    from chart import Chart, INDICATOR_CACHE
+    from util import serialize_columns, serialize_ohlcv
+
+    indicators = INDICATOR_MIXES[case['mix']]
+    buy_strategy, sell_strategy = build_strategies(indicators, case['depth'])[case['strategy']]
+    repeat = case['repeat']
+
+    # Like every batch run, the benchmark does not log individual trades
+    logger.set_level('off')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        candles = load_fixture(case['fixture'])
+        rows = candles[numpy.argsort(candles[:, 0])].tolist()
+
+        stages = {}
+        stages['convert_to_dataframe'], ohlcv = timed(lambda _: convert_to_dataframe(rows), repeat)
+
+        def fresh_chart(_=None):
+            INDICATOR_CACHE.clear()
+            return Chart('BENCH-USD', ohlcv.copy(), indicators, granularity=60)
+
+        stages['add_indicators'], _ = timed(fresh_chart, repeat)
+
+        def backtest(chart):
+            chart.run_backtest(1.0, buy_strategy, sell_strategy, trading_fee=0.003, stop_loss=0.02)
+            return chart
+
+        stages['run_backtest'], chart = timed(backtest, repeat, setup=fresh_chart)
+        stages['serialize_ohlcv'], _ = timed(lambda _: serialize_ohlcv(chart.data), repeat)
+        stages['serialize_columns'], _ = timed(lambda _: serialize_columns(chart.data), repeat)
+
+        if case['e2e']:
+            stages['e2e_backtest'] = run_end_to_end(ohlcv, indicators, buy_strategy, sell_strategy, repeat)
+
+    num_candles = len(rows)
+    pipeline = sum(stages[name] for name in ('convert_to_dataframe', 'add_indicators', 'run_backtest'))
+
+    return {**case, 'candles': num_candles, 'trades': int(chart.data['buy'].sum()), 'stages': stages,
+            'candles_per_second': {name: num_candles / seconds for name, seconds in stages.items() if seconds > 0},
+            'pipeline_candles_per_second': num_candles / pipeline if pipeline > 0 else None,
+            'peak_rss_bytes': peak_rss()}
+
+
+class StubExchange(object):
+    """
+    Serves a fixed frame of candles in place of the Coinbase Pro backed `Exchange`
+    """
+    def __init__(self, ohlcv):
+        self.ohlcv = ohlcv
+
+    def get_historical_data(self, coin_pair, interval=3600, start=None, end=None):
+        return self.ohlcv.copy()
+
+    def get_available_keypairs(self):
+        return ['BENCH/USD']
+
+
+def run_end_to_end(ohlcv, indicators, buy_strategy, sell_strategy, repeat):
+    """
+    Times POST /backtest through the Flask test client, from parsing the request to the serialized response
+    """
+
+    # Results must not be served from the cache across repeats
+    os.environ['RESULT_CACHE_BYTES'] = '0'
+    from chart import INDICATOR_CACHE
+    from server import Server
+
+    server = Server(StubExchange(ohlcv))
+    client = server.app.test_client()
+    start_time = int(ohlcv.index[0].timestamp())
+
+    url = '/backtest?pair=BENCH/USD&period=1m&capital=1&stopLoss=2&startTime={}'.format(start_time)
+    body = {'indicators': indicators, 'buyStrategy': json.dumps(buy_strategy),
+            'sellStrategy': json.dumps(sell_strategy)}
+
+    def request(_):
+        response = client.post(url, json=body)
+        if response.status_code != 200:
+            raise RuntimeError('/backtest failed with status {}'.format(response.status_code))
+        return response
+
+    try:
+        seconds, _ = timed(request, repeat, setup=lambda: INDICATOR_CACHE.clear())
+    finally:
+        server.jobs.shutdown()
+
+    return seconds
+
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def case_id(case):
+    return '{fixture}/{mix}/{strategy}'.format(**case)
+
+
+def run_isolated(case):
+    """
+    Runs a case in a fresh interpreter, so that its peak RSS is not inflated by earlier cases
+    """
+
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-case', json.dumps(case)],
+                             stdout=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        return {**case, 'error': 'exited with status {}'.format(process.returncode)}
+
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares the stage latencies of a run with a baseline run
+
+    Args:
+        results (list[dict[str, -]]): The results of the current run
+        baseline (list[dict[str, -]]): The results of the baseline run
+        threshold (float): The relative slowdown above which a stage is flagged, i.e. 0.1 for 10%
+    Returns:
+        list[dict[str, -]]: One entry per stage present in both runs, with the 'change' relative to the baseline and
+          whether it is a 'regression'
+    """
+
+    baseline = {case_id(result): result for result in baseline if 'stages' in result}
+    changes = []
+
+    for result in results:
+        previous = baseline.get(case_id(result))
+        if previous is None or 'stages' not in result:
+            continue
+
+        for name, seconds in result['stages'].items():
+            before = previous['stages'].get(name)
+            if not before:
+                continue
+
+            change = seconds / before - 1
+            changes.append({'case': case_id(result), 'stage': name, 'baseline': before, 'current': seconds,
+                            'change': change, 'regression': change > threshold and before >= MIN_COMPARED_SECONDS})
+
+        if previous.get('peak_rss_bytes') and result.get('peak_rss_bytes'):
+            # Memory is compared in megabytes, so it reads alongside the latencies in seconds
+            before, current = previous['peak_rss_bytes'] / 2 ** 20, result['peak_rss_bytes'] / 2 ** 20
+            changes.append({'case': case_id(result), 'stage': 'peak_rss_mb', 'baseline': before, 'current': current,
+                            'change': current / before - 1, 'regression': current / before - 1 > threshold})
+
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='*', default=[1000, 10000, 100000, 1000000],
+                        help='Sizes of the synthetic fixtures, i.e. 1000 10000000')
+    parser.add_argument('--fixture', action='append', default=[],
+                        help='A recorded .npy or .csv file of candles in the Coinbase Pro format')
+    parser.add_argument('--mixes', nargs='+', default=['light', 'heavy'], choices=sorted(INDICATOR_MIXES))
+    parser.add_argument('--strategies', nargs='+', default=['simple', 'nested'], choices=['simple', 'nested'])
+    parser.add_argument('--depth', type=int, default=8, help='The number of comparisons in nested strategies')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--e2e-limit', type=int, default=E2E_LIMIT,
+                        help='Largest fixture the end-to-end /backtest benchmark is run at (0 disables it)')
+    parser.add_argument('--output', default=None, help='The file the results are written to as JSON')
+    parser.add_argument('--compare', default=None, help='A previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='The relative slowdown flagged as a regression when comparing')
+    parser.add_argument('--run-case', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return
+
+    fixtures = [('synthetic:{}'.format(size), size) for size in args.sizes]
+    fixtures += [(path, len(load_fixture(path))) for path in args.fixture]
+
+    results = []
+    print('{:<36} {:>9} {:>10} {:>10} {:>10} {:>10} {:>10} {:>12} {:>9}'.format(
+        'case', 'candles', 'convert', 'indicators', 'backtest', 'ohlcv', 'e2e', 'candles/s', 'rss (MB)'))
+
+    for fixture, size in fixtures:
+        for mix in args.mixes:
+            for strategy in args.strategies:
+                case = {'fixture': fixture, 'mix': mix, 'strategy': strategy, 'depth': args.depth,
+                        'repeat': args.repeat, 'e2e': 0 < size <= args.e2e_limit}
+                result = run_isolated(case)
+                results.append(result)
+
+                if 'error' in result:
+                    print('{:<36} {}'.format(case_id(case), result['error']))
+                    continue
+
+                stages = result['stages']
+                print('{:<36} {:>9} {:>10.4f} {:>10.4f} {:>10.4f} {:>10.4f} {:>10} {:>12.0f} {:>9.1f}'.format(
+                    case_id(case), result['candles'], stages['convert_to_dataframe'], stages['add_indicators'],
+                    stages['run_backtest'], stages['serialize_ohlcv'],
+                    '{:.4f}'.format(stages['e2e_backtest']) if 'e2e_backtest' in stages else '-',
+                    result['pipeline_candles_per_second'], result['peak_rss_bytes'] / 2 ** 20))
+
+    report = {'meta': {'created': int(time.time()), 'python': platform.python_version(),
+                       'platform': platform.platform(), 'numpy': numpy.__version__,
+                       'pandas': __import__('pandas').__version__},
+              'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+        changes = compare(results, baseline, args.threshold)
+        regressions = [change for change in changes if change['regression']]
+
+        print()
+        print('{:<36} {:<22} {:>12} {:>12} {:>9}'.format('case', 'stage', 'baseline', 'current', 'change'))
+        for change in changes:
+            print('{:<36} {:<22} {:>12.4f} {:>12.4f} {:>+8.1%}{}'.format(
+                change['case'], change['stage'], change['baseline'], change['current'], change['change'],
+                '  REGRESSION' if change['regression'] else ''))
+
+        if regressions:
+            print('\n{} regression(s) above {:.0%}'.format(len(regressions), args.threshold))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
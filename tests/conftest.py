@@ -0,0 +1,32 @@
+import os
+import sys
+
+import numpy
+import pytest
+
+# The backend modules import each other as top-level modules, as they do when the server is run from backend/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+
+def random_walk(size, granularity=60, seed=0, start=1500000000):
+    """
+    Builds a reproducible random walk of candles in the Coinbase Pro format ([time, low, high, open, close, volume])
+    """
+
+    rng = numpy.random.default_rng(seed)
+    close = 100 * numpy.exp(numpy.cumsum(rng.normal(0, 0.002, size)))
+    open_ = numpy.concatenate([[close[0]], close[:-1]])
+    spread = numpy.abs(rng.normal(0, 0.001, size)) * close
+    times = start + granularity * numpy.arange(size, dtype=float)
+
+    return numpy.column_stack([times, numpy.minimum(open_, close) - spread, numpy.maximum(open_, close) + spread,
+                               open_, close, rng.uniform(1, 10, size)])
+
+
+@pytest.fixture(autouse=True)
+def quiet_logger():
+    import logger
+
+    # Trades are logged on a background thread, which would only slow the tests down
+    logger.set_level('off')
+    yield
@@ -0,0 +1,93 @@
+"""
+Backfills are driven through a LocalClient, which pages and rate limits its responses like the exchange
+"""
+
+import numpy
+import pytest
+
+from backfill import RateLimitError, RateLimiter, backfill, split_pages
+from local_client import LocalClient
+
+from conftest import random_walk
+
+
+GRANULARITY = 60
+
+
+def test_split_pages_covers_the_range():
+    pages = split_pages(0, 1000 * GRANULARITY, GRANULARITY, page_size=300)
+
+    assert pages[0][0] == 0 and pages[-1][1] == 1000 * GRANULARITY
+    assert all(end == start for (_, end), (start, _) in zip(pages, pages[1:]))
+    assert all(end - start <= 300 * GRANULARITY for start, end in pages)
+
+
+@pytest.mark.parametrize('page_size', [7, 50, 300])
+def test_backfill_paginates(page_size):
+    candles = random_walk(1000, GRANULARITY)
+    client = LocalClient({('ETH-BTC', GRANULARITY): candles}, page_size=page_size)
+
+    start, end = int(candles[0, 0]), int(candles[-1, 0]) + GRANULARITY
+    fetched = backfill(client, 'ETH-BTC', GRANULARITY, start, end, page_size=page_size, backoff=0)
+
+    numpy.testing.assert_array_equal(fetched, candles)
+    assert len(client.requests) == len(split_pages(start, end, GRANULARITY, page_size))
+
+
+def test_backfill_returns_only_the_requested_range():
+    candles = random_walk(1000, GRANULARITY)
+    client = LocalClient({('ETH-BTC', GRANULARITY): candles}, page_size=100)
+
+    start, end = int(candles[123, 0]), int(candles[789, 0])
+    fetched = backfill(client, 'ETH-BTC', GRANULARITY, start, end, page_size=100, backoff=0)
+
+    numpy.testing.assert_array_equal(fetched, candles[123:789])
+
+
+def test_backfill_skips_gaps():
+    candles = numpy.delete(random_walk(1000, GRANULARITY), numpy.s_[200:450], axis=0)
+    client = LocalClient({('ETH-BTC', GRANULARITY): candles}, page_size=100)
+
+    fetched = backfill(client, 'ETH-BTC', GRANULARITY, int(candles[0, 0]), int(candles[-1, 0]) + GRANULARITY,
+                       page_size=100, backoff=0)
+
+    numpy.testing.assert_array_equal(fetched, candles)
+
+
+def test_backfill_retries_rate_limited_requests():
+    candles = random_walk(600, GRANULARITY)
+    client = LocalClient({('ETH-BTC', GRANULARITY): candles}, page_size=100, max_requests_per_second=3)
+
+    fetched = backfill(client, 'ETH-BTC', GRANULARITY, int(candles[0, 0]), int(candles[-1, 0]) + GRANULARITY,
+                       page_size=100, max_workers=8, max_retries=10, backoff=0.05)
+
+    # Rejected (429) requests were retried until every page was served
+    assert client.rejected > 0
+    numpy.testing.assert_array_equal(fetched, candles)
+
+
+def test_backfill_with_a_shared_rate_limiter_is_never_rejected():
+    candles = random_walk(1000, GRANULARITY)
+    client = LocalClient({('ETH-BTC', GRANULARITY): candles}, page_size=100, max_requests_per_second=20)
+
+    fetched = backfill(client, 'ETH-BTC', GRANULARITY, int(candles[0, 0]), int(candles[-1, 0]) + GRANULARITY,
+                       page_size=100, max_workers=8, rate_limiter=RateLimiter(10), backoff=0)
+
+    assert client.rejected == 0
+    numpy.testing.assert_array_equal(fetched, candles)
+
+
+def test_backfill_gives_up_after_retries():
+    candles = random_walk(1000, GRANULARITY)
+    client = LocalClient({('ETH-BTC', GRANULARITY): candles}, page_size=10, max_requests_per_second=1)
+
+    with pytest.raises(RateLimitError):
+        backfill(client, 'ETH-BTC', GRANULARITY, int(candles[0, 0]), int(candles[-1, 0]) + GRANULARITY,
+                 page_size=10, max_workers=8, max_retries=1, backoff=0)
+
+
+def test_backfill_reports_other_errors():
+    client = LocalClient({('ETH-BTC', GRANULARITY): random_walk(10, GRANULARITY)})
+
+    with pytest.raises(ValueError, match='NotFound'):
+        backfill(client, 'BTC-USD', GRANULARITY, 0, 100 * GRANULARITY, backoff=0)
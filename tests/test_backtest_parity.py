@@ -0,0 +1,94 @@
+"""
+The vectorized backtesting engine must produce exactly the results of the original row-by-row engine
+"""
+
+import numpy
+import pytest
+
+from analysis import convert_to_dataframe
+from chart import Chart
+from strategy_parser import parse_strategy
+
+from conftest import random_walk
+
+
+INDICATORS = ['sma-9', 'sma-30', 'ema-21']
+
+STRATEGIES = [
+    ('current-price > sma(9)', 'current-price < sma(9)'),
+    ('current-price > sma(9) && sma(9) > sma(30)', 'current-price < ema(21) || sma(9) < sma(30)'),
+    ('!(current-price < ema(21))', 'current-price < sma(30)'),
+]
+
+
+def run_both(candles, buy, sell, start_time=None, **kwargs):
+    data = convert_to_dataframe(candles)
+    charts = []
+
+    for vectorized in (True, False):
+        chart = Chart('ETH-BTC', data, INDICATORS, granularity=60, start_time=start_time)
+        chart.run_backtest(buy_strategy=parse_strategy(buy), sell_strategy=parse_strategy(sell), vectorized=vectorized,
+                           **kwargs)
+        charts.append(chart)
+
+    return charts
+
+
+def assert_identical(vectorized, iterative):
+    for column in ('buy', 'sell'):
+        numpy.testing.assert_array_equal(vectorized.data[column].to_numpy(dtype=bool),
+                                         iterative.data[column].to_numpy(dtype=bool))
+
+    numpy.testing.assert_array_equal(vectorized.data['profit'].to_numpy(dtype=float),
+                                     iterative.data['profit'].to_numpy(dtype=float))
+    assert vectorized.position_report() == iterative.position_report()
+    assert vectorized.performance_report() == iterative.performance_report()
+
+
+@pytest.mark.parametrize('buy,sell', STRATEGIES)
+@pytest.mark.parametrize('trading_fee', [0, 0.003])
+def test_signals_and_fees(buy, sell, trading_fee):
+    vectorized, iterative = run_both(random_walk(3000), buy, sell, capital=1.0, trading_fee=trading_fee)
+
+    assert vectorized.data['buy'].any()
+    assert_identical(vectorized, iterative)
+
+
+@pytest.mark.parametrize('stop_loss', [0.001, 0.003, 0.008])
+def test_stop_losses(stop_loss):
+    # A slow sell signal leaves room for the stop loss to close positions first
+    vectorized, iterative = run_both(random_walk(3000, seed=1), 'current-price > sma(9)', 'sma(9) < sma(30)',
+                                     capital=1.0, trading_fee=0.003, stop_loss=stop_loss)
+
+    assert 'stop_loss' in vectorized.position_report()['exit_reason']
+    assert_identical(vectorized, iterative)
+
+
+@pytest.mark.parametrize('capital', [0.001, 1.0, 2500.0])
+def test_position_sizes(capital):
+    vectorized, iterative = run_both(random_walk(2000, seed=2), *STRATEGIES[1], capital=capital, trading_fee=0.003)
+
+    amounts = vectorized.position_report()['amount']
+    assert amounts and amounts == iterative.position_report()['amount']
+    assert_identical(vectorized, iterative)
+
+
+def test_windowed_start_time():
+    candles = random_walk(4000, seed=3)
+    start_time = int(candles[2500, 0])
+    vectorized, iterative = run_both(candles, *STRATEGIES[0], start_time=start_time, capital=1.0, trading_fee=0.003,
+                                     stop_loss=0.005)
+
+    # Positions are only opened from the start time
+    assert min(vectorized.position_report()['entry_time']) >= start_time
+    assert not vectorized.data.loc[:vectorized.get_data().index[0], 'buy'].iloc[:-1].any()
+    assert_identical(vectorized, iterative)
+
+
+def test_position_left_open():
+    candles = random_walk(500, seed=4)
+    vectorized, iterative = run_both(candles, 'current-price > 0', 'current-price < 0', capital=1.0,
+                                     trading_fee=0.003)
+
+    assert vectorized.position_report()['exit_reason'] == ['open']
+    assert_identical(vectorized, iterative)
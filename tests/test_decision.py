@@ -0,0 +1,78 @@
+"""
+Compiled strategies must decide exactly like `Decision`, evaluating each repeated subexpression once
+"""
+
+import copy
+
+import numpy
+import pytest
+
+from decision import Decision, _count_subexpressions, _subexpression_keys, compile_strategy, evaluate_strategy
+from strategy_parser import parse_strategy
+
+
+STRATEGIES = [
+    'current-price > sma(9)',
+    '(current-price > sma(9) && sma(9) > sma(30)) || (current-price > sma(9) && sma(9) > sma(30))',
+    '!(current-price < sma(30)) && (sma(9) >= 0.5 || !(current-price < sma(30)))',
+]
+
+
+class CountingColumns(dict):
+    """
+    Counts how many times each column is read
+    """
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.reads = {}
+
+    def __getitem__(self, key):
+        self.reads[key] = self.reads.get(key, 0) + 1
+        return super().__getitem__(key)
+
+
+def random_columns(size=500, seed=0):
+    rng = numpy.random.default_rng(seed)
+    columns = {'currentprice': rng.uniform(0, 1, size), 'sma-9': rng.uniform(0, 1, size),
+               'sma-30': rng.uniform(0, 1, size)}
+
+    # Indicators are undefined while they warm up
+    columns['sma-30'][:29] = numpy.nan
+    return columns
+
+
+@pytest.mark.parametrize('text', STRATEGIES)
+def test_compiled_strategies_match_decisions(text):
+    strategy = parse_strategy(text)
+    columns = random_columns()
+
+    expected = [Decision({name: None if numpy.isnan(values[row]) else values[row]
+                          for name, values in columns.items()}).should_execute(strategy)
+                for row in range(len(columns['currentprice']))]
+
+    numpy.testing.assert_array_equal(evaluate_strategy(strategy, columns, len(expected)), expected)
+
+
+def test_repeated_subexpressions_are_evaluated_once():
+    strategy = parse_strategy(STRATEGIES[1])
+    columns = CountingColumns(random_columns())
+
+    compile_strategy(strategy)(columns)
+
+    # The repeated conjunction reads each of its two comparisons' indicators once
+    assert columns.reads['sma-30'] == 1
+
+
+def test_subexpression_keys_are_structural():
+    # Parsed strategies are cached by their text, so the repeated side is an independent copy
+    left = parse_strategy('current-price > sma(9) && sma(9) > sma(30)')
+    right = copy.deepcopy(left)
+    strategy = {'kind': 'Or', 'e1': left, 'e2': right}
+
+    keys = _subexpression_keys(strategy)
+
+    assert left is not right
+
+    assert keys[id(left)] == keys[id(right)] != keys[id(strategy)]
+    assert _count_subexpressions(strategy, keys)[keys[id(left)]] == 2
+
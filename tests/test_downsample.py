@@ -0,0 +1,79 @@
+"""
+Downsampled results keep the shape of the price series and every trade within the requested number of points, and
+zoomed-in ranges are served at full resolution
+"""
+
+import numpy
+import pytest
+
+from analysis import convert_to_dataframe
+from downsample import downsample
+
+from conftest import random_walk
+
+
+def backtest_data(size, seed=0):
+    data = convert_to_dataframe(random_walk(size, seed=seed))
+    rng = numpy.random.default_rng(seed)
+
+    # Trades are rare compared to candles, and their markers are NaN elsewhere
+    for marker in ('buy', 'sell'):
+        data[marker] = numpy.where(rng.random(size) < 0.002, data['close'], numpy.nan)
+
+    return data
+
+
+@pytest.mark.parametrize('size,max_points', [(10000, 500), (10000, 501), (1234, 4), (999, 100)])
+def test_downsampling_keeps_extremes_and_markers(size, max_points):
+    data = backtest_data(size)
+    sampled = downsample(data, max_points)
+    markers = data['buy'].notna() | data['sell'].notna()
+
+    assert len(sampled) <= max_points + markers.sum()
+    assert len(sampled.drop(index=data.index[markers], errors='ignore')) <= max_points
+    assert sampled.index[0] == data.index[0] and sampled.index[-1] == data.index[-1]
+    assert data.index[markers].isin(sampled.index).all()
+
+    # The lowest low and highest high of every bucket of consecutive candles are kept
+    buckets = max(1, max_points // 2 - 1)
+    bucket = numpy.arange(size) * buckets // size
+    kept = data.index.isin(sampled.index)
+    for column, reduce in (('low', 'min'), ('high', 'max')):
+        extremes = data[column].groupby(bucket).agg(reduce)
+        kept_extremes = data[column][kept].groupby(bucket[kept]).agg(reduce)
+        assert kept_extremes.equals(extremes)
+
+
+def test_small_results_are_not_downsampled():
+    data = backtest_data(100)
+
+    assert downsample(data, 100) is data and downsample(data, None) is data
+
+
+def test_zoom_returns_the_range_at_full_resolution():
+    from server import Server
+
+    candles = random_walk(2000)
+
+    class Exchange(object):
+        def get_historical_data(self, *args, **kwargs):
+            return convert_to_dataframe(candles)
+
+    server = Server(Exchange())
+    client = server.app.test_client()
+    query = 'pair=ETH/BTC&period=1m&startTime={}&capital=1&stopLoss=0&format=columns'.format(int(candles[0, 0]))
+    strategies = {'buyStrategy': 'current-price > sma(9)', 'sellStrategy': 'current-price < sma(9)'}
+
+    overview = client.post('/backtest?{}&maxPoints=100'.format(query), json=strategies).get_json()
+    start, end = int(candles[500, 0]), int(candles[800, 0])
+    zoomed = client.post('/backtest/zoom?{}&from={}&to={}'.format(query, start, end), json=strategies).get_json()
+    invalid = client.post('/backtest/zoom?{}&from={}'.format(query, start), json=strategies).get_json()
+    server.jobs.shutdown()
+
+    assert overview['rows'] == 2000 and len(overview['result']['time']) < 2000
+
+    # Candles open at the zoomed range's start, but not at its end, are part of it
+    assert zoomed['result']['time'] == candles[500:800, 0].tolist()
+    assert zoomed['result']['close'] == pytest.approx(candles[500:800, 4].tolist())
+
+    assert invalid['response'] == 400
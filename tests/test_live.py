@@ -0,0 +1,116 @@
+"""
+A live trader warms its indicators up from history before trading, and handles orders the exchange fails to fill
+"""
+
+import numpy
+import pytest
+
+from analysis import compute_indicator, convert_to_dataframe
+from exchange import Exchange
+from live import LiveTrader, MarketEvent, OrderError, OrderManager
+from local_client import LocalClient
+from strategy_parser import parse_strategy
+
+from conftest import random_walk
+
+
+GRANULARITY = 60
+
+
+class FlakyExchange(object):
+    """
+    Rejects the first `failures` orders with a message, and fills every other one at once at a price of 100
+    """
+    def __init__(self, failures, message):
+        self.failures = failures
+        self.message = message
+        self.placed = 0
+
+    def buy(self, coin_pair, amount, limit=None):
+        self.placed += 1
+        if self.failures is None or self.placed <= self.failures:
+            return {'message': self.message}
+
+        return {'id': str(self.placed), 'status': 'done', 'filled_size': str(amount),
+                'executed_value': str(amount * 100), 'fill_fees': '0'}
+
+    sell = buy
+
+
+def create_orders(exchange):
+    return OrderManager(exchange, requests_per_second=1e6, burst=1000, backoff=0)
+
+
+def create_trader(orders, buy='current-price > sma(9)', sell='current-price < ema(21)'):
+    return LiveTrader(orders, 'ETH-BTC', GRANULARITY, 1.0, parse_strategy(buy), parse_strategy(sell))
+
+
+def candle_events(candles):
+    return [MarketEvent(start, close, closed=True) for start, close in candles[:, [0, 4]].tolist()]
+
+
+@pytest.mark.parametrize('overlap', [0, 10])
+def test_warm_up_matches_full_history(overlap):
+    candles = random_walk(1500, GRANULARITY)
+    exchange = Exchange(client=LocalClient({('ETH-BTC', GRANULARITY): candles[:1200]}))
+    orders = create_orders(FlakyExchange(0, ''))
+    trader = create_trader(orders)
+
+    # The feed may start with candles that were already part of the warm-up
+    assert trader.warm_up(exchange, now=int(candles[1200, 0])) == trader.warmup_period()
+    trader.run(candle_events(candles[1200 - overlap:]), wait_for_fills=True)
+    orders.close()
+
+    data = convert_to_dataframe(candles)
+    for name in ('sma-9', 'ema-21'):
+        assert trader.values[name] == pytest.approx(compute_indicator(data, name)[name][-1], rel=1e-9)
+
+
+def test_warm_up_lets_the_first_event_trade():
+    candles = random_walk(400, GRANULARITY)
+    exchange = Exchange(client=LocalClient({('ETH-BTC', GRANULARITY): candles[:300]}))
+    orders = create_orders(FlakyExchange(0, ''))
+    trader = create_trader(orders, buy='current-price > 0 || sma(9) > 0', sell='current-price < 0')
+
+    trader.warm_up(exchange, now=int(candles[300, 0]))
+    trader.run(candle_events(candles[300:301]), wait_for_fills=True)
+    orders.close()
+
+    assert trader.amount_base > 0 and not numpy.isnan(trader.values['sma-9'])
+
+
+def test_rate_limited_orders_are_retried():
+    exchange = FlakyExchange(2, 'Private rate limit exceeded')
+    orders = create_orders(exchange)
+
+    fill = orders.submit('buy', 'ETH-BTC', 1.5).result()
+    orders.close()
+
+    assert fill['size'] == 1.5 and exchange.placed == 3
+
+
+@pytest.mark.parametrize('failures,message', [(None, 'Private rate limit exceeded'), (1, 'Insufficient funds')])
+def test_failed_orders_are_not_placed_again(failures, message):
+    exchange = FlakyExchange(failures, message)
+    orders = create_orders(exchange)
+
+    with pytest.raises(OrderError):
+        orders.submit('buy', 'ETH-BTC', 1.0).result()
+    orders.close()
+
+    # Only rate limited orders are retried, up to the retry limit
+    assert exchange.placed == (orders.max_retries + 1 if failures is None else 1)
+
+
+def test_trader_backs_off_and_halts_after_failed_orders():
+    candles = random_walk(10, GRANULARITY)
+    orders = create_orders(FlakyExchange(None, 'Insufficient funds'))
+    trader = create_trader(orders, buy='current-price > 0', sell='current-price < 0')
+
+    # Every candle has several trades, but failed orders are only placed again on the next candle
+    events = [MarketEvent(start + offset, close) for start, close in candles[:, [0, 4]].tolist() for offset in range(3)]
+    report = trader.run(events, wait_for_fills=True)
+    orders.close()
+
+    assert [failure['candle'] for failure in report['failed_orders']] == candles[:3, 0].astype(int).tolist()
+    assert report['halted'] and trader.amount_base == 0 and trader.reserve == 1.0
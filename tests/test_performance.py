@@ -0,0 +1,46 @@
+"""
+Performance summaries stay finite when the capital is zero or the equity is wiped out
+"""
+
+import math
+
+import numpy
+import pytest
+
+import performance
+from ledger import TradeLedger
+
+
+def ledger_of(positions):
+    ledger = TradeLedger('ETH-BTC')
+    for entry, entry_price, spent, exit_index, exit_price in positions:
+        ledger.open(entry, entry_price, spent)
+        if exit_index is not None:
+            ledger.close(exit_index, exit_price)
+
+    return ledger
+
+
+def summarize(equity, ledger, capital):
+    # Any division by zero fails the test rather than only warning
+    with numpy.errstate(all='raise'):
+        summary = performance.summarize(numpy.asarray(equity, dtype=float), ledger, capital, trading_fee=0.003,
+                                        granularity=60)
+
+    assert all(math.isfinite(value) for value in summary.values())
+    return summary
+
+
+def test_zero_capital():
+    summary = summarize([0.0] * 5, ledger_of([]), 0.0)
+
+    assert summary['return'] == 0 and summary['fee_drag'] == 0 and summary['max_drawdown'] == 0
+
+
+def test_equity_wiped_out():
+    close = numpy.array([1.0, 1.0, 0.0, 0.0, 2.0])
+    ledger = ledger_of([(0, 1.0, 1.0, 3, 0.0), (4, 2.0, 0.0, None, None)])
+
+    summary = summarize(performance.equity_curve(close, ledger, 1.0), ledger, 1.0)
+
+    assert summary['return'] == pytest.approx(-1) and summary['max_drawdown'] == pytest.approx(1)
@@ -0,0 +1,84 @@
+"""
+Replays fill stop losses within a candle, group trades into candles across chunks, and otherwise trade exactly like
+`Chart.run_backtest`
+"""
+
+import numpy
+import pytest
+
+from analysis import convert_to_dataframe
+from chart import Chart
+from ledger import TradeLedger
+from replay import ReplaySimulator, read_candles, replay_backtest
+from strategy_parser import parse_strategy
+
+from conftest import random_walk
+
+
+BUY = parse_strategy('current-price > sma(9) && sma(9) > sma(30)')
+SELL = parse_strategy('current-price < sma(9)')
+
+
+def simulate(candles, buy, sell, **kwargs):
+    candles = numpy.array([[60 * row, *prices] for row, prices in enumerate(candles)], dtype=float)
+    simulator = ReplaySimulator('ETH-BTC', 1.0, **kwargs)
+    simulator.feed(candles, numpy.array(buy), numpy.array(sell))
+
+    return simulator.report()
+
+
+@pytest.mark.parametrize('opening,low,price', [
+    # The low crosses the stop within the candle, so it fills at the stop rather than at the close
+    (99.0, 85.0, 90.0),
+    # The candle gaps down through the stop, so it fills at the open
+    (80.0, 78.0, 80.0),
+])
+def test_stop_losses_fill_within_the_candle(opening, low, price):
+    # Rows are [low, high, open, close, volume]
+    report = simulate([[99.0, 101.0, 100.0, 100.0, 1.0], [low, 101.0, opening, 98.0, 1.0],
+                       [97.0, 99.0, 98.0, 98.0, 1.0]], buy=[True, False, False], sell=[False, False, True],
+                      stop_loss=0.1)
+    positions = report['positions']
+
+    assert positions['exit_price'] == [price] and positions['exit_time'] == [60]
+    assert positions['exit_reason'] == [TradeLedger.EXIT_REASONS[TradeLedger.STOP_LOSS]]
+    assert report['value'] == pytest.approx(price / 100)
+
+
+def test_stops_not_reached_leave_the_sell_signal():
+    report = simulate([[99.0, 101.0, 100.0, 100.0, 1.0], [91.0, 101.0, 99.0, 98.0, 1.0],
+                       [97.0, 99.0, 98.0, 98.0, 1.0]], buy=[True, False, False], sell=[False, False, True],
+                      stop_loss=0.1)
+
+    assert report['positions']['exit_price'] == [98.0] and report['value'] == pytest.approx(0.98)
+
+
+def test_trades_are_grouped_into_candles_across_chunks(tmp_path):
+    # Rows are [time, price, size], with several trades per minute
+    trades = numpy.array([[0, 10, 1], [20, 12, 2], [59, 11, 1], [60, 11, 3], [90, 9, 1], [150, 13, 2], [170, 14, 1],
+                          [179, 12, 1], [240, 15, 4]], dtype=float)
+    path = str(tmp_path / 'trades.csv')
+    numpy.savetxt(path, trades, delimiter=',')
+
+    candles = numpy.concatenate(list(read_candles(path, granularity=60, chunk_size=2)))
+
+    numpy.testing.assert_array_equal(candles, [[0, 10, 12, 10, 11, 4], [60, 9, 11, 11, 9, 4],
+                                               [120, 12, 14, 13, 12, 4], [240, 15, 15, 15, 15, 4]])
+
+
+def test_replay_matches_run_backtest(tmp_path):
+    candles = random_walk(3000, seed=7)
+    path = str(tmp_path / 'candles.npy')
+    numpy.save(path, candles)
+
+    # Chunks are far smaller than the warm-up of the indicators, so their history is carried over several chunks
+    report = replay_backtest(path, 'ETH-BTC', 1.0, BUY, SELL, trading_fee=0.003, stop_loss=0.5, chunk_size=17)
+
+    chart = Chart('ETH-BTC', convert_to_dataframe(candles), ['sma-9', 'sma-30'], granularity=60)
+    chart.run_backtest(1.0, BUY, SELL, trading_fee=0.003, stop_loss=0.5)
+    expected = chart.position_report()
+
+    assert report['candles'] == len(candles) and report['positions']['summary']['positions'] > 10
+    for column in ('entry_time', 'entry_price', 'exit_time', 'exit_price', 'amount', 'exit_reason'):
+        assert report['positions'][column] == pytest.approx(expected[column], rel=1e-12)
+    assert report['value'] == pytest.approx(1.0 + chart.performance_report()['profit'], rel=1e-12)
@@ -0,0 +1,70 @@
+"""
+Coarse candles resampled from a base series, whether at once or as the base series grows, must have the same OHLCV as
+aggregating the base candles of each coarse candle directly
+"""
+
+import numpy
+import pandas
+import pytest
+
+from exchange import Exchange
+from local_client import LocalClient
+from resample import ResampledSeries, resample_candles
+from store import CandleStore
+
+from conftest import random_walk
+
+
+# Starts partway through an hour, so the first coarse candles are partial too
+START = 1500000000 + 17 * 60
+
+
+def aggregate(candles, granularity):
+    frame = pandas.DataFrame(candles[:, 1:], columns=['low', 'high', 'open', 'close', 'volume'],
+                             index=pandas.to_datetime(candles[:, 0], unit='s'))
+    coarse = frame.resample('{}s'.format(granularity), origin='epoch').agg(
+        {'low': 'min', 'high': 'max', 'open': 'first', 'close': 'last', 'volume': 'sum'}).dropna()
+
+    times = coarse.index.to_numpy(dtype='datetime64[s]').astype(numpy.int64)
+    return numpy.column_stack([times, coarse.to_numpy()])
+
+
+def base_candles(size=1000):
+    candles = random_walk(size, 60, start=START)
+
+    # The exchange skips candles without trades, so the base series has gaps
+    return numpy.delete(candles, [5, 6, 7, 300, 301, 640], axis=0)
+
+
+@pytest.mark.parametrize('granularity', [300, 3600])
+def test_resampling_matches_direct_aggregation(granularity):
+    candles = base_candles()
+
+    numpy.testing.assert_allclose(resample_candles(candles, granularity), aggregate(candles, granularity), rtol=1e-12)
+
+
+@pytest.mark.parametrize('granularity', [300, 3600])
+def test_extending_matches_resampling_from_scratch(granularity):
+    candles = base_candles()
+    base_start = START - START % granularity
+    series = ResampledSeries(granularity, base_start)
+
+    # Each batch of base candles ends partway through a coarse candle, which the next batch completes
+    for end in (1, 2, 61, 62, 130, 500, 501, 777, len(candles)):
+        extended = series.extend(candles[:end], base_start)
+        numpy.testing.assert_allclose(extended, aggregate(candles[:end], granularity), rtol=1e-12)
+
+
+def test_exchange_resamples_the_stored_base_series(tmp_path):
+    candles = random_walk(900, 60, start=START)
+    exchange = Exchange(client=LocalClient({('ETH-BTC', 60): candles}), store=CandleStore(str(tmp_path)),
+                        base_granularity=60)
+
+    start, end = START - START % 300 + 300, START + 900 * 60
+    data = exchange.get_historical_data('ETH-BTC', 300, start=start, end=end)
+
+    expected = aggregate(candles, 300)
+    expected = expected[(expected[:, 0] >= start) & (expected[:, 0] < end)]
+    assert (data.index.to_numpy(dtype='datetime64[s]').astype(numpy.int64) == expected[:, 0]).all()
+    numpy.testing.assert_allclose(data[['low', 'high', 'open', 'close', 'volume']].to_numpy(), expected[:, 1:],
+                                  rtol=1e-12)
@@ -0,0 +1,151 @@
+"""
+Concurrent lookups of the same result share one computation, without sharing the failures of the caller running it
+"""
+
+import threading
+import time
+
+import pytest
+
+import cache
+from cache import ResultCache
+from jobs import Job, JobCancelled, JobManager
+
+
+@pytest.fixture
+def results(monkeypatch):
+    monkeypatch.setattr(cache, 'WAITER_PROGRESS_INTERVAL', 0.01)
+    return ResultCache(max_bytes=1024 * 1024, sizeof=lambda value: 1)
+
+
+def slow_computation(calls, steps=20, delay=0.01):
+    def compute(report_progress):
+        calls.append(threading.current_thread().name)
+        for step in range(steps):
+            report_progress(step, steps)
+            time.sleep(delay)
+        return 'result'
+
+    return compute
+
+
+def test_concurrent_lookups_share_one_computation(results):
+    calls = []
+    values = []
+
+    threads = [threading.Thread(target=lambda: values.append(results.get_or_compute('key', slow_computation(calls))))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert values == ['result'] * 5
+    assert len(calls) == 1
+
+
+def test_waiters_receive_progress(results):
+    owner = threading.Thread(target=results.get_or_compute, args=('key', slow_computation([])))
+    owner.start()
+    time.sleep(0.02)
+
+    reported = []
+    assert results.get_or_compute('key', slow_computation([]), progress=lambda *p: reported.append(p)) == 'result'
+    owner.join()
+
+    assert reported and all(total == 20 for _, total in reported)
+
+
+def test_cancelled_owner_does_not_fail_waiters(results):
+    cancel = threading.Event()
+    calls = []
+
+    def owner_progress(processed, total):
+        if cancel.is_set():
+            raise JobCancelled()
+
+    errors = []
+
+    def run_owner():
+        try:
+            results.get_or_compute('key', slow_computation(calls), progress=owner_progress)
+        except JobCancelled as e:
+            errors.append(e)
+
+    owner = threading.Thread(target=run_owner)
+    owner.start()
+    time.sleep(0.02)
+
+    values = []
+    waiter = threading.Thread(target=lambda: values.append(results.get_or_compute('key', slow_computation(calls))))
+    waiter.start()
+    time.sleep(0.02)
+
+    cancel.set()
+    owner.join()
+    waiter.join()
+
+    # The waiter ran the computation again rather than failing with the owner's cancellation
+    assert len(errors) == 1
+    assert values == ['result']
+    assert len(calls) == 2
+
+
+def test_cancelled_waiter_does_not_stop_the_owner(results):
+    cancel = threading.Event()
+
+    def waiter_progress(processed, total):
+        if cancel.is_set():
+            raise JobCancelled()
+
+    values = []
+    owner = threading.Thread(target=lambda: values.append(results.get_or_compute('key', slow_computation([]))))
+    owner.start()
+    time.sleep(0.02)
+
+    cancel.set()
+    with pytest.raises(JobCancelled):
+        results.get_or_compute('key', slow_computation([]), progress=waiter_progress)
+
+    owner.join()
+    assert values == ['result']
+
+
+def test_failures_of_the_computation_are_shared(results):
+    def fail(report_progress):
+        time.sleep(0.05)
+        raise ValueError('exchange error')
+
+    errors = []
+
+    def lookup():
+        try:
+            results.get_or_compute('key', fail)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=lookup) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == ['exchange error'] * 3
+
+
+def test_cancelling_one_of_two_identical_jobs(results):
+    jobs = JobManager(max_workers=2)
+
+    def task(progress):
+        return results.get_or_compute('key', slow_computation([], steps=50), progress=progress)
+
+    first = jobs.submit(task)
+    second = jobs.submit(task)
+    time.sleep(0.05)
+
+    jobs.cancel(first.id)
+    first.future.result()
+    second.future.result()
+
+    assert first.status == Job.CANCELLED
+    assert second.status == Job.DONE and second.result == 'result'
@@ -0,0 +1,78 @@
+"""
+The candle store only asks the exchange for what it has not stored yet, and extends a series without rewriting it
+"""
+
+import os
+
+import numpy
+
+import store as candle_store
+from exchange import Exchange
+from local_client import LocalClient
+from store import CandleStore
+from util import iso_to_epoch
+
+from conftest import random_walk
+
+
+GRANULARITY = 60
+START = 1500000000
+
+
+def requested_ranges(client, since=0):
+    return [(iso_to_epoch(start), iso_to_epoch(end)) for _, start, end, _ in client.requests[since:]]
+
+
+def test_overlapping_windows_only_fetch_missing_ranges(tmp_path):
+    candles = random_walk(900, GRANULARITY, start=START)
+    client = LocalClient({('ETH-BTC', GRANULARITY): candles})
+    exchange = Exchange(client=client, store=CandleStore(str(tmp_path)))
+
+    first_end = START + 450 * GRANULARITY
+    exchange.get_historical_data('ETH-BTC', GRANULARITY, start=START + 150 * GRANULARITY, end=first_end)
+    fetched = len(client.requests)
+
+    data = exchange.get_historical_data('ETH-BTC', GRANULARITY, start=START, end=START + 750 * GRANULARITY)
+
+    # Only the ranges before and after the first window are requested again
+    ranges = requested_ranges(client, fetched)
+    assert ranges and all(end <= START + 150 * GRANULARITY or start >= first_end for start, end in ranges)
+
+    full = Exchange(client=LocalClient({('ETH-BTC', GRANULARITY): candles})).get_historical_data(
+        'ETH-BTC', GRANULARITY, start=START, end=START + 750 * GRANULARITY)
+    assert data.equals(full) and len(data) == 750
+
+    # Everything is stored now
+    exchange.get_historical_data('ETH-BTC', GRANULARITY, start=START + 100 * GRANULARITY, end=START + 700 * GRANULARITY)
+    assert len(client.requests) == fetched + len(ranges)
+
+
+def test_new_candles_are_appended_without_rewriting(tmp_path, monkeypatch):
+    candles = random_walk(100, GRANULARITY, start=START)
+    store = CandleStore(str(tmp_path))
+
+    # The first candles outgrow the tail, so they are compacted into the series
+    monkeypatch.setattr(candle_store, 'MAX_TAIL_CANDLES', 50)
+    store.merge('ETH-BTC', GRANULARITY, candles[:60], START, START + 60 * GRANULARITY)
+
+    path = os.path.join(str(tmp_path), 'ETH-BTC_{}.npy'.format(GRANULARITY))
+    written = os.stat(path).st_mtime_ns
+
+    # The last candle was still forming, so its fresh version replaces it
+    forming = candles[59].copy()
+    forming[4] += 1
+    store.merge('ETH-BTC', GRANULARITY, [forming], START, START)
+    store.merge('ETH-BTC', GRANULARITY, candles[59:80], START, START + 80 * GRANULARITY)
+    store.merge('ETH-BTC', GRANULARITY, candles[79:90], START, START + 90 * GRANULARITY)
+
+    assert os.stat(path).st_mtime_ns == written
+    numpy.testing.assert_array_equal(store.load('ETH-BTC', GRANULARITY), candles[:90])
+
+    # Backfills preceding the end of the series are merged in by rewriting it
+    store.merge('ETH-BTC', GRANULARITY, candles[90:], START, START + 100 * GRANULARITY)
+    expected = candles.copy()
+    expected[10:20, 1:] += 1
+    store.merge('ETH-BTC', GRANULARITY, expected[10:20], START, START + 20 * GRANULARITY)
+    numpy.testing.assert_array_equal(store.load('ETH-BTC', GRANULARITY), expected)
+    numpy.testing.assert_array_equal(store.load('ETH-BTC', GRANULARITY, START + 85 * GRANULARITY,
+                                                START + 95 * GRANULARITY), expected[85:95])
@@ -0,0 +1,85 @@
+"""
+Strategy text must parse to the same expressions as the dashboard's parser, and invalid strategies must be rejected
+with the position of the error, before any data is fetched
+"""
+
+import json
+
+import pytest
+
+from strategy_parser import StrategySyntaxError, optimize, parse_strategy, validate_strategy
+
+
+PRICE = {'kind': 'currentprice'}
+
+# The examples of the README
+EXAMPLES = {
+    'current-price > sma(9)': {'kind': 'GT', 'l': PRICE, 'r': {'kind': 'sma', 'period': 9}},
+    'sma(15) < sma(9)': {'kind': 'LT', 'l': {'kind': 'sma', 'period': 15}, 'r': {'kind': 'sma', 'period': 9}},
+    'rsi(14) <= 30 && current-price > ema(15)': {
+        'kind': 'And', 'e1': {'kind': 'LEq', 'l': {'kind': 'rsi', 'period': 14}, 'r': {'kind': 'real', 'val': '30'}},
+        'e2': {'kind': 'GT', 'l': PRICE, 'r': {'kind': 'ema', 'period': 15}}},
+    '!(current-price < 1000 || sma(15) < sma(9))': {'kind': 'Not', 'e': {
+        'kind': 'Or', 'e1': {'kind': 'LT', 'l': PRICE, 'r': {'kind': 'real', 'val': '1000'}},
+        'e2': {'kind': 'LT', 'l': {'kind': 'sma', 'period': 15}, 'r': {'kind': 'sma', 'period': 9}}}},
+    'current-price > sma(50, 1h)': {'kind': 'GT', 'l': PRICE, 'r': {'kind': 'sma', 'period': 50, 'timeframe': '1h'}},
+    'sma(9) != 3': {'kind': 'Not', 'e': {'kind': 'Eq', 'l': {'kind': 'sma', 'period': 9},
+                                         'r': {'kind': 'real', 'val': '3'}}},
+}
+
+
+@pytest.mark.parametrize('text', list(EXAMPLES))
+def test_readme_examples(text):
+    parsed = parse_strategy(text)
+
+    assert parsed == EXAMPLES[text]
+
+    # Posting the parsed expression as JSON, as the dashboard does, gives the same strategy
+    assert optimize(validate_strategy(json.loads(json.dumps(parsed)))) == parsed
+
+
+@pytest.mark.parametrize('text,message,position', [
+    ('current-price >', 'Expected an indicator', 15),
+    ('current-price > sma(9', "Expected '\\)'", 21),
+    ('current-price $ 3', "Unexpected '\\$'", 14),
+    ('current-price > sma(9) junk', "Unexpected 'j'", 23),
+    ('current-price > sma(9, 2x)', "Unexpected 'x'", 24),
+    ('sma(9)', 'Expected a comparison', 6),
+    ('sma(1) > 3', 'at least 2', None),
+])
+def test_syntax_errors(text, message, position):
+    with pytest.raises(StrategySyntaxError, match=message) as error:
+        parse_strategy(text)
+
+    assert error.value.position == position
+
+
+@pytest.mark.parametrize('strategy,message', [
+    ({'kind': 'GT', 'l': PRICE, 'r': {'kind': 'macd', 'period': 9}}, 'Unsupported indicator: macd-9'),
+    ({'kind': 'GT', 'l': PRICE, 'r': {'kind': 'bollinger', 'period': 21}}, 'Unsupported indicator'),
+    ({'kind': 'GT', 'l': PRICE, 'r': {'kind': 'sma', 'period': 9, 'timeframe': '1y'}}, 'Invalid timeframe'),
+    ({'kind': 'GT', 'l': PRICE, 'r': {'kind': 'real', 'val': 'high'}}, 'Invalid number'),
+    ({'kind': 'GT', 'l': PRICE}, 'two operands'),
+    ({'kind': 'Xor', 'e1': {}, 'e2': {}}, 'Unknown expression kind: Xor'),
+    ({'kind': 'And', 'e1': {}, 'e2': []}, 'must be an object'),
+])
+def test_invalid_expressions(strategy, message):
+    with pytest.raises(StrategySyntaxError, match=message):
+        validate_strategy(strategy)
+
+
+@pytest.mark.parametrize('buy_strategy', ['current-price > sma(', '{"kind": "GT"', {'kind': 'Xor'}])
+def test_backtests_reject_invalid_strategies(buy_strategy):
+    from server import Server
+
+    class Exchange(object):
+        def get_historical_data(self, *args, **kwargs):
+            raise AssertionError('No data should be fetched for an invalid strategy')
+
+    server = Server(Exchange())
+    response = server.app.test_client().post(
+        '/backtest?pair=ETH/BTC&period=1m&startTime=1500000000&capital=1&stopLoss=0',
+        json={'buyStrategy': buy_strategy, 'sellStrategy': 'current-price < sma(9)'}).get_json()
+    server.jobs.shutdown()
+
+    assert response['response'] == 400 and response['result']['message']
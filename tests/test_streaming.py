@@ -0,0 +1,79 @@
+"""
+Streaming indicators must match the batch TA-Lib output, and resume from a checkpoint as if never interrupted
+"""
+
+import json
+
+import numpy
+import pytest
+
+from analysis import compute_indicator, convert_to_dataframe, warmup_period
+from store import CandleStore
+from streaming import create_streaming_indicator, restore_streaming_indicator, resume_from_store
+
+from conftest import random_walk
+
+
+INDICATORS = ['sma-9', 'ema-21', 'rsi-14', 'bollinger-21-2']
+
+
+def stream(indicator, candles):
+    values = []
+    for time, close in candles[:, [0, 4]].tolist():
+        indicator.update(close, time)
+        values.append(indicator.values())
+
+    return {column: numpy.array([value[column] for value in values]) for column in values[0]}
+
+
+def checkpoint(indicator):
+    # Checkpoints are stored as JSON, so they must survive a round trip through it
+    return restore_streaming_indicator(json.loads(json.dumps(indicator.state())))
+
+
+@pytest.mark.parametrize('name', INDICATORS)
+def test_streaming_matches_batch(name):
+    candles = random_walk(1000)
+    batch = compute_indicator(convert_to_dataframe(candles), name)
+    streamed = stream(create_streaming_indicator(name), candles)
+    warmup = warmup_period(name, exact=False)
+
+    # Bollinger bands produce all three bands
+    assert streamed.keys() == batch.keys()
+
+    for column, values in batch.items():
+        assert numpy.isnan(streamed[column][:warmup]).all()
+        numpy.testing.assert_allclose(streamed[column][warmup:], values[warmup:], rtol=1e-9)
+
+
+@pytest.mark.parametrize('name', INDICATORS)
+def test_checkpoint_resumes_uninterrupted(name):
+    candles = random_walk(500)
+    uninterrupted = create_streaming_indicator(name)
+    stream(uninterrupted, candles)
+
+    indicator = create_streaming_indicator(name)
+    stream(indicator, candles[:300])
+    resumed = checkpoint(indicator)
+    stream(resumed, candles[300:])
+
+    assert resumed.values() == pytest.approx(uninterrupted.values(), rel=1e-12)
+    assert resumed.count == uninterrupted.count and resumed.last_time == candles[-1, 0]
+
+
+@pytest.mark.parametrize('name', INDICATORS)
+def test_resume_from_store(name, tmp_path):
+    candles = random_walk(500)
+    store = CandleStore(str(tmp_path))
+    store.merge('ETH-BTC', 60, candles, int(candles[0, 0]), int(candles[-1, 0]) + 60)
+
+    uninterrupted = create_streaming_indicator(name)
+    stream(uninterrupted, candles)
+
+    # The checkpoint was taken partway through the stored candles, which it picks up after
+    indicator = create_streaming_indicator(name)
+    stream(indicator, candles[:300])
+    resumed = resume_from_store(checkpoint(indicator), store, 'ETH-BTC', 60)
+
+    assert resumed.values() == pytest.approx(uninterrupted.values(), rel=1e-12)
+    assert resumed.count == len(candles) and resumed.last_time == candles[-1, 0]
@@ -0,0 +1,92 @@
+"""
+A parameter sweep must rank the same results as backtesting each of its combinations on a chart of its own
+"""
+
+import pytest
+
+from analysis import convert_to_dataframe
+from chart import Chart
+from decision import compile_strategy
+from sweep import run_sweep, substitute, validate_templates
+
+from conftest import random_walk
+
+
+BUY_TEMPLATE = {'kind': 'GT', 'l': {'kind': 'currentprice'}, 'r': {'kind': 'sma', 'period': '$fast'}}
+SELL_TEMPLATE = {'kind': 'LT', 'l': {'kind': 'sma', 'period': '$fast'}, 'r': {'kind': 'ema', 'period': '$slow'}}
+PARAMETERS = {'fast': [5, 9], 'slow': [21, 30]}
+
+
+def chart_report(candles, combination):
+    buy_strategy = substitute(BUY_TEMPLATE, combination['params'])
+    sell_strategy = substitute(SELL_TEMPLATE, combination['params'])
+    indicators = sorted(compile_strategy(buy_strategy).indicators | compile_strategy(sell_strategy).indicators)
+
+    chart = Chart('ETH-BTC', convert_to_dataframe(candles), indicators, granularity=60)
+    chart.run_backtest(1.0, buy_strategy, sell_strategy, trading_fee=combination['trading_fee'],
+                       stop_loss=combination['stop_loss'])
+
+    return chart.performance_report()
+
+
+def test_results_match_charts():
+    candles = random_walk(2000, seed=3)
+    progress = []
+
+    results = run_sweep('ETH-BTC', 60, candles, 1.0, BUY_TEMPLATE, SELL_TEMPLATE, PARAMETERS,
+                        stop_losses=[0, 0.003], trading_fees=[0.003], max_workers=2,
+                        progress=lambda processed, total: progress.append((processed, total)))
+
+    assert len(results) == 8
+    assert progress[-1] == (8, 8)
+    assert [result['profit'] for result in results] == sorted((result['profit'] for result in results), reverse=True)
+
+    for result in results:
+        report = chart_report(candles, result)
+        assert {name: result[name] for name in report} == pytest.approx(report, rel=1e-9, abs=1e-12)
+
+
+def test_progress_can_abort():
+    class Abort(Exception):
+        pass
+
+    def progress(processed, total):
+        raise Abort()
+
+    with pytest.raises(Abort):
+        run_sweep('ETH-BTC', 60, random_walk(500), 1.0, BUY_TEMPLATE, SELL_TEMPLATE, PARAMETERS, max_workers=2,
+                  progress=progress)
+
+
+@pytest.mark.parametrize('buy_template,parameters,message', [
+    (BUY_TEMPLATE, {'fast': [5, 9]}, r'\$slow'),
+    (BUY_TEMPLATE, {'fast': [5, 9], 'slow': []}, r'\$slow'),
+    (BUY_TEMPLATE, {'fast': [5, 1], 'slow': [21]}, 'at least 2'),
+    ({'kind': 'GT', 'l': {'kind': 'currentprice'}, 'r': {'kind': 'macd', 'period': '$fast'}}, PARAMETERS,
+     'Unsupported indicator'),
+    ({'kind': 'Xor'}, PARAMETERS, 'Unknown expression kind'),
+])
+def test_invalid_templates_are_rejected(buy_template, parameters, message):
+    with pytest.raises(ValueError, match=message):
+        validate_templates(buy_template, SELL_TEMPLATE, parameters)
+
+
+def test_invalid_sweeps_are_rejected_before_fetching():
+    from server import Server
+
+    class Exchange(object):
+        fetched = 0
+
+        def get_historical_data(self, *args, **kwargs):
+            self.fetched += 1
+            return convert_to_dataframe(random_walk(500))
+
+    exchange = Exchange()
+    server = Server(exchange)
+
+    response = server.app.test_client().post('/sweep', json={
+        'pair': 'ETH/BTC', 'period': '1m', 'capital': 1, 'buyStrategy': BUY_TEMPLATE, 'sellStrategy': SELL_TEMPLATE,
+        'parameters': {'fast': [5, 9]}}).get_json()
+    server.jobs.shutdown()
+
+    assert response['response'] == 400 and '$slow' in response['result']['message'] and exchange.fetched == 0
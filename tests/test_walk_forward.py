@@ -0,0 +1,56 @@
+"""
+Every window of a walk-forward analysis must perform exactly like a backtest of a chart windowed to it
+"""
+
+import pytest
+
+from analysis import convert_to_dataframe
+from chart import Chart
+from strategy_parser import parse_strategy
+
+from conftest import random_walk
+
+
+# Simple moving averages need no more history than their period, so a windowed chart has the same values
+INDICATORS = ['sma-9', 'sma-30']
+BUY = parse_strategy('current-price > sma(9) && sma(9) > sma(30)')
+SELL = parse_strategy('current-price < sma(9)')
+
+
+def windowed_report(data, start, end, **kwargs):
+    start_time = int(data.index[start].timestamp())
+    chart = Chart('ETH-BTC', data.iloc[:end], INDICATORS, granularity=60, start_time=start_time)
+    chart.run_backtest(1.0, BUY, SELL, **kwargs)
+
+    return {'start': start_time, 'end': int(data.index[end - 1].timestamp()), **chart.performance_report()}
+
+
+@pytest.mark.parametrize('anchored', [False, True])
+def test_windows_match_windowed_charts(anchored):
+    data = convert_to_dataframe(random_walk(1200, seed=5))
+    chart = Chart('ETH-BTC', data, INDICATORS, granularity=60)
+    progress = []
+
+    windows = chart.walk_forward(1.0, BUY, SELL, train_size=300, test_size=100, anchored=anchored, trading_fee=0.003,
+                                 stop_loss=0.002, max_workers=2,
+                                 progress=lambda processed, total: progress.append((processed, total)))
+
+    assert [window['index'] for window in windows] == list(range(len(windows))) and len(windows) == 8
+    assert progress[-1] == (8, 8)
+
+    # The slow moving average is first defined at the 30th candle
+    for window in windows:
+        start = 29 + 100 * window['index']
+        train_start = 29 if anchored else start
+
+        assert window['train'] == pytest.approx(windowed_report(data, train_start, start + 300, trading_fee=0.003,
+                                                                stop_loss=0.002))
+        assert window['test'] == pytest.approx(windowed_report(data, start + 300, start + 400, trading_fee=0.003,
+                                                               stop_loss=0.002))
+
+
+def test_missing_indicators_are_reported():
+    chart = Chart('ETH-BTC', convert_to_dataframe(random_walk(500)), ['sma-9'], granularity=60)
+
+    with pytest.raises(ValueError, match='sma-30'):
+        chart.walk_forward(1.0, BUY, SELL, train_size=100, test_size=50, max_workers=1)
@@ -61,7 +61,7 @@ export class Dashboard extends React.Component<DashboardProps, DashboardState> {
      */
 	getBacktestingData(payload: BacktestPayload) {
 	    const URL = `${window.location.origin}/backtest?pair=${payload.coinPair}&period=${payload.timeUnit}` +
-            `&capital=${payload.capital}&stopLoss=${payload.stopLoss}&startTime=${payload.startTime}`;
+            `&capital=${payload.capital}&stopLoss=${payload.stopLoss}&startTime=${payload.startTime}&format=columns`;
 	    const jsonBody = {indicators: payload.indicators, buyStrategy: payload.buyStrategy, sellStrategy: payload.sellStrategy};
 
         POSTRequest(URL, jsonBody).then(resp => {
@@ -86,15 +86,20 @@ export class Dashboard extends React.Component<DashboardProps, DashboardState> {
     }
 
     /**
-     * Maps the backtesting JSON response into an array of BacktestData
+     * Maps the column-oriented backtesting JSON response into an array of BacktestData
      *
-     * @param {object} result: The response obtained from the backtesting API
+     * @param {object} result: The response obtained from the backtesting API, mapping each column to an array of values
      */
-    private mapBacktestResponse(result: object[]): BacktestData[] {
-        return result.map(datum =>  {
+    private mapBacktestResponse(result: {[column: string]: any[]}): BacktestData[] {
+        const columns = Object.keys(result);
+
+        return result['time'].map((time, i) => {
+            const datum = {};
+            columns.forEach(column => datum[column] = result[column][i]);
+
             return {...datum, buy: datum['buy'] ? datum['close'] : null,
                               sell: datum['sell'] ? datum['close'] : null,
-                              time: datum['time'] * 1000} as BacktestData
+                              time: time * 1000} as BacktestData
         }).sort((a, b) => a.time < b.time ? -1 : 1);
     }
 